@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Runs sensor acquisition in its own process, controlled over a pipe.
+
+The web process serves HTTP and only reads the logs; the acquisition process
+owns the serial port, the log writer and the Mavlink2Rest client. Routes that
+need acquisition state (serial port, sampling settings, writer counters...)
+go through call(), which runs a named handler on the acquisition side and
+returns its result.
+"""
+import logging
+import multiprocessing
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AcquisitionUnavailable(RuntimeError):
+    """The acquisition process is not running or did not answer in time."""
+
+
+def serve_control(conn, handlers):
+    """Answer control calls from the web process until it goes away.
+
+    Runs in the acquisition process. Each request is (request_id, name, args)
+    and is answered with (request_id, ok, result_or_error).
+    """
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        request_id, name, args = message
+        try:
+            reply = (request_id, True, handlers[name](*args))
+        except Exception as e:
+            logger.exception("Control call %s failed", name)
+            reply = (request_id, False, f"{type(e).__name__}: {e}")
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            return
+
+
+class LocalAcquisition:
+    """Acquisition in the web process itself (development server)."""
+
+    def __init__(self, handlers, start):
+        self.handlers = handlers
+        self._start = start
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._start()
+
+    def call(self, name, *args, timeout=None):
+        return self.handlers[name](*args)
+
+    def stop(self):
+        pass
+
+    def stats(self):
+        return {"mode": "local", "running": self._started}
+
+
+class AcquisitionProcess:
+    """Child process running `target(conn)`, restarted if it dies.
+
+    The child is started with the "spawn" method, so it never inherits the
+    web server's threads or locks; `target` must be a module-level function.
+    """
+
+    def __init__(self, target, call_timeout=10.0, restart_delay=5.0):
+        self.target = target
+        self.call_timeout = call_timeout
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._stopping = False
+        self._supervisor = None
+        self.restarts = 0
+        self.calls = 0
+        self.call_failures = 0
+
+    def start(self):
+        self._spawn()
+        if self._supervisor is None:
+            self._supervisor = threading.Thread(target=self._supervise, name="acquisition-supervisor", daemon=True)
+            self._supervisor.start()
+
+    def call(self, name, *args, timeout=None):
+        """Run handler `name` in the acquisition process and return its result."""
+        timeout = self.call_timeout if timeout is None else timeout
+        with self._lock:
+            conn = self._conn
+            if conn is None or self._process is None or not self._process.is_alive():
+                self.call_failures += 1
+                raise AcquisitionUnavailable("acquisition process is not running")
+            self._next_id += 1
+            request_id = self._next_id
+            self.calls += 1
+            try:
+                conn.send((request_id, name, args))
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not conn.poll(remaining):
+                        self.call_failures += 1
+                        raise AcquisitionUnavailable(f"acquisition process did not answer '{name}' in {timeout} s")
+                    reply_id, ok, result = conn.recv()
+                    # Skip late answers to calls that already timed out
+                    if reply_id == request_id:
+                        break
+            except (EOFError, OSError) as e:
+                self.call_failures += 1
+                raise AcquisitionUnavailable(f"lost connection to acquisition process: {e}")
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def stop(self, timeout=15.0):
+        """Ask the acquisition process to flush its logs and exit."""
+        self._stopping = True
+        process = self._process
+        if process is None or not process.is_alive():
+            return
+        # SIGTERM makes the child exit normally, running its atexit hooks
+        process.terminate()
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning("Acquisition process did not stop in time, killing it")
+            process.kill()
+
+    def stats(self):
+        process = self._process
+        return {
+            "mode": "process",
+            "running": process is not None and process.is_alive(),
+            "pid": process.pid if process is not None else None,
+            "restarts": self.restarts,
+            "calls": self.calls,
+            "call_failures": self.call_failures,
+        }
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=self.target, args=(child_conn,), name="acquisition", daemon=True)
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._process = process
+            self._conn = parent_conn
+        logger.info("Started acquisition process (pid %s)", process.pid)
+
+    def _supervise(self):
+        while not self._stopping:
+            process = self._process
+            process.join(1.0)
+            if self._stopping or process.is_alive():
+                continue
+            logger.error("Acquisition process exited with code %s, restarting in %s s", process.exitcode, self.restart_delay)
+            time.sleep(self.restart_delay)
+            if self._stopping:
+                return
+            self.restarts += 1
+            self._spawn()
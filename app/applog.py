@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Logging setup: leveled, non-blocking and rate-limited.
+
+Records are handed to a bounded queue and written to stdout by a listener
+thread, so a slow log driver never blocks the sensor loop or a request; if
+the queue is full the record is dropped and counted. Per-sample diagnostics
+are logged at DEBUG, which is off unless enabled at runtime (set_debug()),
+and each DEBUG call site (or any call made with extra=RATE_LIMITED) logs at
+most once per DEBUG_MIN_INTERVAL seconds, reporting how many lines it held
+back.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s"
+LOG_LEVEL = os.environ.get("PME_LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10000
+DEBUG_MIN_INTERVAL = float(os.environ.get("PME_DEBUG_INTERVAL", 1.0))
+
+# Pass as extra= to rate-limit a non-DEBUG message logged from a hot path
+RATE_LIMITED = {"rate_limited": True}
+
+_handler = None
+_listener = None
+_base_level = logging.INFO
+
+
+class RateLimitFilter(logging.Filter):
+    """Let each call site through at most once per `interval` seconds.
+
+    Applies to DEBUG records and records flagged with RATE_LIMITED; the
+    next record let through notes how many were suppressed in between.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.suppressed = 0
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG and not getattr(record, "rate_limited", False):
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            last, held = self._sites.get(site, (0.0, 0))
+            if now - last < self.interval:
+                self._sites[site] = (last, held + 1)
+                self.suppressed += 1
+                return False
+            self._sites[site] = (now, 0)
+        if held:
+            record.msg = f"{record.msg} ({held} similar messages suppressed)"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Route all logging through the queue to stdout (once per process)."""
+    global _handler, _listener, _base_level
+    if _handler is not None:
+        return
+    _base_level = logging.getLevelName(level) if isinstance(level, str) else level
+    if not isinstance(_base_level, int):
+        _base_level = logging.INFO
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(RateLimitFilter(DEBUG_MIN_INTERVAL))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(_base_level)
+    # requests logs every connection at DEBUG; keep it out of the diagnostics
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+
+def set_debug(enabled):
+    """Turn DEBUG diagnostics on or off at runtime."""
+    logging.getLogger().setLevel(logging.DEBUG if enabled else _base_level)
+    return debug_enabled()
+
+
+def debug_enabled():
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
+def stats():
+    rate_limit = _handler.filters[0] if _handler is not None else None
+    return {
+        "level": logging.getLevelName(logging.getLogger().level),
+        "debug": debug_enabled(),
+        "queue_depth": _handler.queue.qsize() if _handler is not None else 0,
+        "queue_capacity": LOG_QUEUE_SIZE,
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "suppressed": rate_limit.suppressed if rate_limit is not None else 0,
+        "debug_min_interval_s": DEBUG_MIN_INTERVAL,
+    }
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""Fixed-width, append-only binary measurement log.
+
+File layout:
+    header  (16 bytes): magic b"PMEDOTLG", uint16 schema version,
+                        uint16 record size, 4 reserved bytes
+    records (N * record size): little-endian float64 epoch timestamp followed
+                        by float32 measurement fields and, from v3, the
+                        float64 monotonic capture time (see DTYPES for each
+                        schema version). Missing values are stored as NaN,
+                        except for fields in FIELD_DEFAULTS.
+
+Records are appended in capture order, so the timestamp column is sorted and a
+time window can be located with a binary search over a memory-mapped view of
+the file without copying or parsing anything. Files written with an older
+schema stay readable; conform() lifts their records to the current layout.
+Only files in the current schema are appended to.
+"""
+import csv
+import gzip
+import io
+import logging
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PMEDOTLG"
+SCHEMA_VERSION = 4
+HEADER = struct.Struct("<8sHH4x")
+
+# Record layout per schema version
+DTYPES = {
+    1: np.dtype([
+        ("time", "<f8"),
+        ("temperature", "<f4"),
+        ("do", "<f4"),
+        ("q", "<f4"),
+        ("vehicle_temperature", "<f4"),
+        ("latitude", "<f4"),
+        ("longitude", "<f4"),
+    ]),
+    # v2: age in seconds of the vehicle telemetry used to tag the sample
+    2: np.dtype([
+        ("time", "<f8"),
+        ("temperature", "<f4"),
+        ("do", "<f4"),
+        ("q", "<f4"),
+        ("vehicle_temperature", "<f4"),
+        ("latitude", "<f4"),
+        ("longitude", "<f4"),
+        ("gps_age", "<f4"),
+        ("vehicle_temperature_age", "<f4"),
+    ]),
+    # v3: capture time on the host's monotonic clock (seconds since boot),
+    # which wall-clock adjustments do not move
+    3: np.dtype([
+        ("time", "<f8"),
+        ("temperature", "<f4"),
+        ("do", "<f4"),
+        ("q", "<f4"),
+        ("vehicle_temperature", "<f4"),
+        ("latitude", "<f4"),
+        ("longitude", "<f4"),
+        ("gps_age", "<f4"),
+        ("vehicle_temperature_age", "<f4"),
+        ("monotonic", "<f8"),
+    ]),
+    # v4: which of the vehicle's sensors took the reading
+    4: np.dtype([
+        ("time", "<f8"),
+        ("temperature", "<f4"),
+        ("do", "<f4"),
+        ("q", "<f4"),
+        ("vehicle_temperature", "<f4"),
+        ("latitude", "<f4"),
+        ("longitude", "<f4"),
+        ("gps_age", "<f4"),
+        ("vehicle_temperature_age", "<f4"),
+        ("monotonic", "<f8"),
+        ("sensor_id", "<f4"),
+    ]),
+}
+DTYPE = DTYPES[SCHEMA_VERSION]
+
+# Values for fields a record or CSV row predates: there was only one
+# sensor before sensor_id was logged
+FIELD_DEFAULTS = {"sensor_id": 0.0}
+# Fields served as integers
+INTEGER_FIELDS = ("sensor_id",)
+
+# CSV column for each record field (the timestamp is exported as ISO text)
+CSV_FIELDS = [("timestamp", "time")] + [(name, name) for name in DTYPE.names[1:]]
+
+
+def _to_float(value):
+    """Convert a measurement value to a float, mapping None/'' to NaN."""
+    if value is None or value == '':
+        return float('nan')
+    return float(value)
+
+
+def _clean(value):
+    """Round a stored float32 back to its significant digits (NaN -> None)."""
+    if value != value:
+        return None
+    return float(f"{value:.7g}")
+
+
+def _clean_exact(value):
+    """Round a stored float64 time to microseconds (NaN -> None)."""
+    if value != value:
+        return None
+    return round(value, 6)
+
+
+def _clean_int(value):
+    if value != value:
+        return None
+    return int(value)
+
+
+def cleaner(dtype, name):
+    """The function turning values of a record field into JSON/CSV values."""
+    if name in INTEGER_FIELDS:
+        return _clean_int
+    return _clean_exact if dtype[name] == np.float64 else _clean
+
+
+def conform(records):
+    """Return records in the current schema, filling fields it lacks with NaN."""
+    if records.dtype == DTYPE:
+        return records
+    converted = np.full(len(records), np.nan, dtype=DTYPE)
+    for name in records.dtype.names:
+        if name in DTYPE.names:
+            converted[name] = records[name]
+    for name, value in FIELD_DEFAULTS.items():
+        if name not in records.dtype.names:
+            converted[name] = value
+    return converted
+
+
+def encode(measurement):
+    """Pack a measurement dict into a single record of the current schema."""
+    record = np.zeros(1, dtype=DTYPE)
+    record["time"] = datetime.fromisoformat(measurement["timestamp"]).timestamp()
+    for name in DTYPE.names[1:]:
+        value = measurement.get(name)
+        if (value is None or value == '') and name in FIELD_DEFAULTS:
+            value = FIELD_DEFAULTS[name]
+        record[name] = _to_float(value)
+    return record.tobytes()
+
+
+def to_rows(records):
+    """Convert a record array to measurement dicts as served by /api/data."""
+    names = records.dtype.names[1:]
+    columns = [records[name].astype(np.float64).tolist() for name in names]
+    cleaners = [cleaner(records.dtype, name) for name in names]
+    rows = []
+    for i, t in enumerate(records["time"].tolist()):
+        row = {"timestamp": datetime.fromtimestamp(t).isoformat()}
+        for name, column, clean in zip(names, columns, cleaners):
+            row[name] = clean(column[i])
+        rows.append(row)
+    return rows
+
+
+def record_column(records, key):
+    """One /api/data column of a record array as a JSON-ready list.
+
+    key "t" is the timestamp in epoch seconds (ms precision); any other key
+    is a field name.
+    """
+    if key == "t":
+        return np.round(records["time"], 3).tolist()
+    clean = cleaner(records.dtype, key)
+    return [clean(value) for value in records[key].astype(np.float64).tolist()]
+
+
+class BinaryLog:
+    """Append-only binary log file with zero-copy, memory-mapped range reads."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._mm = None
+        self._mm_key = None
+        self._fh = None
+        # Layout of the file on disk; older schema versions are read-only
+        self.dtype = DTYPE
+
+    def __len__(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return max(0, size - HEADER.size) // self.dtype.itemsize
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def create(self):
+        """Start a new, empty log containing only the header."""
+        with self._lock:
+            self._close()
+            with open(self.path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, SCHEMA_VERSION, DTYPE.itemsize))
+            self.dtype = DTYPE
+            self._mm = None
+            self._mm_key = None
+
+    def validate(self, repair=True):
+        """Check the header and drop any partially written trailing record.
+
+        Readers that do not own the file pass repair=False; a trailing partial
+        record is then simply not read. Returns False if the file is not a
+        binary log of a known schema.
+        """
+        with open(self.path, 'rb') as f:
+            raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            return False
+        magic, version, record_size = HEADER.unpack(raw)
+        if magic != MAGIC or version not in DTYPES or record_size != DTYPES[version].itemsize:
+            logger.warning("Binary log %s has unsupported header (version %s, record size %s)", self.path, version, record_size)
+            return False
+        self.dtype = DTYPES[version]
+
+        size = os.path.getsize(self.path)
+        excess = (size - HEADER.size) % self.dtype.itemsize
+        if excess and repair:
+            logger.warning("Truncating %d bytes of partial record from %s", excess, self.path)
+            with open(self.path, 'r+b') as f:
+                f.truncate(size - excess)
+        return True
+
+    def append_bytes(self, payload):
+        """Append already-encoded records to the log.
+
+        The append handle stays open between calls; data is flushed to the OS
+        so it is immediately visible to readers, but not fsynced (see sync()).
+        """
+        with self._lock:
+            if self._fh is None:
+                self._fh = open(self.path, 'ab')
+            self._fh.write(payload)
+            self._fh.flush()
+
+    def sync(self):
+        """Force appended records to stable storage."""
+        with self._lock:
+            if self._fh is not None:
+                os.fsync(self._fh.fileno())
+
+    def close(self):
+        """Close the append handle (e.g. before the file is renamed or removed)."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except OSError as e:
+                logger.error("Error closing binary log %s: %s", self.path, e)
+            self._fh = None
+
+    def records(self):
+        """Return every record as a read-only array backed by the file mapping."""
+        dtype = self.dtype
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=dtype)
+        stat = os.stat(self.path)
+        count = max(0, stat.st_size - HEADER.size) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+
+        with self._lock:
+            key = (stat.st_ino, stat.st_size)
+            if self._mm is None or self._mm_key != key:
+                # Remap when the file has grown or was replaced by another of
+                # the same size. Views handed out earlier keep the old mapping
+                # alive until they are released.
+                with open(self.path, 'rb') as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mm_key = key
+            mm = self._mm
+        return np.frombuffer(mm, dtype=dtype, count=count, offset=HEADER.size)
+
+    def window(self, since=None, until=None):
+        """Return the records with since < time <= until as a zero-copy slice."""
+        records = self.records()
+        times = records["time"]
+        start = 0 if since is None else int(np.searchsorted(times, since, side='right'))
+        end = len(records) if until is None else int(np.searchsorted(times, until, side='right'))
+        return records[start:end]
+
+    def import_csv(self, csv_path):
+        """Build the log from an existing (optionally gzipped) CSV file. Returns the number of rows imported.
+
+        The log is built under a temporary name of this process's own and
+        moved into place when complete, so other processes never map a
+        half-imported log.
+        """
+        target = BinaryLog(f"{self.path}.{os.getpid()}.tmp")
+        imported = target._import_csv(csv_path)
+        target.close()
+        with self._lock:
+            self._close()
+            os.replace(target.path, self.path)
+            self.dtype = DTYPE
+            self._mm = None
+            self._mm_key = None
+        logger.info("Imported %d rows from %s into %s", imported, csv_path, self.path)
+        return imported
+
+    def _import_csv(self, csv_path):
+        self.create()
+        imported = 0
+        error_count = 0
+        batch = []
+        opener = gzip.open if str(csv_path).endswith(".gz") else open
+        with opener(csv_path, 'rt', newline='') as csvfile:
+            for row_number, row in enumerate(csv.DictReader(csvfile), start=1):
+                try:
+                    batch.append(encode(row))
+                except (ValueError, KeyError, TypeError) as e:
+                    error_count += 1
+                    if error_count < 5:  # Limit the number of error messages
+                        logger.warning("Error importing row %d: %s", row_number, e)
+                    continue
+                if len(batch) >= 4096:
+                    self.append_bytes(b"".join(batch))
+                    imported += len(batch)
+                    batch = []
+        if batch:
+            self.append_bytes(b"".join(batch))
+            imported += len(batch)
+
+        # Legacy logs are not guaranteed to be in order; sort once on import
+        records = self.records()
+        if len(records) > 1 and np.any(np.diff(records["time"]) < 0):
+            ordered = np.sort(records, order="time")
+            with self._lock:
+                self._close()
+                with open(self.path, 'wb') as f:
+                    f.write(HEADER.pack(MAGIC, SCHEMA_VERSION, DTYPE.itemsize))
+                    f.write(ordered.tobytes())
+                self._mm = None
+                self._mm_key = None
+
+        if error_count:
+            logger.warning("Skipped %d CSV rows that could not be imported from %s", error_count, csv_path)
+        return imported
+
+    def export_csv(self, records=None, chunk_rows=2048):
+        """Yield the log (or the given records) as CSV text in chunks."""
+        if records is None:
+            records = self.records()
+        return csv_chunks([records], chunk_rows)
+
+
+def csv_chunks(record_arrays, chunk_rows=2048):
+    """Yield CSV text (header first) for a sequence of record arrays, in chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column for column, _ in CSV_FIELDS])
+    cleaners = [cleaner(DTYPE, field) for _, field in CSV_FIELDS[1:]]
+    for records in record_arrays:
+        records = conform(records)
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start:start + chunk_rows]
+            columns = [chunk[field].astype(np.float64).tolist() for _, field in CSV_FIELDS[1:]]
+            for i, t in enumerate(chunk["time"].tolist()):
+                row = [datetime.fromtimestamp(t).isoformat()]
+                for column, clean in zip(columns, cleaners):
+                    value = clean(column[i])
+                    row.append('' if value is None else value)
+                writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Small LRU cache of encoded /api/data responses."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU map of (query arguments, log version) -> encoded response body.
+
+    Keys include the store version, which changes with every stored sample,
+    so an entry is never served once new data exists. Entries also expire
+    after `ttl` seconds, because relative windows ("last 5 minutes") slide
+    forward even when no samples arrive.
+    """
+
+    def __init__(self, max_entries=32, ttl=5.0, max_body_bytes=2 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_body_bytes = max_body_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """Store a value (a dict of encoded bodies); oversized bodies are not cached."""
+        if sum(len(body) for body in value.values()) > self.max_body_bytes:
+            return False
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Downsampling for /api/data: LTTB, per-bucket min/max/mean and rollup tiers.
+
+Raw records are folded into fixed-width time buckets at several resolutions
+(10 s, 1 min, 10 min by default). Each bucket keeps count, sum, sum of squares,
+min and max per field, so buckets can be merged further without going back to
+the raw rows. A request for `max_points` over a long window is answered from
+the finest tier that is small enough, in time proportional to the number of
+points returned rather than the number of rows logged.
+"""
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# Fields that get full statistics in each bucket
+STATS_FIELDS = ("temperature", "do", "q", "vehicle_temperature")
+# Fields that are only averaged (position of the bucket)
+MEAN_FIELDS = ("latitude", "longitude")
+
+DEFAULT_RESOLUTIONS = (10, 60, 600)
+
+# A source may hold up to this many times max_points before LTTB/min-max
+# reduction; beyond that the next coarser tier is used instead.
+OVERSAMPLE = 4
+
+_columns = [("start", "<f8"), ("n", "<u4"), ("t_sum", "<f8")]
+for _name in STATS_FIELDS:
+    _columns += [
+        (f"{_name}_n", "<u4"),
+        (f"{_name}_sum", "<f8"),
+        (f"{_name}_sumsq", "<f8"),
+        (f"{_name}_min", "<f4"),
+        (f"{_name}_max", "<f4"),
+    ]
+for _name in MEAN_FIELDS:
+    _columns += [(f"{_name}_n", "<u4"), (f"{_name}_sum", "<f8")]
+BUCKET_DTYPE = np.dtype(_columns)
+
+
+def lttb_indices(x, y, n_out):
+    """Pick n_out indices with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the previously selected point
+    and the average of the next bucket, which preserves peaks and dips.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.linspace(0, n - 1, max(n_out, 0)).astype(np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        if end <= start:
+            end = start + 1
+        area = np.abs(
+            (x[a] - next_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (next_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def aggregate(records, resolution):
+    """Fold raw log records into buckets of `resolution` seconds."""
+    if len(records) == 0:
+        return np.zeros(0, dtype=BUCKET_DTYPE)
+
+    times = records["time"]
+    keys = np.floor(times / resolution)
+    if np.any(np.diff(keys) < 0):
+        order = np.argsort(keys, kind="stable")
+        records, times, keys = records[order], times[order], keys[order]
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    buckets = np.zeros(len(starts), dtype=BUCKET_DTYPE)
+    buckets["start"] = keys[starts] * resolution
+    buckets["n"] = np.diff(np.append(starts, len(times)))
+    buckets["t_sum"] = np.add.reduceat(times, starts)
+
+    for name in STATS_FIELDS + MEAN_FIELDS:
+        values = records[name].astype(np.float64)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        buckets[f"{name}_n"] = np.add.reduceat(valid.astype(np.uint32), starts)
+        buckets[f"{name}_sum"] = np.add.reduceat(filled, starts)
+        if name in STATS_FIELDS:
+            buckets[f"{name}_sumsq"] = np.add.reduceat(filled * filled, starts)
+            buckets[f"{name}_min"] = np.fmin.reduceat(values, starts)
+            buckets[f"{name}_max"] = np.fmax.reduceat(values, starts)
+    return buckets
+
+
+def merge_groups(buckets, starts):
+    """Merge consecutive buckets into groups beginning at the given indices."""
+    merged = np.zeros(len(starts), dtype=BUCKET_DTYPE)
+    if len(starts) == 0:
+        return merged
+    merged["start"] = buckets["start"][starts]
+    for name in BUCKET_DTYPE.names[1:]:
+        column = buckets[name]
+        if name.endswith("_min"):
+            merged[name] = np.fmin.reduceat(column, starts)
+        elif name.endswith("_max"):
+            merged[name] = np.fmax.reduceat(column, starts)
+        else:
+            merged[name] = np.add.reduceat(column, starts)
+    return merged
+
+
+def aggregate_each(records):
+    """Treat every raw record as its own bucket so it can be merged with rebucket()."""
+    buckets = np.zeros(len(records), dtype=BUCKET_DTYPE)
+    buckets["start"] = records["time"]
+    buckets["n"] = 1
+    buckets["t_sum"] = records["time"]
+    for name in STATS_FIELDS + MEAN_FIELDS:
+        values = records[name].astype(np.float64)
+        valid = ~np.isnan(values)
+        buckets[f"{name}_n"] = valid
+        buckets[f"{name}_sum"] = np.where(valid, values, 0.0)
+        if name in STATS_FIELDS:
+            buckets[f"{name}_sumsq"] = np.where(valid, values * values, 0.0)
+            buckets[f"{name}_min"] = values
+            buckets[f"{name}_max"] = values
+    return buckets
+
+
+def rebucket(buckets, n_out):
+    """Merge buckets down to at most n_out evenly sized groups."""
+    if len(buckets) <= n_out:
+        return buckets
+    starts = np.unique(np.linspace(0, len(buckets), n_out, endpoint=False).astype(np.int64))
+    return merge_groups(buckets, starts)
+
+
+def bucket_means(buckets, name):
+    """Mean of a field per bucket (NaN where the bucket has no value)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return buckets[f"{name}_sum"] / buckets[f"{name}_n"]
+
+
+def _clean(value):
+    if value != value:
+        return None
+    return float(f"{value:.7g}")
+
+
+# /api/data columns of a bucket array ("t" is the mean time in epoch seconds)
+BUCKET_COLUMNS = (
+    ["t", "count"]
+    + [key for name in STATS_FIELDS for key in (name, f"{name}_min", f"{name}_max")]
+    + list(MEAN_FIELDS)
+)
+
+
+def bucket_column(buckets, key):
+    """One /api/data column of a bucket array as a JSON-ready list."""
+    if key == "t":
+        return np.round(buckets["t_sum"] / np.maximum(buckets["n"], 1), 3).tolist()
+    if key == "count":
+        return buckets["n"].tolist()
+    if key in STATS_FIELDS or key in MEAN_FIELDS:
+        values = bucket_means(buckets, key)
+    else:
+        values = buckets[key]
+    return [_clean(value) for value in values.astype(np.float64).tolist()]
+
+
+def bucket_rows(buckets):
+    """Convert buckets to /api/data rows: mean values plus per-bucket min/max."""
+    if len(buckets) == 0:
+        return []
+    times = (buckets["t_sum"] / np.maximum(buckets["n"], 1)).tolist()
+    columns = []
+    for name in STATS_FIELDS:
+        columns.append((name, bucket_means(buckets, name).tolist()))
+        columns.append((f"{name}_min", buckets[f"{name}_min"].astype(np.float64).tolist()))
+        columns.append((f"{name}_max", buckets[f"{name}_max"].astype(np.float64).tolist()))
+    for name in MEAN_FIELDS:
+        columns.append((name, bucket_means(buckets, name).tolist()))
+    counts = buckets["n"].tolist()
+
+    rows = []
+    for i, t in enumerate(times):
+        row = {"timestamp": datetime.fromtimestamp(t).isoformat(), "count": counts[i]}
+        for key, column in columns:
+            row[key] = _clean(column[i])
+        rows.append(row)
+    return rows
+
+
+class RollupTier:
+    """Growable array of buckets at one resolution, sorted by start time."""
+
+    def __init__(self, resolution):
+        self.resolution = resolution
+        self._lock = threading.Lock()
+        self._buckets = np.zeros(1024, dtype=BUCKET_DTYPE)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def clear(self):
+        with self._lock:
+            self._buckets = np.zeros(1024, dtype=BUCKET_DTYPE)
+            self._length = 0
+
+    def add(self, records):
+        """Fold newly appended raw records into the tier."""
+        self.add_buckets(aggregate(records, self.resolution))
+
+    def add_buckets(self, new):
+        """Fold buckets (sorted by start) into the tier.
+
+        Buckets starting at or before the last stored one are merged into
+        place, so data arriving late (e.g. after the clock was set back)
+        keeps the tier sorted.
+        """
+        if len(new) == 0:
+            return
+        with self._lock:
+            if self._length and new["start"][0] <= self._buckets["start"][self._length - 1]:
+                late = int(np.searchsorted(new["start"], self._buckets["start"][self._length - 1], side='right'))
+                self._merge_late(new[:late])
+                new = new[late:]
+            needed = self._length + len(new)
+            if needed > len(self._buckets):
+                grown = np.zeros(max(needed, 2 * len(self._buckets)), dtype=BUCKET_DTYPE)
+                grown[:self._length] = self._buckets[:self._length]
+                self._buckets = grown
+            self._buckets[self._length:needed] = new
+            self._length = needed
+
+    def _merge_late(self, late):
+        buckets = self._buckets[:self._length]
+        rows = np.searchsorted(buckets["start"], late["start"])
+        match = buckets["start"][np.minimum(rows, self._length - 1)] == late["start"]
+        for row, bucket in zip(rows[match].tolist(), late[match]):
+            buckets[row] = merge_groups(np.array([buckets[row], bucket], dtype=BUCKET_DTYPE), np.array([0]))[0]
+        if not np.all(match):
+            merged = np.insert(buckets, rows[~match], late[~match])
+            self._buckets = np.zeros(max(len(merged), len(self._buckets)), dtype=BUCKET_DTYPE)
+            self._buckets[:len(merged)] = merged
+            self._length = len(merged)
+
+    def window(self, since=None, until=None):
+        """Return a copy of the buckets overlapping (since, until]."""
+        with self._lock:
+            buckets = self._buckets[:self._length]
+            starts = buckets["start"]
+            lo = 0 if since is None else max(0, int(np.searchsorted(starts, since, side='right')) - 1)
+            hi = len(buckets) if until is None else int(np.searchsorted(starts, until, side='right'))
+            return buckets[lo:hi].copy()
+
+    def count(self, since=None, until=None):
+        """Number of buckets overlapping (since, until], without copying."""
+        with self._lock:
+            starts = self._buckets["start"][:self._length]
+            lo = 0 if since is None else max(0, int(np.searchsorted(starts, since, side='right')) - 1)
+            hi = self._length if until is None else int(np.searchsorted(starts, until, side='right'))
+            return max(0, hi - lo)
+
+    def trim(self, before):
+        """Drop the buckets starting before `before` (history deleted)."""
+        with self._lock:
+            starts = self._buckets["start"][:self._length]
+            drop = int(np.searchsorted(starts, before, side='left'))
+            if drop:
+                self._buckets[:self._length - drop] = self._buckets[drop:self._length]
+                self._length -= drop
+
+    def rows(self, since=None, until=None):
+        """Number of raw rows in the buckets overlapping (since, until]."""
+        with self._lock:
+            starts = self._buckets["start"][:self._length]
+            lo = 0 if since is None else max(0, int(np.searchsorted(starts, since, side='right')) - 1)
+            hi = self._length if until is None else int(np.searchsorted(starts, until, side='right'))
+            return int(self._buckets["n"][lo:hi].sum())
+
+
+class Rollups:
+    """Set of rollup tiers kept current as measurements are stored."""
+
+    def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+        self.tiers = [RollupTier(r) for r in sorted(resolutions)]
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def build(self, records):
+        """Rebuild every tier from the full set of stored records."""
+        self.clear()
+        self.add(records)
+
+    def add(self, records):
+        """Fold new raw records into every tier."""
+        if len(records) == 0:
+            return
+        # Coarser tiers are built from the finest one to avoid rescanning records
+        finest = aggregate(records, self.tiers[0].resolution)
+        self.tiers[0].add_buckets(finest)
+        self._merge_into(self.tiers[1:], finest)
+
+    def add_buckets(self, buckets):
+        """Fold buckets of any resolution (e.g. a compacted segment) into every tier.
+
+        Tiers finer than the buckets keep them as they are, so that stretch
+        of a fine tier simply has fewer points.
+        """
+        if len(buckets) == 0:
+            return
+        self._merge_into(self.tiers, buckets)
+
+    def trim(self, before):
+        """Drop every bucket starting before `before`.
+
+        The bucket `before` falls in is kept whole, so it may still include
+        some of the dropped records.
+        """
+        for tier in self.tiers:
+            tier.trim(np.floor(before / tier.resolution) * tier.resolution)
+
+    @staticmethod
+    def _merge_into(tiers, buckets):
+        for tier in tiers:
+            keys = np.floor(buckets["start"] / tier.resolution)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+            merged = merge_groups(buckets, starts)
+            merged["start"] = keys[starts] * tier.resolution
+            tier.add_buckets(merged)
+
+    def snapshot(self):
+        """Copy of every tier's buckets, keyed by resolution (for checkpoints)."""
+        return {tier.resolution: tier.window() for tier in self.tiers}
+
+    @classmethod
+    def restore(cls, snapshot):
+        """Rollups holding the buckets of a snapshot()."""
+        rollups = cls(snapshot.keys())
+        for tier in rollups.tiers:
+            tier.add_buckets(snapshot[tier.resolution])
+        return rollups
+
+    def select(self, since, until, max_points):
+        """Pick the tier to reduce a window to max_points from.
+
+        This is the finest tier holding at most OVERSAMPLE * max_points
+        buckets, unless the next coarser tier could not fill max_points, in
+        which case the finer tier is used anyway. Only the finest tier can
+        hold fewer than max_points buckets; callers then reduce the raw
+        records instead.
+        """
+        budget = max_points * OVERSAMPLE
+        counts = [tier.count(since, until) for tier in self.tiers]
+        for i, tier in enumerate(self.tiers):
+            if counts[i] <= budget:
+                return tier
+            if i + 1 < len(self.tiers) and counts[i + 1] < max_points:
+                return tier
+        return self.tiers[-1]
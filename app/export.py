@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Streaming encoders for /api/data responses and /api/logs downloads."""
+import json
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from binlog import CSV_FIELDS, DTYPE, conform, record_column, to_rows
+from downsample import BUCKET_COLUMNS, bucket_column, bucket_rows
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of str/bytes chunks, yielding compressed bytes as they fill up."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def json_rows(kind, parts, chunk_rows=1024):
+    """Yield a JSON array of row objects, encoded a chunk of rows at a time.
+
+    kind and parts are the first two values returned by MeasurementStore.select().
+    """
+    convert = to_rows if kind == "records" else bucket_rows
+    yield "["
+    first = True
+    for part in parts():
+        for start in range(0, len(part), chunk_rows):
+            rows = convert(part[start:start + chunk_rows])
+            if not rows:
+                continue
+            text = json.dumps(rows, separators=(",", ":"))[1:-1]
+            yield text if first else "," + text
+            first = False
+    yield "]"
+
+
+def json_columns(kind, parts, chunk_rows=4096):
+    """Yield a columnar JSON object ({"t": [...], "do": [...], ...}).
+
+    Timestamps are epoch seconds and each column is written in full before
+    the next, re-reading the parts once per column instead of holding them;
+    parts() must yield the same rows every time (MeasurementStore.select()
+    pins the end of the window).
+    """
+    if kind == "records":
+        keys, column = ["t"] + list(DTYPE.names[1:]), record_column
+    else:
+        keys, column = BUCKET_COLUMNS, bucket_column
+    yield "{"
+    for i, key in enumerate(keys):
+        yield ("," if i else "") + json.dumps(key) + ":["
+        first = True
+        for part in parts():
+            for start in range(0, len(part), chunk_rows):
+                values = column(part[start:start + chunk_rows], key)
+                if not values:
+                    continue
+                text = json.dumps(values, separators=(",", ":"))[1:-1]
+                yield text if first else "," + text
+                first = False
+        yield "]"
+    yield "}"
+
+
+def parquet_available():
+    return pq is not None
+
+
+class _ChunkSink:
+    """Write-only file object that hands whatever was written to a generator."""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema():
+    fields = [pa.field("timestamp", pa.timestamp("us", tz="UTC"))]
+    fields += [pa.field(column, pa.from_numpy_dtype(DTYPE[field])) for column, field in CSV_FIELDS[1:]]
+    return pa.schema(fields)
+
+
+def parquet_stream(record_arrays, row_group_rows=65536):
+    """Yield a Parquet file built from record arrays, one row group at a time.
+
+    Timestamps are stored as UTC; missing values become nulls.
+    """
+    if pq is None:
+        raise RuntimeError("Parquet export needs the pyarrow package")
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+
+    def write(chunk):
+        micros = np.round(chunk["time"] * 1e6).astype(np.int64)
+        columns = [pa.array(micros, type=pa.int64()).cast(schema.field("timestamp").type)]
+        for _, field in CSV_FIELDS[1:]:
+            values = np.ascontiguousarray(chunk[field])
+            columns.append(pa.array(values, mask=np.isnan(values)))
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+    # Segments are small, so gather them into full row groups
+    pending = []
+    pending_rows = 0
+    for records in record_arrays:
+        pending.append(conform(records))
+        pending_rows += len(records)
+        while pending_rows >= row_group_rows:
+            combined = np.concatenate(pending)
+            write(combined[:row_group_rows])
+            pending = [combined[row_group_rows:]]
+            pending_rows = len(pending[0])
+            data = sink.drain()
+            if data:
+                yield data
+    if pending_rows:
+        write(np.concatenate(pending))
+    writer.close()
+    yield sink.drain()
+
+
+def parse_time(value):
+    """Parse a ?start=/?end= argument: epoch seconds or an ISO 8601 timestamp."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""Spatial aggregation of GPS-tagged measurements for /api/grid.
+
+Readings are binned into Web Mercator tiles (the x/y/zoom scheme of web
+maps) at several zoom levels. Each cell keeps count, sum, min and max of
+DO and temperature per sensor, so a heatmap of any area is a lookup of the
+cells inside it rather than a pass over the logs. Readings without a GPS
+fix (NaN, or exactly 0/0 as reported before the first fix) are left out.
+"""
+import math
+import threading
+
+import numpy as np
+
+# Fields aggregated per cell
+GRID_FIELDS = ("do", "temperature")
+
+# Zoom levels kept; at zoom 20 a cell is about 38 m wide at the equator
+# (27 m at 45 degrees latitude), at zoom 10 about 39 km
+ZOOM_LEVELS = (10, 12, 14, 16, 18, 20)
+
+# Web Mercator stops at about 85.05 degrees north and south
+MAX_LATITUDE = 85.05112878
+
+# Cell keys pack sensor ID, x and y: sensor << 48 | x << 24 | y
+_COORD_BITS = 24
+_COORD_MASK = (1 << _COORD_BITS) - 1
+
+_columns = [("key", "<i8"), ("n", "<u4"), ("t_last", "<f8")]
+for _name in GRID_FIELDS:
+    _columns += [(f"{_name}_n", "<u4"), (f"{_name}_sum", "<f8"), (f"{_name}_min", "<f4"), (f"{_name}_max", "<f4")]
+CELL_DTYPE = np.dtype(_columns)
+
+
+def parse_bbox(text):
+    """Parse a ?bbox= argument "west,south,east,north" in degrees; None if empty."""
+    if text is None or text == '':
+        return None
+    try:
+        west, south, east, north = (float(part) for part in text.split(","))
+    except ValueError:
+        raise ValueError(f"invalid bbox {text!r} (use west,south,east,north in degrees)") from None
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError(f"invalid bbox {text!r} (use west,south,east,north in degrees)")
+    return west, south, east, north
+
+
+def tile_xy(latitude, longitude, zoom):
+    """Tile x and y of each position at `zoom` (int64 arrays)."""
+    scale = 2 ** zoom
+    lat = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(longitude, dtype=np.float64) + 180.0) / 360.0 * scale)
+    y = np.floor((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * scale)
+    return np.clip(x, 0, scale - 1).astype(np.int64), np.clip(y, 0, scale - 1).astype(np.int64)
+
+
+def tile_bounds(x, y, zoom):
+    """(south, west, north, east) in degrees of tiles x, y at `zoom`."""
+    scale = 2 ** zoom
+    west = x / scale * 360.0 - 180.0
+    east = (x + 1) / scale * 360.0 - 180.0
+    north = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * y / scale))))
+    south = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + 1) / scale))))
+    return south, west, north, east
+
+
+def aggregate_cells(records, zoom):
+    """Fold records into cells at `zoom`, one per sensor and tile, sorted by key."""
+    lat = records["latitude"].astype(np.float64)
+    lon = records["longitude"].astype(np.float64)
+    located = ~np.isnan(lat) & ~np.isnan(lon) & ~((lat == 0) & (lon == 0))
+    if not np.all(located):
+        records, lat, lon = records[located], lat[located], lon[located]
+    if len(records) == 0:
+        return np.zeros(0, dtype=CELL_DTYPE)
+
+    x, y = tile_xy(lat, lon, zoom)
+    keys = (records["sensor_id"].astype(np.int64) << (2 * _COORD_BITS)) | (x << _COORD_BITS) | y
+    order = np.argsort(keys, kind="stable")
+    keys, records = keys[order], records[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+
+    cells = np.zeros(len(starts), dtype=CELL_DTYPE)
+    cells["key"] = keys[starts]
+    cells["n"] = np.diff(np.append(starts, len(keys)))
+    cells["t_last"] = np.maximum.reduceat(records["time"], starts)
+    for name in GRID_FIELDS:
+        values = records[name].astype(np.float64)
+        valid = ~np.isnan(values)
+        cells[f"{name}_n"] = np.add.reduceat(valid.astype(np.uint32), starts)
+        cells[f"{name}_sum"] = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        cells[f"{name}_min"] = np.fmin.reduceat(values, starts)
+        cells[f"{name}_max"] = np.fmax.reduceat(values, starts)
+    return cells
+
+
+def merge_cells(cells, keys):
+    """Merge cells sharing a key (keys given per cell), sorted by key."""
+    if len(cells) == 0:
+        return cells
+    order = np.argsort(keys, kind="stable")
+    cells, keys = cells[order], keys[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    merged = np.zeros(len(starts), dtype=CELL_DTYPE)
+    merged["key"] = keys[starts]
+    for name in CELL_DTYPE.names[1:]:
+        column = cells[name]
+        if name.endswith("_min"):
+            merged[name] = np.fmin.reduceat(column, starts)
+        elif name.endswith("_max") or name == "t_last":
+            merged[name] = np.fmax.reduceat(column, starts)
+        else:
+            merged[name] = np.add.reduceat(column, starts)
+    return merged
+
+
+def select_cells(cells, zoom, bbox=None, sensor=None):
+    """Cells inside bbox (west, south, east, north), of one sensor or merged across sensors.
+
+    Keys of the result hold only x and y.
+    """
+    keys = cells["key"]
+    x = (keys >> _COORD_BITS) & _COORD_MASK
+    y = keys & _COORD_MASK
+    mask = np.ones(len(cells), dtype=bool)
+    if sensor is not None:
+        mask &= (keys >> (2 * _COORD_BITS)) == sensor
+    if bbox is not None:
+        west, south, east, north = bbox
+        (x_west, x_east), (y_north, y_south) = tile_xy([north, south], [west, east], zoom)
+        mask &= (y >= y_north) & (y <= y_south)
+        if west <= east:
+            mask &= (x >= x_west) & (x <= x_east)
+        else:  # Crosses the antimeridian
+            mask &= (x >= x_west) | (x <= x_east)
+    selected = cells[mask]
+    return merge_cells(selected, keys[mask] & ((1 << (2 * _COORD_BITS)) - 1))
+
+
+def cell_rows(cells, zoom):
+    """Convert cells to /api/grid rows: tile, bounds, count and mean/min/max per field."""
+    if len(cells) == 0:
+        return []
+    x = (cells["key"] >> _COORD_BITS) & _COORD_MASK
+    y = cells["key"] & _COORD_MASK
+    south, west, north, east = tile_bounds(x, y, zoom)
+    columns = [
+        ("x", x.tolist()), ("y", y.tolist()),
+        ("lat", ((south + north) / 2).tolist()), ("lon", ((west + east) / 2).tolist()),
+        ("south", south.tolist()), ("west", west.tolist()), ("north", north.tolist()), ("east", east.tolist()),
+        ("count", cells["n"].tolist()), ("t_last", cells["t_last"].tolist()),
+    ]
+    for name in GRID_FIELDS:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = cells[f"{name}_sum"] / cells[f"{name}_n"]
+        columns.append((name, [_clean(v) for v in means.tolist()]))
+        columns.append((f"{name}_min", [_clean(v) for v in cells[f"{name}_min"].astype(np.float64).tolist()]))
+        columns.append((f"{name}_max", [_clean(v) for v in cells[f"{name}_max"].astype(np.float64).tolist()]))
+    names = [key for key, _ in columns]
+    return [dict(zip(names, values)) for values in zip(*(column for _, column in columns))]
+
+
+def _clean(value):
+    if value != value:
+        return None
+    return float(f"{value:.7g}")
+
+
+class GridLevel:
+    """Cells of one zoom level: a growable array plus a key -> row index."""
+
+    def __init__(self, zoom):
+        self.zoom = zoom
+        self._index = {}
+        self._cells = np.zeros(1024, dtype=CELL_DTYPE)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def cells(self):
+        return self._cells[:self._length]
+
+    def add_cells(self, new):
+        """Merge aggregated cells (unique keys) into the level."""
+        if len(new) == 0:
+            return
+        rows = np.fromiter((self._index.get(key, -1) for key in new["key"].tolist()), dtype=np.int64, count=len(new))
+        fresh = rows < 0
+        if np.any(fresh):
+            count = int(fresh.sum())
+            needed = self._length + count
+            if needed > len(self._cells):
+                grown = np.zeros(max(needed, 2 * len(self._cells)), dtype=CELL_DTYPE)
+                grown[:self._length] = self._cells[:self._length]
+                self._cells = grown
+            rows[fresh] = np.arange(self._length, needed)
+            for key, row in zip(new["key"][fresh].tolist(), rows[fresh].tolist()):
+                self._index[key] = row
+            self._cells[self._length:needed] = new[fresh]
+            self._length = needed
+            new, rows = new[~fresh], rows[~fresh]
+        if len(new) == 0:
+            return
+        cells = self._cells
+        for name in CELL_DTYPE.names[1:]:
+            if name.endswith("_min"):
+                cells[name][rows] = np.fmin(cells[name][rows], new[name])
+            elif name.endswith("_max") or name == "t_last":
+                cells[name][rows] = np.fmax(cells[name][rows], new[name])
+            else:
+                cells[name][rows] += new[name]
+
+
+class SpatialGrid:
+    """Grid cells at every zoom level, kept current from a MeasurementStore.
+
+    add() is registered as a store listener, so rotating or compacting the
+    logs (which the store re-reads without notifying listeners) leaves the
+    cells as they are. They are built once the store is ready, from the
+    cells kept in the compacted archives and every raw record, and rebuilt
+    only when stored data was deleted, as cells cannot be trimmed.
+    """
+
+    def __init__(self, store, zoom_levels=ZOOM_LEVELS):
+        self.zoom_levels = tuple(sorted(zoom_levels))
+        self._store = store
+        self._lock = threading.Lock()
+        self._levels = {}
+        self._removals = None
+        # Newest record time read by the last build; the store may notify
+        # the same records again
+        self._covered_until = None
+
+    def add(self, records):
+        """Fold newly stored records into every level."""
+        with self._lock:
+            # A rebuild reads these records from the store as well; _add()
+            # skips those it covered
+            self._sync()
+            self._add(records)
+
+    def level(self, zoom):
+        """The kept zoom level closest to `zoom` without being finer."""
+        kept = [level for level in self.zoom_levels if level <= zoom]
+        return kept[-1] if kept else self.zoom_levels[0]
+
+    def select(self, zoom, bbox=None, sensor=None):
+        """Cells inside bbox at kept level `zoom` (see select_cells())."""
+        with self._lock:
+            self._sync()
+            level = self._levels.get(zoom)
+            cells = level.cells() if level is not None else np.zeros(0, dtype=CELL_DTYPE)
+            return select_cells(cells, zoom, bbox, sensor)
+
+    def _sync(self):
+        """Rebuild the cells if stored data was deleted (or on first use); True if rebuilt."""
+        removals = self._store.removals
+        if removals == self._removals or not self._store.ready.is_set():
+            return False
+        self._levels = {zoom: GridLevel(zoom) for zoom in self.zoom_levels}
+        self._removals = removals
+        self._covered_until = None
+        for archive in self._store.segments.archives:
+            for zoom, cells in archive.cells().items():
+                if zoom in self._levels:
+                    self._levels[zoom].add_cells(cells)
+        covered_until = None
+        for records in self._store.iter_window():
+            self._add(records)
+            if len(records):
+                covered_until = max(float(records["time"].max()), covered_until or -np.inf)
+        self._covered_until = covered_until
+        return True
+
+    def _add(self, records):
+        if self._covered_until is not None and len(records):
+            records = records[records["time"] > self._covered_until]
+        if len(records) == 0 or not self._levels:
+            return
+        for zoom, level in self._levels.items():
+            level.add_cells(aggregate_cells(records, zoom))
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""Background log writer: batches measurements and group-commits them to disk,
+and gzips rotated CSV backups off the acquisition path."""
+import csv
+import glob
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from applog import RATE_LIMITED
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Queue marker asking the writer thread to flush and exit
+_STOP = object()
+
+# Sensor threads date their readings before queueing them, so readings can
+# arrive slightly out of order. The writer holds each reading this many
+# seconds before writing it, so one that arrives late by less than that is
+# sorted in; a reading older than one already written is not logged.
+REORDER_SECONDS = 2.0
+
+
+class LogWriter:
+    """Dedicated thread that owns the CSV and binary log files.
+
+    The sensor loop hands measurements over with submit(), which never blocks.
+    The writer drains the queue in batches, appends them to the open CSV
+    handle and the binary log, and only fsyncs every `fsync_interval` seconds
+    or `fsync_rows` rows, so a slow SD card cannot stall acquisition.
+
+    The logs are kept in time order: readings wait in a short reorder buffer
+    (REORDER_SECONDS) and are written sorted by their timestamps. A reading
+    older than one already written (it reached the writer too late, or the
+    wall clock was set back) is counted in `rows_late` and not logged.
+
+    Logs left by an older version (different CSV columns or binary log
+    schema) are rotated aside when first opened rather than rewritten, so
+    an upgrade costs the same however large the log is.
+    """
+
+    def __init__(self, csv_path, headers, store, max_size_mb,
+                 queue_size=1000, batch_rows=100, fsync_interval=5.0, fsync_rows=20):
+        self.csv_path = str(csv_path)
+        self.headers = list(headers)
+        self.store = store
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.batch_rows = batch_rows
+        self.fsync_interval = fsync_interval
+        self.fsync_rows = fsync_rows
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._writer = None
+        self._size = 0
+        self._unsynced_rows = 0
+        self._last_sync = time.monotonic()
+        # Time of the newest reading written (None: look it up in the store)
+        self._last_time = None
+        # Reorder buffer: (timestamp, monotonic arrival, measurement)
+        self._pending = []
+
+        self.compressor = BackupCompressor(os.path.dirname(self.csv_path), self._lock)
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_written = 0
+        self.rotations = 0
+        self.write_errors = 0
+        self.rows_late = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.flush_count = 0
+        self.write_seconds = Histogram("pme_log_write_seconds", "Time to write one batch of rows to the CSV and binary logs")
+        self.fsync_seconds = Histogram("pme_log_fsync_seconds", "Time to flush and fsync the log files")
+
+    def start(self):
+        """Start the writer thread and the backup compressor."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+        self.compressor.start()
+
+    def submit(self, measurement):
+        """Queue a measurement for writing. Returns False if it had to be dropped."""
+        try:
+            self._queue.put_nowait(measurement)
+            return True
+        except queue.Full:
+            self.rows_dropped += 1
+            return False
+
+    def stop(self, timeout=10.0):
+        """Write everything still queued, fsync and close the files."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Log writer queue full during shutdown, some rows may be lost")
+            return
+        self._thread.join(timeout)
+
+    def run_with_files_closed(self, func):
+        """Call func() while the writer holds no open log files.
+
+        Used when the log files are about to be removed from under the writer;
+        the files are reopened (with a fresh CSV header) on the next batch.
+        """
+        with self._lock:
+            self._sync()
+            self._close()
+            return func()
+
+    def stats(self):
+        """Return queue and flush counters for monitoring."""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "batches_written": self.batches_written,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+            "rows_late": self.rows_late,
+            "rows_pending": len(self._pending),
+            "unsynced_rows": self._unsynced_rows,
+            "fsync_interval_s": self.fsync_interval,
+            "fsync_rows": self.fsync_rows,
+            "flush_count": self.flush_count,
+            "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+            "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3),
+            "avg_flush_latency_ms": round(self.total_flush_latency * 1000 / self.flush_count, 3) if self.flush_count else 0.0,
+            "compression": self.compressor.stats(),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            # Wait for work, but wake up periodically so buffered readings and
+            # a pending fsync are not held back when samples stop arriving
+            timeout = min(self.fsync_interval, REORDER_SECONDS) if self._pending else self.fsync_interval
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._write_released()
+                    if self._unsynced_rows and (self._unsynced_rows >= self.fsync_rows
+                                                or time.monotonic() - self._last_sync >= self.fsync_interval):
+                        self._sync()
+                continue
+
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_rows:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._hold(batch)
+                self._write_released(everything=stopping)
+                now = time.monotonic()
+                if stopping or self._unsynced_rows >= self.fsync_rows or now - self._last_sync >= self.fsync_interval:
+                    self._sync()
+
+        with self._lock:
+            self._close()
+        logger.info("Log writer stopped")
+
+    def _open(self):
+        """Open the CSV log for appending, writing the header for a new file."""
+        os.makedirs(os.path.dirname(self.csv_path), exist_ok=True)
+        if self._outdated():
+            self._rotate("log format changed")
+        self._file = open(self.csv_path, 'a', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=self.headers, extrasaction='ignore')
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._writer.writeheader()
+
+    def _close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError as e:
+                logger.error("Error closing CSV log: %s", e)
+            self._file = None
+            self._writer = None
+        self.store.close()
+
+    def _outdated(self):
+        """Whether the logs on disk were started with other columns than ours."""
+        if self.store.outdated():
+            return True
+        try:
+            with open(self.csv_path, newline='') as f:
+                header = next(csv.reader(f), None)
+        except FileNotFoundError:
+            return False
+        return header is not None and header != self.headers
+
+    def _rotate(self, reason=None):
+        """Move the full CSV and binary log aside as timestamped backups."""
+        self._sync()
+        self._close()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_dir = os.path.dirname(self.csv_path)
+        name = f"sensor_data_backup_{timestamp}"
+        suffix = 0
+        while glob.glob(os.path.join(log_dir, name + ".csv*")):
+            # Never overwrite an earlier backup rotated within the same second
+            suffix += 1
+            name = f"sensor_data_backup_{timestamp}_{suffix}"
+        backup_file = os.path.join(log_dir, name + ".csv")
+        if os.path.exists(self.csv_path):
+            os.rename(self.csv_path, backup_file)
+            self.compressor.submit(backup_file)
+        self.store.rotate(os.path.join(log_dir, name + ".bin"))
+        self.rotations += 1
+        if reason:
+            logger.info("Rotated logs (%s), previous data backed up to %s", reason, backup_file)
+        else:
+            logger.info("Rotated CSV file at %.2f MB, previous data backed up to %s", self._size / (1024 * 1024), backup_file)
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            if self._file is not None and self._size >= self.max_size_bytes:
+                try:
+                    self._rotate()
+                except Exception as rotate_error:
+                    # If rotation fails, just continue with append
+                    logger.error("Error rotating CSV file: %s", rotate_error)
+            if self._file is None:
+                self._open()
+            batch = self._in_order(batch)
+            if not batch:
+                return
+
+            self._writer.writerows(batch)
+            self._file.flush()
+            self._size = self._file.tell()
+            self.store.append_many(batch)
+
+            self.rows_written += len(batch)
+            self.batches_written += 1
+            self._unsynced_rows += len(batch)
+            self.write_seconds.observe(time.perf_counter() - start)
+        except Exception as e:
+            self.write_errors += 1
+            logger.error("Error writing batch of %d rows to log: %s", len(batch), e)
+            self._close()
+
+    def _hold(self, batch):
+        """Add readings to the reorder buffer."""
+        arrival = time.monotonic()
+        for measurement in batch:
+            self._pending.append((_timestamp(measurement), arrival, measurement))
+
+    def _release(self, everything=False):
+        """Take the readings due to be written out of the reorder buffer, sorted.
+
+        Once a reading has been held REORDER_SECONDS, it is released along
+        with every buffered reading not newer than it.
+        """
+        if everything:
+            due = float("inf")
+        else:
+            cutoff = time.monotonic() - REORDER_SECONDS
+            due = max((t for t, arrival, _ in self._pending if arrival <= cutoff), default=None)
+            if due is None:
+                return []
+        ready = sorted((entry for entry in self._pending if entry[0] <= due), key=lambda entry: entry[0])
+        self._pending = [entry for entry in self._pending if entry[0] > due]
+        return [measurement for _, _, measurement in ready]
+
+    def _write_released(self, everything=False):
+        """Write the readings released from the reorder buffer, batch_rows at a time."""
+        ready = self._release(everything)
+        for start in range(0, len(ready), self.batch_rows):
+            self._write_batch(ready[start:start + self.batch_rows])
+
+    def _in_order(self, batch):
+        """Sort a batch by timestamp, leaving out readings older than the
+        newest one already written (see REORDER_SECONDS)."""
+        times = [_timestamp(measurement) for measurement in batch]
+        order = sorted(range(len(batch)), key=times.__getitem__)
+        if self._last_time is None:
+            self._last_time = self.store.newest_time()
+        last = self._last_time
+        ordered = [batch[i] for i in order if last is None or times[i] >= last]
+        late = len(batch) - len(ordered)
+        if late:
+            self.rows_late += late
+            logger.warning("Not logging %d readings up to %.1f s older than the newest one logged "
+                           "(late, or the clock was set back)", late, last - times[order[0]], extra=RATE_LIMITED)
+        if ordered:
+            self._last_time = max(last if last is not None else times[order[-1]], times[order[-1]])
+        return ordered
+
+    def _sync(self):
+        """Flush and fsync both log files, recording how long it took."""
+        start = time.perf_counter()
+        try:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self.store.sync()
+        except Exception as e:
+            self.write_errors += 1
+            logger.error("Error syncing log files: %s", e)
+        elapsed = time.perf_counter() - start
+        self.fsync_seconds.observe(elapsed)
+        self.last_flush_latency = elapsed
+        self.max_flush_latency = max(self.max_flush_latency, elapsed)
+        self.total_flush_latency += elapsed
+        self.flush_count += 1
+        self._unsynced_rows = 0
+        self._last_sync = time.monotonic()
+
+
+def _timestamp(measurement):
+    """Epoch seconds of a measurement's ISO timestamp."""
+    return datetime.fromisoformat(measurement["timestamp"]).timestamp()
+
+
+class BackupCompressor:
+    """Thread that gzips rotated CSV backups (name.csv -> name.csv.gz).
+
+    The binary log of each segment stays uncompressed because queries map it
+    directly; the CSV copy is only kept for users and compresses several-fold.
+    The compressed file is written under a temporary name and swapped in
+    while holding the writer's lock, so deleting the logs can never race a
+    half-finished compression.
+    """
+
+    def __init__(self, log_dir, lock, level=6):
+        self.log_dir = log_dir
+        self.level = level
+        self._lock = lock
+        self._queue = queue.Queue()
+        self._thread = None
+        self.files_compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the thread and queue any backups left uncompressed earlier."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        for path in sorted(glob.glob(os.path.join(self.log_dir, "sensor_data_backup_*.csv"))):
+            self.submit(path)
+        self._thread = threading.Thread(target=self._run, name="backup-compressor", daemon=True)
+        self._thread.start()
+
+    def submit(self, path):
+        self._queue.put(path)
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "files_compressed": self.files_compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                self._compress(path)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error compressing %s: %s", path, e)
+
+    def _compress(self, path):
+        if not os.path.exists(path):
+            return
+        target = path + ".gz"
+        tmp_path = target + ".tmp"
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=self.level) as dst:
+            while True:
+                block = src.read(1024 * 1024)
+                if not block:
+                    break
+                dst.write(block)
+        with self._lock:
+            if not os.path.exists(path) or not os.path.exists(tmp_path):
+                # The logs were deleted while we were compressing
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+            size_in = os.path.getsize(path)
+            size_out = os.path.getsize(tmp_path)
+            os.replace(tmp_path, target)
+            os.remove(path)
+        self.files_compressed += 1
+        self.bytes_in += size_in
+        self.bytes_out += size_out
+        logger.info("Compressed %s (%d -> %d bytes)", os.path.basename(path), size_in, size_out)
@@ -1,136 +1,374 @@
 #!/usr/bin/env python3
+import logging
 import threading
 import time
 from datetime import datetime, timedelta
 import serial
 import serial.tools.list_ports
-from flask import Flask, jsonify, send_from_directory, Response, request, send_file
+from flask import Flask, g, jsonify, send_from_directory, Response, request
 import os
-import csv
+import gzip
 import json
 from pathlib import Path
-import requests
 import glob
-from threading import Lock
+from store import MeasurementStore
+from logwriter import LogWriter
+from stream import Broadcaster
+from mavlink import Mavlink2RestClient, TelemetryCache
+from sensors import MAX_SENSOR_ID, SensorManager
+from scheduler import SCHEDULE_POLICIES, IntervalScheduler
+from cache import ResponseCache
+from downsample import STATS_FIELDS
+from stats import RollingStats, bucket_stats, parse_window
+from grid import SpatialGrid, aggregate_cells, cell_rows, parse_bbox, select_cells
+from retention import COMPACT_RESOLUTIONS, RetentionManager
+from metrics import Registry
+import applog
+from applog import RATE_LIMITED
+from acquisition import AcquisitionProcess, AcquisitionUnavailable, LocalAcquisition, serve_control
+from binlog import to_rows
+from export import gzip_stream, json_columns, json_rows, parquet_available, parquet_stream, parse_time
+import atexit
+import signal
+import sys
+
+try:
+    from waitress import serve
+except ImportError:  # Fall back to Flask's development server
+    serve = None
+
+applog.setup_logging()
+logger = logging.getLogger("main")
 
 app = Flask(__name__)
 
-# Global list to store the latest 60 measurements.
-# Each measurement is a dict: {timestamp, temperature, do, q}
-data = []
-DATA_LOCK = Lock()
-SERIAL_LOCK = threading.Lock()
+# "waitress" serves HTTP from a thread pool and samples the sensor in a
+# separate process; "flask" runs everything in one process on Flask's
+# development server
+SERVER = os.environ.get("PME_SERVER", "waitress")
+HTTP_THREADS = int(os.environ.get("PME_HTTP_THREADS", 16))
+# Each /api/stream client holds a worker thread while connected; waitress
+# gets this many threads on top of HTTP_THREADS, and further clients are
+# turned away, so streams can never starve the other routes
+MAX_STREAM_SUBSCRIBERS = int(os.environ.get("PME_STREAM_SUBSCRIBERS", 8))
+HTTP_PORT = int(os.environ.get("PME_HTTP_PORT", 6436))
+
+# IMPORTANT: In Docker with a volume mount from host to /app/logs,
+# we should ALWAYS use the /app/logs path directly, as this is what's
+# mounted to the host directory. PME_LOG_DIR is for running off-vehicle
+# (benchmarks, development).
+LOG_DIR = Path(os.environ.get("PME_LOG_DIR", "/app/logs"))
 
-# Serial port configuration
+# Serial port configuration. Each sensor on the vehicle has an ID (stored
+# with its readings) and a port; sensor 0 is the one a single-sensor setup
+# has always used. Updated from the config file if available.
 DEFAULT_SERIAL_PORT = "/dev/ttyUSB0"
 BAUD_RATE = 9600
-SERIAL_PORT = DEFAULT_SERIAL_PORT  # Will be updated from config file if available
-SERIAL_CONFIG_FILE = "/app/logs/serial_config.json"
+SENSOR_PORTS = {0: DEFAULT_SERIAL_PORT}
+SERIAL_CONFIG_FILE = str(LOG_DIR / "serial_config.json")
+SENSOR_COMMAND = b"MDOT\r\n"
+RESPONSE_TIMEOUT = 2.0  # Seconds to wait for the reply to a command
 
-# Global serial connection
-serial_connection = None
+# Sampling configuration, persisted next to the serial config.
+#   mode: "polled" sends MDOT every `interval` seconds; "continuous" stores
+#         every line the sensor outputs on its own.
+#   schedule: what polled mode does with polls missed while a cycle overran;
+#         "skip" keeps the original time grid, "catch_up" runs them late
+#         (see scheduler.py).
+#   start_command / stop_command: optional commands (without line ending)
+#         that switch the sensor's continuous output on and off. Leave empty
+#         if the sensor is already configured to stream.
+SAMPLING_CONFIG_FILE = str(LOG_DIR / "sampling_config.json")
+DEFAULT_SAMPLING = {"mode": "polled", "interval": 5.0, "schedule": "skip", "start_command": "", "stop_command": ""}
+SAMPLING_MODES = ("polled", "continuous")
+MIN_SAMPLING_INTERVAL = 0.2
+MAX_SAMPLING_INTERVAL = 3600.0
+SAMPLING = dict(DEFAULT_SAMPLING)
+
+# Retention policy, persisted next to the other configs (see retention.py).
+#   raw_days: compact rotated segments older than this into rollups of
+#         `compact_resolution` seconds (0 keeps raw readings forever)
+#   max_total_mb: cap on the log files' total size; the oldest segments are
+#         compacted, then the oldest archives deleted (0 for no cap)
+RETENTION_CONFIG_FILE = str(LOG_DIR / "retention_config.json")
+DEFAULT_RETENTION = {"raw_days": 0, "compact_resolution": 600, "max_total_mb": 0}
+
+# Forward DO_T/DO_O to Mavlink2Rest at most this often (seconds), per sensor
+MAVLINK_SEND_INTERVAL = 1.0
+last_mavlink_send = {}
 
-# IMPORTANT: In Docker with a volume mount from host to /app/logs,
-# we should ALWAYS use the /app/logs path directly, as this is what's
-# mounted to the host directory.
-LOG_DIR = Path("/app/logs")
 LOG_FILE = LOG_DIR / "sensor_data.csv"
-CSV_HEADERS = ["timestamp", "temperature", "do", "q", "vehicle_temperature", "latitude", "longitude"]
+# gps_age / vehicle_temperature_age: seconds since Mavlink2Rest last received
+# the telemetry used to tag the sample from the vehicle
+# monotonic: time.monotonic() when the reading arrived; unlike the wall-clock
+# timestamp it never jumps, so the spacing of samples can be trusted
+# sensor_id: which sensor took the reading (see SENSOR_PORTS)
+CSV_HEADERS = ["timestamp", "temperature", "do", "q", "vehicle_temperature", "latitude", "longitude",
+               "gps_age", "vehicle_temperature_age", "monotonic", "sensor_id"]
 MAX_CSV_SIZE_MB = 10  # Limit file size to 10MB before rotation
 
-def ensure_csv_headers():
-    """Check and update CSV headers if needed."""
+# Fixed-width binary copy of the live log; /api/data memory-maps this instead of
+# re-parsing the CSV on every request, and /api/logs exports CSV from it.
+BINARY_LOG_FILE = LOG_DIR / "sensor_data.bin"
+STORE = MeasurementStore(BINARY_LOG_FILE)
+
+# Group-commit settings for the background log writer. Rows are written in
+# batches as they arrive and fsynced every LOG_FSYNC_INTERVAL seconds or
+# LOG_FSYNC_ROWS rows, whichever comes first.
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 1000))
+LOG_FSYNC_INTERVAL = float(os.environ.get("LOG_FSYNC_INTERVAL", 5.0))
+LOG_FSYNC_ROWS = int(os.environ.get("LOG_FSYNC_ROWS", 20))
+LOG_WRITER = LogWriter(
+    LOG_FILE, CSV_HEADERS, STORE, MAX_CSV_SIZE_MB,
+    queue_size=LOG_QUEUE_SIZE,
+    fsync_interval=LOG_FSYNC_INTERVAL,
+    fsync_rows=LOG_FSYNC_ROWS
+)
+
+# Applies the retention policy in a low-priority thread wherever acquisition runs
+RETENTION = RetentionManager(STORE, DEFAULT_RETENTION)
+
+# Pushes each stored measurement to /api/stream subscribers
+BROADCASTER = Broadcaster(max_subscribers=MAX_STREAM_SUBSCRIBERS)
+
+# Encoded /api/data responses, keyed on the query arguments and STORE.version
+DATA_CACHE = ResponseCache()
+# Distinguishes ETags across restarts, since STORE.version starts over
+BOOT_ID = f"{int(time.time()):x}"
+
+# Trailing-window statistics for /api/stats, updated as samples are stored
+ROLLING_STATS = RollingStats(STORE)
+
+# Map cells of DO and temperature for /api/grid, updated as samples are stored.
+# /api/grid answers with the finest zoom level that has at most this many
+# cells in the requested area
+GRID = SpatialGrid(STORE)
+MAX_GRID_CELLS = 20000
+
+# Shared, pooled Mavlink2Rest client; remembers the endpoint that last worked
+# PME_MAVLINK2REST_URL (comma-separated) replaces the default endpoint list
+MAVLINK_URLS = [url for url in os.environ.get("PME_MAVLINK2REST_URL", "").split(",") if url]
+MAVLINK = Mavlink2RestClient(MAVLINK_URLS or None)
+
+# Latest GPS fix and vehicle water temperature, polled in the background so
+# tagging a sample needs no HTTP calls
+TELEMETRY = TelemetryCache(MAVLINK)
+
+# Prometheus metrics for /metrics. Acquisition metrics are recorded and
+# rendered wherever acquisition runs; web metrics in the web process
+ACQUISITION_METRICS = Registry()
+SAMPLE_STAGE_SECONDS = ACQUISITION_METRICS.histogram(
+    "pme_sample_stage_seconds", "Time spent in each stage of a sample cycle", labels=("stage",)
+)
+SAMPLES = ACQUISITION_METRICS.counter("pme_samples_total", "Sensor readings by outcome", labels=("sensor", "result"))
+SAMPLE_OVERRUNS = ACQUISITION_METRICS.counter(
+    "pme_sample_cycle_overruns_total", "Polled cycles that took longer than the sampling interval"
+)
+SAMPLE_POLLS_SKIPPED = ACQUISITION_METRICS.counter(
+    "pme_sample_polls_skipped_total", "Polls skipped because an earlier cycle overran", labels=("sensor",)
+)
+SAMPLE_JITTER_SECONDS = ACQUISITION_METRICS.histogram(
+    "pme_sample_jitter_seconds", "How late polled cycles started relative to their scheduled time", labels=("sensor",)
+)
+for metric in (LOG_WRITER.write_seconds, LOG_WRITER.fsync_seconds, MAVLINK.request_seconds, TELEMETRY.poll_seconds):
+    ACQUISITION_METRICS.register(metric)
+
+WEB_METRICS = Registry()
+HTTP_REQUEST_SECONDS = WEB_METRICS.histogram(
+    "pme_http_request_seconds", "Time to handle a request, by endpoint (streamed bodies excluded)", labels=("endpoint",)
+)
+DATA_ROWS_SCANNED = WEB_METRICS.counter("pme_data_rows_scanned_total", "Stored rows or rollup buckets read for /api/data")
+DATA_ROWS_RETURNED = WEB_METRICS.counter("pme_data_rows_returned_total", "Rows returned by /api/data")
+STATS_QUERIES = WEB_METRICS.counter(
+    "pme_stats_queries_total", "/api/stats queries by source (rolling windows or rollups)", labels=("source",)
+)
+
+@ACQUISITION_METRICS.collector
+def collect_acquisition_stats():
+    readers = [({"sensor": str(sensor["sensor_id"])}, sensor["reader"]) for sensor in SENSORS.stats()]
+    writer = LOG_WRITER.stats()
+    mavlink = MAVLINK.stats()
+    retention = RETENTION.stats()
+    
+    def per_sensor(key, convert=int):
+        return [(labels, convert(reader[key])) for labels, reader in readers]
+    
+    return [
+        ("pme_serial_open", "gauge", "Whether the sensor's serial port is open", per_sensor("open")),
+        ("pme_serial_reconnects_total", "counter", "Times the serial port was (re)opened", per_sensor("reconnects")),
+        ("pme_serial_records_total", "counter", "Readings parsed from the serial port", per_sensor("records")),
+        ("pme_serial_rejected_lines_total", "counter", "Serial lines that did not parse as a reading", per_sensor("rejected_lines")),
+        ("pme_serial_overflows_total", "counter", "Serial input discarded for lack of a line break", per_sensor("overflows")),
+        ("pme_serial_records_dropped_total", "counter", "Parsed readings dropped because nobody read them", per_sensor("records_dropped")),
+        ("pme_log_rows_written_total", "counter", "Rows written to the logs", writer["rows_written"]),
+        ("pme_log_rows_dropped_total", "counter", "Rows dropped because the writer queue was full", writer["rows_dropped"]),
+        ("pme_log_queue_depth", "gauge", "Rows waiting for the log writer", writer["queue_depth"]),
+        ("pme_log_rotations_total", "counter", "Log rotations", writer["rotations"]),
+        ("pme_log_write_errors_total", "counter", "Failed log writes and fsyncs", writer["write_errors"]),
+        ("pme_mavlink_requests_total", "counter", "Mavlink2Rest requests by result",
+         [({"result": "ok"}, mavlink["requests_ok"]), ({"result": "failed"}, mavlink["requests_failed"]),
+          ({"result": "rejected"}, mavlink["requests_rejected"])]),
+        ("pme_mavlink_sends_dropped_total", "counter", "DO_T/DO_O sends dropped because the queue was full", mavlink["sends_dropped"]),
+        ("pme_telemetry_poll_failures_total", "counter", "Vehicle telemetry polls that returned nothing", TELEMETRY.poll_failures),
+        ("pme_log_dir_bytes", "gauge", "Bytes taken by the logs, backups and rollup archives", retention["disk_usage_bytes"]),
+        ("pme_retention_segments_compacted_total", "counter", "Log segments compacted into rollups", retention["segments_compacted"]),
+        ("pme_retention_archives_deleted_total", "counter", "Rollup archives deleted to stay under the size cap", retention["archives_deleted"]),
+        ("pme_retention_bytes_reclaimed_total", "counter", "Bytes freed by the retention policy", retention["bytes_reclaimed"]),
+    ]
+
+@WEB_METRICS.collector
+def collect_web_stats():
+    cache = DATA_CACHE.stats()
+    stream = BROADCASTER.stats()
+    acquisition = ACQUISITION.stats()
+    return [
+        ("pme_store_rows", "gauge", "Rows in the current log and every rotated segment", len(STORE)),
+        ("pme_data_cache_lookups_total", "counter", "/api/data cache lookups by result",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"]), ({"result": "not_modified"}, cache["not_modified"])]),
+        ("pme_stream_subscribers", "gauge", "Connected /api/stream clients", stream["subscribers"]),
+        ("pme_stream_rejected_total", "counter", "/api/stream clients turned away at the subscriber cap", stream["rejected"]),
+        ("pme_acquisition_up", "gauge", "Whether acquisition is running", int(acquisition["running"])),
+        ("pme_acquisition_restarts_total", "counter", "Acquisition process restarts", acquisition.get("restarts", 0)),
+    ]
+
+def prepare_logs():
+    """Create the log directory and open (or build once from the CSV) the binary log."""
     try:
-        if not LOG_FILE.exists():
-            print(f"CSV file does not exist yet, will be created with headers: {CSV_HEADERS}")
-            return True
-            
-        # Read existing headers
-        with open(LOG_FILE, 'r') as f:
-            reader = csv.reader(f)
-            existing_headers = next(reader, [])
-            
-        # Check if all required headers are present
-        missing_headers = [h for h in CSV_HEADERS if h not in existing_headers]
-        
-        if missing_headers:
-            print(f"Found missing headers in CSV: {missing_headers}")
-            
-            # Read all existing data
-            with open(LOG_FILE, 'r') as f:
-                reader = csv.DictReader(f)
-                existing_data = list(reader)
-            
-            # Write back with all headers
-            with open(LOG_FILE, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-                writer.writeheader()
-                
-                # Write existing data, adding None for missing columns
-                for row in existing_data:
-                    for header in missing_headers:
-                        row[header] = None
-                    writer.writerow(row)
-                    
-            print(f"Updated CSV headers to include: {missing_headers}")
-            return True
-            
-        return True
+        os.makedirs(str(LOG_DIR), exist_ok=True)
+        logger.info("Using log directory %s (writable: %s)", LOG_DIR, os.access(str(LOG_DIR), os.W_OK))
+        # The sensor loops keep the binary log current from here on
+        start = time.perf_counter()
+        rows = STORE.load(str(LOG_FILE))
+        logger.info("Opened logs with %d rows in %.2f s", rows, time.perf_counter() - start)
     except Exception as e:
-        print(f"Error checking/updating CSV headers: {e}")
-        return False
+        logger.error("Error opening the logs in %s: %s", LOG_DIR, e)
 
-# Create logs directory if it doesn't exist (for safety)
-try:
-    os.makedirs(str(LOG_DIR), exist_ok=True)
-    print(f"Using log directory: {LOG_DIR}")
-    print(f"Log directory exists: {LOG_DIR.exists()}")
-    print(f"Log directory is writable: {os.access(str(LOG_DIR), os.W_OK)}")
-    print(f"Log file will be stored at: {LOG_FILE}")
-    
-    # Check and update CSV headers if needed
-    if not ensure_csv_headers():
-        print("Warning: Failed to ensure CSV headers are correct")
-except Exception as e:
-    print(f"Error creating log directory: {e}")
-
-# List all directories in /app to help diagnose
-try:
-    print("Contents of /app directory:")
-    for item in os.listdir("/app"):
-        item_path = os.path.join("/app", item)
-        if os.path.isdir(item_path):
-            print(f"  - {item}/ (directory)")
-        else:
-            print(f"  - {item} (file)")
-except Exception as e:
-    print(f"Error listing /app directory: {e}")
-
-# Load serial port configuration if exists
+# Load serial port configuration if exists. {"port": ...} is the
+# single-sensor format; "sensors" lists every sensor's ID and port.
 def load_serial_config():
-    global SERIAL_PORT
+    global SENSOR_PORTS
     try:
         if os.path.exists(SERIAL_CONFIG_FILE):
             with open(SERIAL_CONFIG_FILE, 'r') as f:
                 config = json.load(f)
-                saved_port = config.get('port')
-                if saved_port and os.path.exists(saved_port):
-                    SERIAL_PORT = saved_port
-                    print(f"Loaded serial port from config: {SERIAL_PORT}")
+            saved = config.get('sensors') or [{'id': 0, 'port': config.get('port')}]
+            ports = {}
+            for sensor in saved:
+                sensor_id, port = int(sensor['id']), sensor.get('port')
+                if port and os.path.exists(port):
+                    ports[sensor_id] = port
+                    logger.info("Loaded serial port for sensor %d from config: %s", sensor_id, port)
+                elif sensor_id == 0:
+                    ports[0] = DEFAULT_SERIAL_PORT
+                    logger.warning("Saved port %s not available, using default: %s", port, DEFAULT_SERIAL_PORT)
                 else:
-                    print(f"Saved port {saved_port} not available, using default: {DEFAULT_SERIAL_PORT}")
+                    # Keep it configured; its loop retries until the device appears
+                    ports[sensor_id] = port
+                    logger.warning("Saved port %s for sensor %d not available yet", port, sensor_id)
+            SENSOR_PORTS = ports
     except Exception as e:
-        print(f"Error loading serial config: {e}")
+        logger.error("Error loading serial config: %s", e)
 
 # Save serial port configuration
-def save_serial_config(port):
+def save_serial_config(ports):
+    config = {
+        'port': ports.get(0),
+        'sensors': [{'id': sensor_id, 'port': port} for sensor_id, port in sorted(ports.items())],
+    }
     try:
         with open(SERIAL_CONFIG_FILE, 'w') as f:
-            json.dump({'port': port}, f)
-        print(f"Saved serial port configuration: {port}")
+            json.dump(config, f)
+        logger.info("Saved serial port configuration: %s", config['sensors'])
+        return True
+    except Exception as e:
+        logger.error("Error saving serial config: %s", e)
+        return False
+
+def validate_sampling_config(config):
+    """Merge a partial sampling config over the current one and validate it.
+    
+    Returns (config, error); error is None if the config is usable.
+    """
+    merged = dict(SAMPLING)
+    merged.update({k: v for k, v in config.items() if k in DEFAULT_SAMPLING})
+    
+    if merged['mode'] not in SAMPLING_MODES:
+        return None, f"mode must be one of {', '.join(SAMPLING_MODES)}"
+    try:
+        merged['interval'] = float(merged['interval'])
+    except (TypeError, ValueError):
+        return None, "interval must be a number of seconds"
+    if not MIN_SAMPLING_INTERVAL <= merged['interval'] <= MAX_SAMPLING_INTERVAL:
+        return None, f"interval must be between {MIN_SAMPLING_INTERVAL} and {MAX_SAMPLING_INTERVAL} seconds"
+    if merged['schedule'] not in SCHEDULE_POLICIES:
+        return None, f"schedule must be one of {', '.join(SCHEDULE_POLICIES)}"
+    for key in ('start_command', 'stop_command'):
+        if not isinstance(merged[key], str):
+            return None, f"{key} must be a string"
+        merged[key] = merged[key].strip()
+    return merged, None
+
+# Load sampling configuration if exists
+def load_sampling_config():
+    global SAMPLING
+    try:
+        if os.path.exists(SAMPLING_CONFIG_FILE):
+            with open(SAMPLING_CONFIG_FILE, 'r') as f:
+                config, error = validate_sampling_config(json.load(f))
+            if error:
+                logger.warning("Ignoring invalid sampling config: %s", error)
+            else:
+                SAMPLING = config
+                logger.info("Loaded sampling config: %s", SAMPLING)
+    except Exception as e:
+        logger.error("Error loading sampling config: %s", e)
+
+# Save sampling configuration
+def save_sampling_config(config):
+    try:
+        with open(SAMPLING_CONFIG_FILE, 'w') as f:
+            json.dump(config, f)
+        logger.info("Saved sampling configuration: %s", config)
+        return True
+    except Exception as e:
+        logger.error("Error saving sampling config: %s", e)
+        return False
+
+def validate_retention_config(changes):
+    """Merge changes into the current retention config. Returns (config, error)."""
+    if not isinstance(changes, dict):
+        return None, "retention config must be an object"
+    merged = dict(RETENTION.config)
+    merged.update({key: value for key, value in changes.items() if key in DEFAULT_RETENTION})
+    for key in ('raw_days', 'max_total_mb'):
+        value = merged[key]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            return None, f"{key} must be a number of at least 0"
+    if merged['compact_resolution'] not in COMPACT_RESOLUTIONS:
+        return None, f"compact_resolution must be one of {', '.join(map(str, COMPACT_RESOLUTIONS))} seconds"
+    return merged, None
+
+def load_retention_config():
+    try:
+        if os.path.exists(RETENTION_CONFIG_FILE):
+            with open(RETENTION_CONFIG_FILE, 'r') as f:
+                config, error = validate_retention_config(json.load(f))
+            if error:
+                logger.warning("Ignoring invalid retention config: %s", error)
+            else:
+                RETENTION.update(config)
+                logger.info("Loaded retention config: %s", config)
+    except Exception as e:
+        logger.error("Error loading retention config: %s", e)
+
+def save_retention_config(config):
+    try:
+        with open(RETENTION_CONFIG_FILE, 'w') as f:
+            json.dump(config, f)
+        logger.info("Saved retention configuration: %s", config)
         return True
     except Exception as e:
-        print(f"Error saving serial config: {e}")
+        logger.error("Error saving retention config: %s", e)
         return False
 
 # Find available serial ports
@@ -147,467 +385,629 @@ def find_serial_ports():
                     'name': f"{os.path.basename(device)}"
                 })
             except Exception as e:
-                print(f"Error getting info for device {device}: {e}")
+                logger.error("Error getting info for device %s: %s", device, e)
     
     # Sort ports by path
     ports.sort(key=lambda x: x['path'])
     
     return ports
 
-# Initialize or reopen serial connection
-def initialize_serial_connection():
-    global serial_connection
-    
-    # Close existing connection if open
-    if serial_connection and serial_connection.is_open:
-        try:
-            serial_connection.close()
-            print(f"Closed existing serial connection")
-        except Exception as e:
-            print(f"Error closing existing serial connection: {e}")
+def store_measurement(temperature, do, q, captured=None, sensor_id=0):
+    """Tag, store, publish and forward one reading.
     
-    # Open new connection
-    try:
-        serial_connection = serial.Serial(
-            port=SERIAL_PORT,
-            baudrate=BAUD_RATE,
-            bytesize=serial.EIGHTBITS,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            timeout=1
-        )
-        print(f"Serial port {SERIAL_PORT} opened successfully.")
-        return True
-    except serial.SerialException as e:
-        print(f"Error opening serial port {SERIAL_PORT}: {e}")
-        serial_connection = None
-        return False
-
-def clean_response(response):
-    """Clean and validate the sensor response string."""
-    # Debug the raw input
-    print(f"Cleaning response: '{response}'")
+    `captured` is the time.monotonic() the reading arrived (default: now).
+    """
+    # Date the reading when it arrived rather than when it got here
+    now = time.monotonic()
+    if captured is None:
+        captured = now
+    measurement = {
+        "timestamp": (datetime.now() - timedelta(seconds=now - captured)).isoformat(),
+        "temperature": temperature,
+        "do": do,
+        "q": q,
+        "monotonic": round(captured, 6),
+        "sensor_id": sensor_id
+    }
     
-    # Remove leading/trailing whitespace and any extra linebreaks
-    lines = [line.strip() for line in response.split('\n') if line.strip()]
+    # Add the cached GPS position and vehicle temperature
+    start = time.perf_counter()
+    TELEMETRY.tag(measurement)
+    SAMPLE_STAGE_SECONDS.labels("tag").observe(time.perf_counter() - start)
     
-    if not lines:
-        print("No valid lines found in response")
-        return None
+    # Only append if values are reasonable
+    if not (-10 <= temperature <= 50 and 0 <= do <= 20 and 0 <= q <= 1):
+        SAMPLES.labels(sensor_id, "out_of_range").inc()
+        logger.warning("Measurement values out of expected range, skipping: %s", measurement, extra=RATE_LIMITED)
+        return
     
-    # Print all lines for debugging
-    if len(lines) > 1:
-        print(f"Multiple lines detected in response ({len(lines)})")
-        for i, line in enumerate(lines):
-            print(f"  Line {i+1}: '{line}'")
+    logger.debug("Stored measurement: %s", measurement)
+    # Stream subscribers are notified by the store once the row is written
+    start = time.perf_counter()
+    if not LOG_WRITER.submit(measurement):
+        logger.warning("Log writer queue full, measurement dropped from log", extra=RATE_LIMITED)
+    SAMPLE_STAGE_SECONDS.labels("log_enqueue").observe(time.perf_counter() - start)
+    SAMPLES.labels(sensor_id, "stored").inc()
     
-    # Take only the last complete response if multiple are received
-    last_line = lines[-1]
+    # Send values to Mavlink2Rest with sensor names matching BlueRobotics convention
+    # The exact sensor name is critical for proper logging in BlueOS.
+    # DO_T for DO Temperature, DO_O for Dissolved Oxygen; the sender
+    # thread only sends DO_O if DO_T succeeded. At high sample rates the
+    # values are forwarded at most once per MAVLINK_SEND_INTERVAL. Other
+    # sensors than sensor 0 get their ID appended (DO_T1, DO_O1, ...).
+    if now - last_mavlink_send.get(sensor_id, 0.0) >= MAVLINK_SEND_INTERVAL:
+        last_mavlink_send[sensor_id] = now
+        suffix = str(sensor_id) if sensor_id else ""
+        if not MAVLINK.send_async([("DO_T" + suffix, temperature), ("DO_O" + suffix, do)]):
+            logger.warning("Mavlink2Rest send queue full, values not sent", extra=RATE_LIMITED)
+
+def read_sensor_loop(channel):
+    """Sample one sensor according to SAMPLING and store each reading, until it is stopped."""
+    sensor, sensor_id = channel.reader, channel.id
     
-    # Basic validation - should contain multiple commas for CSV format
-    if ',' not in last_line:
-        print(f"Invalid response format (no commas): '{last_line}'")
-        return None
+    # Command to send when leaving continuous mode, if the sensor was told to stream
+    streaming_stop_command = None
     
-    # The response should have at least 5 comma-separated values
-    parts = last_line.split(',')
-    if len(parts) < 5:
-        print(f"Invalid response format (not enough values): '{last_line}'")
-        return None
+    while not channel.stopping.is_set():
+        # Ensure serial connection is open
+        if not sensor.is_open:
+            streaming_stop_command = None
+            if not sensor.open():
+                logger.warning("Still unable to open serial connection for sensor %d. Retrying in 10 seconds...", sensor_id)
+                channel.stopping.wait(10)
+                continue
         
-    return last_line
-
-def write_to_csv(measurement):
-    """Write measurement to CSV file with file rotation to limit size."""
-    try:
-        log_file_path = str(LOG_FILE)
-        log_dir = os.path.dirname(log_file_path)
+        config = SAMPLING
         
-        # Debug info
-        print(f"Writing to log file: {log_file_path}")
-        print(f"Log directory: {log_dir}")
-        print(f"Directory exists: {os.path.exists(log_dir)}")
-        print(f"Directory writable: {os.access(log_dir, os.W_OK)}")
+        if config['mode'] == 'continuous':
+            if streaming_stop_command is None:
+                if config['start_command']:
+                    sensor.write((config['start_command'] + "\r\n").encode('utf-8'))
+                streaming_stop_command = config['stop_command']
+                logger.info("Sampling sensor %d in continuous mode (start command: '%s')", sensor_id, config['start_command'])
+            
+            # The sensor pushes readings on its own; store every parsed record
+            received = sensor.read_record(1.0)
+            if received is not None:
+                captured, record = received
+                store_measurement(*record, captured=captured, sensor_id=sensor_id)
+            continue
         
-        # Ensure the log directory exists
-        os.makedirs(log_dir, exist_ok=True)
+        if streaming_stop_command is not None:
+            if streaming_stop_command:
+                sensor.write((streaming_stop_command + "\r\n").encode('utf-8'))
+            streaming_stop_command = None
+            channel.schedule = None
+            logger.info("Left continuous mode, polling sensor %d", sensor_id)
         
-        file_exists = os.path.exists(log_file_path)
-        print(f"Log file exists before write: {file_exists}")
+        interval = config['interval']
         
-        # Check if we need to rotate the file based on size (only if it exists)
-        if file_exists:
-            try:
-                file_size_mb = os.path.getsize(log_file_path) / (1024 * 1024)  # Convert to MB
-                print(f"Current log file size: {file_size_mb:.2f} MB")
-                
-                # If file is too big, rotate it
-                if file_size_mb >= MAX_CSV_SIZE_MB:
-                    print(f"Rotating CSV file (current size: {file_size_mb:.2f} MB)")
-                    
-                    # Create a backup filename with timestamp
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    backup_file = os.path.join(log_dir, f"sensor_data_backup_{timestamp}.csv")
-                    
-                    # Rename the current file as backup
-                    os.rename(log_file_path, backup_file)
-                    print(f"Previous data backed up to {backup_file}")
-                    
-                    # File no longer exists after rename, so update flag
-                    file_exists = False
-            except Exception as rotate_error:
-                print(f"Error rotating CSV file: {rotate_error}")
-                # If rotation fails, just continue with append
+        # Polls are due at fixed monotonic deadlines, so the time a cycle
+        # takes does not push the following ones back. A new interval or
+        # policy, or coming back from continuous mode, starts a new grid.
+        schedule = channel.schedule
+        if schedule is None or (schedule.interval, schedule.policy) != (interval, config['schedule']):
+            schedule = channel.schedule = IntervalScheduler(interval, config['schedule'])
         
-        # Append the new measurement (or create new file if needed)
-        with open(log_file_path, 'a', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(measurement)
-            # Flush to ensure data is written immediately
-            f.flush()
-            os.fsync(f.fileno())
+        # A config change through /api/sampling cuts the wait short
+        skipped = schedule.skipped
+        lateness = schedule.wait(channel.changed)
+        if lateness is None:
+            channel.changed.clear()
+            continue
+        SAMPLE_JITTER_SECONDS.labels(sensor_id).observe(lateness)
+        if schedule.skipped > skipped:
+            SAMPLE_POLLS_SKIPPED.labels(sensor_id).inc(schedule.skipped - skipped)
+        start_time = time.monotonic()
         
-        # Verify file was written
-        print(f"Log file exists after write: {os.path.exists(log_file_path)}")
-        if os.path.exists(log_file_path):
-            print(f"Log file size after write: {os.path.getsize(log_file_path)} bytes")
+        try:
+            # Send the command and wait for the first reading parsed after it;
+            # echoes and other non-reading lines are skipped by the parser
+            start = time.perf_counter()
+            received = sensor.command(SENSOR_COMMAND, min(RESPONSE_TIMEOUT, interval))
+            SAMPLE_STAGE_SECONDS.labels("serial").observe(time.perf_counter() - start)
             
-    except Exception as e:
-        print(f"Error writing to CSV: {e}")
-
-def send_to_mavlink(name, value):
-    """Send a named value float to Mavlink2Rest."""
-    # Try multiple possible endpoints
-    endpoints = [
-        'http://host.docker.internal:6040/v1/mavlink',
-        'http://localhost:6040/v1/mavlink',
-        'http://127.0.0.1:6040/v1/mavlink',
-        'http://192.168.2.2:6040/v1/mavlink',
-        'http://blueos.local:6040/v1/mavlink'
-    ]
+            if received is None:
+                SAMPLES.labels(sensor_id, "no_response").inc()
+                logger.warning("No response from sensor %d within %s s", sensor_id, min(RESPONSE_TIMEOUT, interval), extra=RATE_LIMITED)
+            else:
+                captured, record = received
+                logger.debug("Reading from sensor %d: temperature=%s, do=%s, q=%s", sensor_id, *record)
+                store_measurement(*record, captured=captured, sensor_id=sensor_id)
+        except Exception as e:
+            SAMPLES.labels(sensor_id, "error").inc()
+            logger.error("Error processing measurement from sensor %d: %s", sensor_id, e, extra=RATE_LIMITED)
+        
+        elapsed = time.monotonic() - start_time
+        SAMPLE_STAGE_SECONDS.labels("cycle").observe(elapsed)
+        if elapsed > interval:
+            SAMPLE_OVERRUNS.inc()
+
+# One sampling loop per configured sensor, all storing through the same
+# telemetry cache and log writer
+SENSORS = SensorManager(BAUD_RATE, read_sensor_loop)
+
+def start_acquisition():
+    """Start logging, vehicle telemetry and the sensor loops in this process.
     
-    # Create name array exactly as shown in the documentation
-    name_array = []
-    for i in range(10):
-        if i < len(name):
-            name_array.append(name[i])
-        else:
-            name_array.append('\u0000')
-    
-    payload = {
-        "header": {
-            "system_id": 255,
-            "component_id": 0,
-            "sequence": 0
-        },
-        "message": {
-            "type": "NAMED_VALUE_FLOAT",
-            "time_boot_ms": 0,
-            "value": value,
-            "name": name_array
-        }
-    }
+    Returns straight away: the logs are opened in the background, and
+    readings taken meanwhile wait in the log writer's queue.
+    """
+    # At exit, write everything queued, then checkpoint the rollups
+    atexit.register(STORE.save_checkpoint)
+    atexit.register(LOG_WRITER.stop)
     
-    # Try each endpoint
-    for endpoint in endpoints:
-        try:
-            response = requests.post(endpoint, json=payload, timeout=2.0)
-            if response.status_code == 200:
-                print(f"Successfully sent {name}={value} to Mavlink2Rest via {endpoint}")
-                return True
-            else:
-                continue  # Try next endpoint
-        except Exception:
-            continue  # Try next endpoint
-    
-    # Only print one error message if all endpoints fail
-    print(f"Could not send {name}={value} to any Mavlink2Rest endpoint")
-    return False
-
-def get_vehicle_temperature():
-    """Fetch vehicle water temperature from Mavlink2Rest SCALED_PRESSURE2 message."""
-    endpoints = [
-        'http://host.docker.internal:6040/v1/mavlink/vehicles/1/components/1/messages/SCALED_PRESSURE2',
-        'http://localhost:6040/v1/mavlink/vehicles/1/components/1/messages/SCALED_PRESSURE2',
-        'http://127.0.0.1:6040/v1/mavlink/vehicles/1/components/1/messages/SCALED_PRESSURE2',
-        'http://192.168.2.2:6040/v1/mavlink/vehicles/1/components/1/messages/SCALED_PRESSURE2',
-        'http://blueos.local:6040/v1/mavlink/vehicles/1/components/1/messages/SCALED_PRESSURE2'
-    ]
+    def open_logs():
+        prepare_logs()
+        LOG_WRITER.start()
+    threading.Thread(target=open_logs, name="log-loader", daemon=True).start()
     
-    for endpoint in endpoints:
-        try:
-            response = requests.get(endpoint, timeout=2.0)
-            if response.status_code == 200:
-                data = response.json()
-                if 'message' in data and 'temperature' in data['message']:
-                    # Convert temperature from centidegree Celsius to Celsius
-                    temp_c = data['message']['temperature'] / 100.0
-                    return temp_c
-        except Exception:
-            continue
+    MAVLINK.start()
+    TELEMETRY.start()
+    
+    # Load saved serial ports and sampling config, then start one sampling
+    # thread per sensor (daemonized so they stop with the process)
+    load_serial_config()
+    load_sampling_config()
+    for sensor_id, port in sorted(SENSOR_PORTS.items()):
+        SENSORS.start(sensor_id, port)
     
+    # Waits for the logs to be opened before its first pass
+    load_retention_config()
+    RETENTION.start()
+
+def exit_on_sigterm(signum, frame):
+    """Exit normally so the atexit hooks run; a repeated SIGTERM cannot interrupt them."""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(0)
+
+def run_acquisition(conn):
+    """Entry point of the acquisition process (production mode)."""
+    # Exit normally on SIGTERM so the log writer's atexit hook flushes
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    start_acquisition()
+    serve_control(conn, CONTROL)
+
+def schedule_status():
+    """Jitter and skipped polls of each sensor's polled-mode schedule."""
+    sensors = []
+    for channel in SENSORS:
+        status = {"sensor_id": channel.id}
+        if channel.schedule is not None:
+            status.update(channel.schedule.stats())
+        sensors.append(status)
+    return {"mode": SAMPLING["mode"], "policy": SAMPLING["schedule"], "sensors": sensors}
+
+def serial_status():
+    """Port and reader counters of sensor 0 (or the first sensor) plus every sensor."""
+    sensors = SENSORS.stats()
+    primary = sensors[0] if sensors else {"port": None, "reader": None}
+    return {"serial_port": primary["port"], "baud_rate": BAUD_RATE, "reader": primary["reader"], "sensors": sensors}
+
+def check_port(port, sensor_id):
+    """Error message if `port` cannot be given to sensor_id, else None."""
+    if not os.path.exists(port):
+        return f"Port {port} does not exist"
+    owner = SENSORS.owner(port)
+    if owner is not None and owner != sensor_id:
+        return f"Port {port} is already used by sensor {owner}"
     return None
 
-def get_gps_position():
-    """Fetch GPS position from Mavlink2Rest GLOBAL_POSITION_INT message."""
-    try:
-        # Try to get the system ID first
-        system_id = 1  # Default system ID
-        try:
-            response = requests.get('http://host.docker.internal:6040/v1/mavlink/vehicles', timeout=2.0)
-            if response.status_code == 200:
-                vehicles = response.json()
-                if vehicles and len(vehicles) > 0:
-                    system_id = vehicles[0]  # Use the first vehicle ID
-        except Exception:
-            pass
-
-        # Try to get GPS position using the system ID
-        endpoint = f'http://host.docker.internal:6040/v1/mavlink/vehicles/{system_id}/components/1/messages/GLOBAL_POSITION_INT'
-        response = requests.get(endpoint, timeout=2.0)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'message' in data and 'lat' in data['message'] and 'lon' in data['message']:
-                # Convert lat/lon from int32 to degrees (divide by 1e7)
-                lat = data['message']['lat'] / 1e7
-                lon = data['message']['lon'] / 1e7
-                return {'lat': lat, 'lon': lon}
-    except Exception as e:
-        print(f"Error getting GPS position: {e}")
+def switch_serial_port(new_port, sensor_id=0):
+    """Switch a sensor to another serial port. Returns (response body, HTTP status)."""
+    global SENSOR_PORTS
     
-    return None
+    channel = SENSORS.get(sensor_id)
+    if channel is None:
+        return {"success": False, "message": f"No sensor {sensor_id}"}, 404
+    error = check_port(new_port, sensor_id)
+    if error:
+        return {"success": False, "message": error}, 400
+    
+    # Reopen the sensor's reader on the new port (the serial lock is only
+    # taken while the port is reopened)
+    old_port = channel.port
+    if channel.reader.open(new_port):
+        SENSOR_PORTS = {**SENSOR_PORTS, sensor_id: new_port}
+        # Save the configuration
+        if save_serial_config(SENSOR_PORTS):
+            return {"success": True, "message": f"Switched from {old_port} to {new_port}"}, 200
+        return {"success": True, "message": f"Switched to {new_port} but failed to save configuration"}, 200
+    
+    # Revert to old port if new one fails
+    channel.reader.open(old_port)  # Try to reopen the old port
+    return {"success": False, "message": f"Failed to connect to {new_port}, reverted to {old_port}"}, 500
 
-def read_sensor_loop():
-    """Continuously poll the sensor every 5 seconds and update the global data."""
-    global data, serial_connection
+def add_sensor(sensor_id, port):
+    """Start sampling another sensor (or move an existing one). Returns (response body, HTTP status)."""
+    global SENSOR_PORTS
     
-    # Load saved serial port config
-    load_serial_config()
+    if not isinstance(sensor_id, int) or isinstance(sensor_id, bool) or not 0 <= sensor_id <= MAX_SENSOR_ID:
+        return {"success": False, "message": f"sensor_id must be an integer from 0 to {MAX_SENSOR_ID}"}, 400
+    if SENSORS.get(sensor_id) is not None:
+        return switch_serial_port(port, sensor_id)
+    error = check_port(port, sensor_id)
+    if error:
+        return {"success": False, "message": error}, 400
     
-    # Initialize serial connection
-    if not initialize_serial_connection():
-        print("Failed to initialize serial connection. Will retry periodically.")
+    SENSORS.start(sensor_id, port)
+    SENSOR_PORTS = {**SENSOR_PORTS, sensor_id: port}
+    if not save_serial_config(SENSOR_PORTS):
+        return {"success": True, "message": f"Sensor {sensor_id} added on {port} but failed to save configuration"}, 200
+    return {"success": True, "message": f"Sensor {sensor_id} added on {port}"}, 200
+
+def remove_sensor(sensor_id):
+    """Stop sampling a sensor. Returns (response body, HTTP status)."""
+    global SENSOR_PORTS
     
-    while True:
-        # Ensure serial connection is open
-        with SERIAL_LOCK:
-            if not serial_connection or not serial_connection.is_open:
-                if not initialize_serial_connection():
-                    print("Still unable to open serial connection. Retrying in 10 seconds...")
-                    time.sleep(10)
-                    continue
-            
-            start_time = time.time()
-            
-            # Clear any pending data in the buffer
-            serial_connection.reset_input_buffer()
-            
-            # Send the command
-            try:
-                serial_connection.write("MDOT\r\n".encode('utf-8'))
-                print("wrote MDOT")
-            except Exception as e:
-                print("Error writing to serial port:", e)
-                # Try to reinitialize the connection
-                initialize_serial_connection()
-                time.sleep(5)
-                continue
-            
-            # Allow sensor time to reply - increase this a bit for more reliable readings
-            time.sleep(1.0)
-            
-            try:
-                # Try reading data multiple times if necessary
-                max_read_attempts = 3
-                read_attempt = 0
-                raw_response = ""
-                
-                while read_attempt < max_read_attempts:
-                    read_attempt += 1
-                    
-                    # Read what's available
-                    bytes_waiting = serial_connection.in_waiting
-                    if bytes_waiting > 0:
-                        raw_response += serial_connection.read(bytes_waiting).decode('utf-8', errors='replace')
-                    else:
-                        # If no data available and not first attempt, wait a bit more
-                        if read_attempt > 1:
-                            print(f"No data in serial buffer (attempt {read_attempt}/{max_read_attempts})")
-                        time.sleep(0.5)
-                    
-                    # Check if we have what looks like a valid response
-                    if ',' in raw_response and len(raw_response.strip()) > 5:
-                        break
-            
-                # Debug raw response to help diagnose issues
-                print(f"Raw response ({len(raw_response)} bytes): {raw_response.strip()}")
-                
-                cleaned_response = clean_response(raw_response)
-                if not cleaned_response:
-                    print("Invalid or empty response received, skipping.")
-                    continue
-                
-                print(f"Cleaned response: {cleaned_response}")
-                
-                parts = [p.strip() for p in cleaned_response.split(',')]
-                if len(parts) >= 5:
-                    try:
-                        temperature = float(parts[2])
-                        do = float(parts[3])
-                        q = float(parts[4])
-                        
-                        # Get GPS position
-                        gps_pos = get_gps_position()
-                        
-                        measurement = {
-                            "timestamp": datetime.now().isoformat(),
-                            "temperature": temperature,
-                            "do": do,
-                            "q": q,
-                            "vehicle_temperature": None,  # Will be implemented later
-                            "latitude": gps_pos['lat'] if gps_pos else None,
-                            "longitude": gps_pos['lon'] if gps_pos else None
-                        }
-                        
-                        with DATA_LOCK:
-                            # Only append if values are reasonable
-                            if -10 <= temperature <= 50 and 0 <= do <= 20 and 0 <= q <= 1:
-                                data.append(measurement)
-                                if len(data) > 60:
-                                    data = data[-60:]
-                                print("Stored measurement:", measurement)
-                                write_to_csv(measurement)
-                                
-                                # Send values to Mavlink2Rest with sensor names matching BlueRobotics convention
-                                # The exact sensor name is critical for proper logging in BlueOS
-                                send_success = send_to_mavlink("DO_T", temperature)  # DO_T for DO Temperature
-                                if send_success:
-                                    # Only try sending the next value if the first one succeeded
-                                    send_to_mavlink("DO_O", do)  # DO_O for Dissolved Oxygen
-                            else:
-                                print("Measurement values out of expected range, skipping")
-                    except (ValueError, IndexError) as e:
-                        print(f"Error parsing values from response: {e}")
-                        print(f"Parts: {parts}")
-                        continue
-                else:
-                    print("Invalid response format")
-                
-            except Exception as e:  
-                print("Error processing measurement:", e)
-            
-            # Calculate remaining time in the 5-second cycle
-            elapsed = time.time() - start_time
-            sleep_time = max(0, 5 - elapsed)
-            time.sleep(sleep_time)
+    if SENSORS.get(sensor_id) is None:
+        return {"success": False, "message": f"No sensor {sensor_id}"}, 404
+    if len(SENSORS) == 1:
+        return {"success": False, "message": "The last sensor cannot be removed; switch its port instead"}, 400
+    
+    SENSORS.stop(sensor_id)
+    SENSOR_PORTS = {k: v for k, v in SENSOR_PORTS.items() if k != sensor_id}
+    if not save_serial_config(SENSOR_PORTS):
+        return {"success": True, "message": f"Sensor {sensor_id} removed but failed to save configuration"}, 200
+    return {"success": True, "message": f"Sensor {sensor_id} removed"}, 200
 
-# Start the sensor polling thread (daemonized so it stops with the main app)
-sensor_thread = threading.Thread(target=read_sensor_loop, daemon=True)
-sensor_thread.start()
+def update_sampling(changes):
+    """Validate and apply a sampling config change. Returns (response body, HTTP status)."""
+    global SAMPLING
+    
+    config, error = validate_sampling_config(changes)
+    if error:
+        return {"success": False, "message": error}, 400
+    
+    # The sensor loops pick up the new settings on their next cycle
+    SAMPLING = config
+    SENSORS.notify()
+    if not save_sampling_config(config):
+        return {"success": True, "message": "Sampling updated but failed to save configuration", "config": config}, 200
+    return {"success": True, "message": "Sampling updated", "config": config}, 200
+
+def update_retention(changes):
+    """Validate and apply a retention policy change. Returns (response body, HTTP status)."""
+    config, error = validate_retention_config(changes)
+    if error:
+        return {"success": False, "message": error}, 400
+    
+    # The retention thread applies the new policy right away
+    RETENTION.update(config)
+    if not save_retention_config(config):
+        return {"success": True, "message": "Retention updated but failed to save configuration", "config": config}, 200
+    return {"success": True, "message": "Retention updated", "config": config}, 200
+
+def delete_log_files():
+    """Delete the live log and every backup. Returns the deleted backup names."""
+    log_file_path = str(LOG_FILE)
+    
+    def remove_log_files():
+        # List backup files in the directory
+        log_dir = os.path.dirname(log_file_path)
+        backup_files = [f for f in os.listdir(log_dir) if f.startswith("sensor_data_backup_")]
+        
+        # Delete the main log file
+        if os.path.exists(log_file_path):
+            os.remove(log_file_path)
+        STORE.clear()
+        logger.info("Main log file deleted: %s", log_file_path)
+        
+        # Delete any backup files
+        for backup in backup_files:
+            backup_path = os.path.join(log_dir, backup)
+            os.remove(backup_path)
+            logger.info("Backup file deleted: %s", backup_path)
+        
+        return backup_files
+    
+    # The writer keeps the log open, so it has to let go of it first
+    return LOG_WRITER.run_with_files_closed(remove_log_files)
+
+# Calls the web side can make into wherever acquisition runs
+CONTROL = {
+    "serial_status": serial_status,
+    "switch_serial_port": switch_serial_port,
+    "sensors": SENSORS.stats,
+    "add_sensor": add_sensor,
+    "remove_sensor": remove_sensor,
+    "sampling": lambda: SAMPLING,
+    "update_sampling": update_sampling,
+    "schedule_status": schedule_status,
+    "delete_log_files": delete_log_files,
+    "retention": lambda: {"config": RETENTION.config, "status": RETENTION.stats()},
+    "update_retention": update_retention,
+    "writer_status": LOG_WRITER.stats,
+    "mavlink_status": MAVLINK.stats,
+    "telemetry_status": TELEMETRY.stats,
+    "set_debug": applog.set_debug,
+    "logging_status": applog.stats,
+    "metrics": ACQUISITION_METRICS.render,
+}
+
+# Development default; replaced by an AcquisitionProcess in production mode
+ACQUISITION = LocalAcquisition(CONTROL, start_acquisition)
+
+def publish_records(records):
+    """Push newly stored records to /api/stream subscribers."""
+    for row in to_rows(records):
+        BROADCASTER.publish("measurement", row)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    start = g.get('request_start')
+    if start is not None and request.endpoint:
+        HTTP_REQUEST_SECONDS.labels(request.endpoint).observe(time.perf_counter() - start)
+    return response
+
+@app.errorhandler(AcquisitionUnavailable)
+def acquisition_unavailable(e):
+    return jsonify({"success": False, "message": str(e)}), 503
+
+def logs_loading():
+    """503 response while the logs are still being opened, else None."""
+    if STORE.ready.is_set():
+        return None
+    response = jsonify({"success": False, "message": "The logs are still being loaded"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 @app.route('/api/data')
 def get_data():
-    """Return measurements filtered by duration."""
+    """Return measurements filtered by duration and, optionally, sensor."""
+    loading = logs_loading()
+    if loading is not None:
+        return loading
+    
     try:
         duration = int(request.args.get('duration', 0))
         max_points = int(request.args.get('max_points', 1000))  # Default to max 1000 points
     except (TypeError, ValueError):
         duration = 0
         max_points = 1000
+    # Readings of every sensor unless one is asked for
+    sensor = request.args.get('sensor', type=int)
+    
+    # "lttb" keeps representative samples, "minmax" returns bucket mean/min/max
+    mode = request.args.get('downsample', 'lttb')
+    if mode not in ('lttb', 'minmax'):
+        mode = 'lttb'
     
     # For "All Data" selection, use duration=-1 to indicate we want everything
     all_data_requested = duration <= 0
     
-    # Only calculate cutoff time if we're not requesting all data
-    cutoff_time = datetime.now() - timedelta(minutes=duration) if not all_data_requested else None
+    # A trailing window's start moves with the clock even when nothing is
+    # stored. It advances in steps of about one point's width, and the step
+    # number is part of the cache key and ETag, so each of them always
+    # stands for the same window.
+    if all_data_requested:
+        step = since = None
+    else:
+        width = max(1.0, duration * 60 / max_points) if max_points > 0 else 1.0
+        step = int(time.time() // width)
+        since = step * width - duration * 60
     
-    print(f"Data request: duration={duration}, all_data={all_data_requested}, max_points={max_points}")
+    logger.debug("Data request: duration=%s, all_data=%s, max_points=%s", duration, all_data_requested, max_points)
     
-    # Always use CSV data for consistency
-    log_file_path = str(LOG_FILE)
+    # "rows" is a list of objects; "columns" is {"t": [epoch seconds], "do": [...], ...}
+    shape = request.args.get('format', 'rows')
+    if shape not in ('rows', 'columns'):
+        shape = 'rows'
     
-    # First check if the file exists
-    if not os.path.exists(log_file_path):
-        print(f"Log file not found: {log_file_path}")
-        return jsonify([])
+    # The answer only changes when a sample is stored, so clients polling with
+    # the same arguments are answered from the cache or with 304 Not Modified
+    version = STORE.version
+    key = (duration, max_points, mode, shape, sensor, version, step)
+    etag = f"{BOOT_ID}-{version}-{duration}-{max_points}-{mode}-{shape}-{sensor}-{step}"
+    gzip_ok = 'gzip' in request.headers.get('Accept-Encoding', '')
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
     
-    # Try to read data from the CSV file
-    try:
-        filtered_data = []
-        row_count = 0
-        error_count = 0
-        
-        with open(log_file_path, 'r') as csvfile:
-            try:
-                reader = csv.DictReader(csvfile)
-                
-                # Verify the headers are correct
-                if not all(header in reader.fieldnames for header in CSV_HEADERS):
-                    print(f"CSV headers mismatch. Expected: {CSV_HEADERS}, Found: {reader.fieldnames}")
-                    return jsonify([])
-                
-                # Count rows and collect matching data
-                for row in reader:
-                    row_count += 1
-                    try:
-                        # Only process if all required fields are present
-                        if all(field in row for field in CSV_HEADERS):
-                            # Parse the timestamp
-                            timestamp = datetime.fromisoformat(row['timestamp'])
-                            
-                            # Check if it's within the requested duration
-                            if all_data_requested or timestamp > cutoff_time:
-                                # Convert string values to proper types
-                                processed_row = {
-                                    'timestamp': row['timestamp'],
-                                    'temperature': float(row['temperature']),
-                                    'do': float(row['do']),
-                                    'q': float(row['q']),
-                                    'vehicle_temperature': float(row['vehicle_temperature']) if row['vehicle_temperature'] else None,
-                                    'latitude': float(row['latitude']) if row['latitude'] else None,
-                                    'longitude': float(row['longitude']) if row['longitude'] else None
-                                }
-                                filtered_data.append(processed_row)
-                        else:
-                            error_count += 1
-                            if error_count < 5:  # Limit the number of error messages
-                                missing = [field for field in CSV_HEADERS if field not in row]
-                                print(f"Row {row_count} missing fields: {missing}")
-                    except (ValueError, KeyError) as e:
-                        error_count += 1
-                        if error_count < 5:  # Limit the number of error messages
-                            print(f"Error processing row {row_count}: {e}")
-            except Exception as file_error:
-                print(f"Error reading CSV file: {file_error}")
-                return jsonify([])
-        
-        # Sort data by timestamp to ensure correct order
-        filtered_data.sort(key=lambda x: x['timestamp'])
-        
-        # If we have more points than max_points, we need to downsample
-        total_points = len(filtered_data)
-        if total_points > max_points and max_points > 0:
-            # Simple downsampling - take evenly spaced points
-            step = total_points // max_points
-            filtered_data = filtered_data[::step]
-            if len(filtered_data) > max_points:  # Ensure we don't exceed max_points
-                filtered_data = filtered_data[:max_points]
-            print(f"Downsampled from {total_points} to {len(filtered_data)} points")
+    if etag in request.if_none_match:
+        DATA_CACHE.count_not_modified()
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+    
+    cached = DATA_CACHE.get(key)
+    if cached is None:
+        try:
+            # Serve the window from the in-memory ring if it covers it, else binary
+            # search the memory-mapped log; downsample with LTTB / rollup tiers if
+            # it holds more than max_points
+            kind, parts, scanned = STORE.select(since, max_points, mode, sensor)
+            returned = scanned if max_points <= 0 else sum(len(part) for part in parts())
+            DATA_ROWS_SCANNED.inc(scanned)
+            DATA_ROWS_RETURNED.inc(returned)
+            logger.debug("Store read: %d rows scanned, returning %d %s (%s, %s)", scanned, returned, kind, mode, shape)
+        except Exception as e:
+            logger.error("Exception while querying binary log: %s", e)
+            return jsonify([])
         
-        print(f"CSV read: {row_count} total rows, {len(filtered_data)} matching records, {error_count} errors")
-        return jsonify(filtered_data)
-            
-    except Exception as e:
-        print(f"Exception while processing CSV file: {e}")
-        return jsonify([])
+        body = json_columns(kind, parts) if shape == 'columns' else json_rows(kind, parts)
+        if max_points <= 0:
+            # Unbounded: rows are encoded and sent as they are read instead of
+            # building the whole response in memory, and never cached
+            if gzip_ok:
+                body = gzip_stream(body)
+                headers['Content-Encoding'] = 'gzip'
+            response = Response(body, mimetype='application/json', headers=headers)
+            response.set_etag(etag)
+            response.last_modified = STORE.last_modified
+            return response
+        cached = {'identity': "".join(body).encode('utf-8')}
+        DATA_CACHE.put(key, cached)
+    
+    if gzip_ok:
+        if 'gzip' not in cached:
+            cached['gzip'] = gzip.compress(cached['identity'], compresslevel=6)
+        body = cached['gzip']
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        body = cached['identity']
+    response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    response.last_modified = STORE.last_modified
+    return response
+
+@app.route('/api/stats')
+def get_stats():
+    """Count, mean, standard deviation, min, max and rate of change of each field over a window.
+
+    ?window= is a trailing window (seconds, or e.g. 90s, 10m, 1h; 10 minutes
+    by default); the standard windows are answered from rolling accumulators.
+    ?start= and/or ?end= (epoch seconds or ISO timestamps) pick any other
+    range, answered from the rollups. ?fields= and ?sensor= narrow the answer.
+    """
+    loading = logs_loading()
+    if loading is not None:
+        return loading
+    
+    fields = [field for field in request.args.get('fields', ",".join(STATS_FIELDS)).split(",") if field]
+    unknown = [field for field in fields if field not in STATS_FIELDS]
+    if unknown or not fields:
+        message = f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested"
+        return jsonify({"success": False, "message": f"{message} (available: {', '.join(STATS_FIELDS)})"}), 400
+    sensor = request.args.get('sensor', type=int)
+    try:
+        window = parse_window(request.args.get('window', '10m'))
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({"success": False, "message": "start must not be after end"}), 400
+    
+    now = time.time()
+    if start is None and end is None and window in ROLLING_STATS.windows:
+        source = "rolling"
+        since, until = now - window, now
+        stats = ROLLING_STATS.get(window, sensor, fields)
+    else:
+        source = "rollups"
+        # start is inclusive, like /api/logs
+        since = start - 1e-6 if start is not None else (end if end is not None else now) - window
+        until = end
+        buckets, scanned = STORE.stats_buckets(since, until, sensor)
+        stats = bucket_stats(buckets, fields)
+        logger.debug("Stats from rollups: %d buckets and rows read", scanned)
+    STATS_QUERIES.labels(source).inc()
+    return jsonify({
+        "since": since,
+        "until": until if until is not None else now,
+        "sensor": sensor,
+        "source": source,
+        "stats": stats,
+    })
+
+@app.route('/api/grid')
+def get_grid():
+    """DO and temperature per map cell (Web Mercator tile): count, mean, min and max.
+
+    ?bbox=west,south,east,north (degrees) limits the area and ?zoom= the
+    finest cell size; the answer uses the finest kept zoom level at or
+    below it with at most MAX_GRID_CELLS cells. ?start= and/or ?end= (epoch
+    seconds or ISO timestamps) aggregate only that time range from the
+    stored readings; ?sensor= narrows the answer to one sensor.
+    """
+    loading = logs_loading()
+    if loading is not None:
+        return loading
+    
+    sensor = request.args.get('sensor', type=int)
+    zoom = request.args.get('zoom', '')
+    if zoom == '':
+        zoom = GRID.zoom_levels[-1]
+    else:
+        try:
+            zoom = int(zoom)
+        except ValueError:
+            return jsonify({"success": False, "message": f"invalid zoom {zoom!r} (use an integer)"}), 400
+    try:
+        bbox = parse_bbox(request.args.get('bbox'))
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    if start is None and end is None:
+        source = "grid"
+        select = lambda level: GRID.select(level, bbox, sensor)
+    else:
+        # A time range is binned on the fly; the kept cells span all of it
+        source = "records"
+        records = STORE.window(start - 1e-6 if start is not None else None, end, sensor)
+        select = lambda level: select_cells(aggregate_cells(records, level), level, bbox)
+    
+    levels = [level for level in GRID.zoom_levels if level <= GRID.level(zoom)]
+    for level in reversed(levels):
+        cells = select(level)
+        if len(cells) <= MAX_GRID_CELLS:
+            break
+    return jsonify({"zoom": level, "sensor": sensor, "source": source, "cells": cell_rows(cells, level)})
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for the web server and the acquisition process."""
+    text = WEB_METRICS.render()
+    try:
+        text += ACQUISITION.call("metrics")
+    except AcquisitionUnavailable:
+        pass  # Reported as pme_acquisition_up 0
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/data/cache')
+def get_data_cache_status():
+    """Report /api/data response cache hits, misses and 304s."""
+    return jsonify(DATA_CACHE.stats())
+
+@app.route('/api/stream')
+def stream_data():
+    """Server-Sent Events stream of new measurements as they are stored.
+    
+    Clients load a snapshot from /api/data first and then apply the
+    "measurement" events; a "reset" event means events were missed and the
+    snapshot should be reloaded. Beyond MAX_STREAM_SUBSCRIBERS clients the
+    answer is 503, and the client should poll /api/data instead.
+    """
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    
+    events = BROADCASTER.subscribe(last_event_id)
+    if events is None:
+        response = jsonify({"success": False, "message": "Too many stream clients, poll /api/data instead"})
+        response.status_code = 503
+        return response
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/stream/status')
+def get_stream_status():
+    """Report the number of stream subscribers and buffered events."""
+    return jsonify(BROADCASTER.stats())
+
+@app.route('/api/mavlink')
+def get_mavlink_status():
+    """Report the Mavlink2Rest endpoint in use and request counters."""
+    return jsonify(ACQUISITION.call("mavlink_status"))
+
+@app.route('/api/telemetry')
+def get_telemetry_status():
+    """Report the age of the cached vehicle telemetry."""
+    return jsonify(ACQUISITION.call("telemetry_status"))
 
 @app.route('/api/serial')
 def get_serial():
-    """Return the serial port configuration."""
-    return jsonify({"serial_port": SERIAL_PORT, "baud_rate": BAUD_RATE})
+    """Return the serial port configuration and reader counters."""
+    return jsonify(ACQUISITION.call("serial_status"))
 
 @app.route('/api/serial/ports')
 def get_serial_ports():
@@ -617,46 +1017,55 @@ def get_serial_ports():
 
 @app.route('/api/serial/select', methods=['POST'])
 def select_serial_port():
-    """Select a different serial port."""
-    global SERIAL_PORT
-    
+    """Select a different serial port for a sensor (sensor 0 by default)."""
     # Get the port from request
     data = request.json
     if not data or 'port' not in data:
         return jsonify({"success": False, "message": "No port specified"}), 400
     
-    new_port = data['port']
+    body, status = ACQUISITION.call("switch_serial_port", data['port'], data.get('sensor_id', 0), timeout=30.0)
+    return jsonify(body), status
+
+@app.route('/api/sensors', methods=['GET', 'POST'])
+def sensor_list():
+    """List the sensors, or add one: {"sensor_id": 1, "port": "/dev/ttyUSB1"}."""
+    if request.method == 'GET':
+        return jsonify({"sensors": ACQUISITION.call("sensors"), "stored": STORE.sensor_ids()})
     
-    # Validate the port exists
-    if not os.path.exists(new_port):
-        return jsonify({"success": False, "message": f"Port {new_port} does not exist"}), 400
+    data = request.json
+    if not data or 'port' not in data or 'sensor_id' not in data:
+        return jsonify({"success": False, "message": "sensor_id and port are required"}), 400
+    body, status = ACQUISITION.call("add_sensor", data['sensor_id'], data['port'], timeout=30.0)
+    return jsonify(body), status
+
+@app.route('/api/sensors/<int:sensor_id>', methods=['DELETE'])
+def delete_sensor(sensor_id):
+    """Stop sampling a sensor; its stored readings are kept."""
+    body, status = ACQUISITION.call("remove_sensor", sensor_id, timeout=30.0)
+    return jsonify(body), status
+
+@app.route('/api/sampling', methods=['GET', 'POST'])
+def sampling_config():
+    """Get or change the sampling mode and interval."""
+    if request.method == 'GET':
+        return jsonify(ACQUISITION.call("sampling"))
     
-    # Update the port
-    with SERIAL_LOCK:
-        old_port = SERIAL_PORT
-        SERIAL_PORT = new_port
-        
-        # Try to reinitialize the connection
-        if initialize_serial_connection():
-            # Save the configuration
-            if save_serial_config(new_port):
-                return jsonify({
-                    "success": True, 
-                    "message": f"Switched from {old_port} to {new_port}"
-                })
-            else:
-                return jsonify({
-                    "success": True, 
-                    "message": f"Switched to {new_port} but failed to save configuration"
-                })
-        else:
-            # Revert to old port if new one fails
-            SERIAL_PORT = old_port
-            initialize_serial_connection()  # Try to reopen the old port
-            return jsonify({
-                "success": False, 
-                "message": f"Failed to connect to {new_port}, reverted to {old_port}"
-            }), 500
+    body, status = ACQUISITION.call("update_sampling", request.json or {})
+    return jsonify(body), status
+
+@app.route('/api/retention', methods=['GET', 'POST'])
+def retention_config():
+    """Get or change the retention policy, and report what it has reclaimed."""
+    if request.method == 'GET':
+        return jsonify(ACQUISITION.call("retention"))
+    
+    body, status = ACQUISITION.call("update_retention", request.json or {})
+    return jsonify(body), status
+
+@app.route('/api/sampling/schedule')
+def get_sampling_schedule():
+    """Report polling jitter and polls skipped after overruns."""
+    return jsonify(ACQUISITION.call("schedule_status"))
 
 @app.route('/register_service')
 def register_service():
@@ -675,37 +1084,64 @@ def serve_static(filename):
 
 @app.route('/api/logs')
 def download_logs():
-    """Download the log file."""
+    """Download the logs of every segment as one (gzip-compressed) CSV or Parquet file."""
+    loading = logs_loading()
+    if loading is not None:
+        return loading
     log_file_path = str(LOG_FILE)
     
-    # Print debug info
-    print(f"Download requested for log file: {log_file_path}")
-    print(f"File exists: {os.path.exists(log_file_path)}")
-    if os.path.exists(log_file_path):
-        print(f"File size: {os.path.getsize(log_file_path)} bytes")
-    
-    # List all files in the logs directory
-    log_dir = os.path.dirname(log_file_path)
-    print(f"Contents of log directory ({log_dir}):")
-    if os.path.exists(log_dir):
-        for item in os.listdir(log_dir):
-            item_path = os.path.join(log_dir, item)
-            if os.path.isfile(item_path):
-                print(f"  - {item} ({os.path.getsize(item_path)} bytes)")
-            else:
-                print(f"  - {item}/ (directory)")
+    logger.info("Log download requested (%s)", request.query_string.decode() or "all data")
     
+    # Optional time filters (epoch seconds or ISO timestamps, start inclusive)
     try:
-        if os.path.exists(log_file_path):
-            response = send_file(
-                log_file_path,
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError as e:
+        return f"Invalid start/end time: {e}", 400
+    since = start - 1e-6 if start is not None else None
+    export_format = request.args.get('format', 'csv')
+    compression = request.args.get('compression', 'gzip')
+    
+    try:
+        if not (os.path.exists(log_file_path) or len(STORE) > 0):
+            return "No log file found", 404
+        
+        # Every export is generated from the binary logs of all segments as
+        # it is streamed out, so nothing is held in memory
+        if export_format == 'parquet':
+            if not parquet_available():
+                return "Parquet export is not available (pyarrow is not installed)", 501
+            return Response(
+                parquet_stream(STORE.iter_window(since, end)),
+                mimetype='application/vnd.apache.parquet',
+                headers={'Content-Disposition': 'attachment; filename=do_sensor_logs.parquet'}
+            )
+        if export_format != 'csv':
+            return f"Unknown export format: {export_format}", 400
+        
+        chunks = STORE.export_csv(since, end)
+        if compression == 'none':
+            return Response(
+                chunks,
                 mimetype='text/csv',
-                as_attachment=True,
-                download_name='do_sensor_logs.csv'
+                headers={'Content-Disposition': 'attachment; filename=do_sensor_logs.csv'}
             )
-            return response
-        else:
-            return "No log file found", 404
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            # Compressed on the wire only; browsers still save a plain CSV
+            return Response(
+                gzip_stream(chunks),
+                mimetype='text/csv',
+                headers={
+                    'Content-Encoding': 'gzip',
+                    'Vary': 'Accept-Encoding',
+                    'Content-Disposition': 'attachment; filename=do_sensor_logs.csv',
+                }
+            )
+        return Response(
+            gzip_stream(chunks),
+            mimetype='application/gzip',
+            headers={'Vary': 'Accept-Encoding', 'Content-Disposition': 'attachment; filename=do_sensor_logs.csv.gz'}
+        )
     except Exception as e:
         return f"Error accessing log file: {e}", 500
 
@@ -714,33 +1150,47 @@ def delete_logs():
     """Delete the log file."""
     log_file_path = str(LOG_FILE)
     
-    # Print debug info
-    print(f"Delete requested for log file: {log_file_path}")
-    print(f"File exists before delete: {os.path.exists(log_file_path)}")
+    logger.info("Delete requested for log file: %s", log_file_path)
     
     try:
         if os.path.exists(log_file_path):
-            # List backup files in the directory
-            log_dir = os.path.dirname(log_file_path)
-            backup_files = [f for f in os.listdir(log_dir) if f.startswith("sensor_data_backup_")]
-            
-            # Delete the main log file
-            os.remove(log_file_path)
-            print(f"Main log file deleted: {log_file_path}")
-            
-            # Delete any backup files
-            for backup in backup_files:
-                backup_path = os.path.join(log_dir, backup)
-                os.remove(backup_path)
-                print(f"Backup file deleted: {backup_path}")
-            
+            backup_files = ACQUISITION.call("delete_log_files", timeout=30.0)
+            # Re-read the (now empty) logs right away rather than on the next poll
+            STORE.refresh()
             return jsonify({"success": True, "message": f"Deleted log file and {len(backup_files)} backup files"})
         
         return jsonify({"success": True, "message": "No log file to delete"})
     except Exception as e:
-        print(f"Error deleting log file: {e}")
+        logger.error("Error deleting log file: %s", e)
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/logs/writer')
+def get_log_writer_status():
+    """Report log writer queue depth, flush latency and dropped rows."""
+    return jsonify(ACQUISITION.call("writer_status"))
+
+@app.route('/api/acquisition')
+def get_acquisition_status():
+    """Report whether the acquisition process is running and how often it restarted."""
+    return jsonify(ACQUISITION.stats())
+
+@app.route('/api/debug', methods=['GET', 'POST'])
+def debug_logging():
+    """Get or toggle per-sample debug diagnostics (rate-limited) at runtime."""
+    if request.method == 'POST':
+        data = request.json or {}
+        if not isinstance(data.get('enabled'), bool):
+            return jsonify({"success": False, "message": "'enabled' must be true or false"}), 400
+        applog.set_debug(data['enabled'])
+        ACQUISITION.call("set_debug", data['enabled'])
+        logger.info("Debug diagnostics %s", "enabled" if data['enabled'] else "disabled")
+    return jsonify({"web": applog.stats(), "acquisition": ACQUISITION.call("logging_status")})
+
+@app.route('/api/logs/segments')
+def get_log_segments():
+    """List the rotated log segments with their time range and row count."""
+    return jsonify(STORE.segments.stats())
+
 @app.route('/widget')
 def widget():
     """Serve the widget-optimized version of the dashboard for iframe embedding."""
@@ -751,5 +1201,26 @@ def widget():
     return response
 
 if __name__ == '__main__':
-    # Run Flask on port 6436
-    app.run(host='0.0.0.0', port=6436)
+    # Docker stops the container with SIGTERM; exit normally so the atexit
+    # hooks flush the logs (and stop the acquisition process)
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    STORE.listeners.append(publish_records)
+    STORE.listeners.append(ROLLING_STATS.add)
+    STORE.listeners.append(GRID.add)
+    
+    if SERVER == "waitress" and serve is None:
+        logger.warning("waitress is not installed, falling back to the Flask development server")
+        SERVER = "flask"
+    
+    if SERVER == "waitress":
+        # Sampling runs in its own process so HTTP load cannot delay it; this
+        # process follows the logs it writes
+        ACQUISITION = AcquisitionProcess(run_acquisition)
+        ACQUISITION.start()
+        atexit.register(ACQUISITION.stop)
+        STORE.follow()
+        serve(app, host='0.0.0.0', port=HTTP_PORT, threads=HTTP_THREADS + MAX_STREAM_SUBSCRIBERS)
+    else:
+        ACQUISITION.start()
+        # Run Flask on port 6436
+        app.run(host='0.0.0.0', port=HTTP_PORT)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Shared Mavlink2Rest client with connection pooling and endpoint discovery."""
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from applog import RATE_LIMITED
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Places BlueOS' Mavlink2Rest may be reachable from inside the container
+DEFAULT_BASE_URLS = [
+    'http://host.docker.internal:6040',
+    'http://localhost:6040',
+    'http://127.0.0.1:6040',
+    'http://192.168.2.2:6040',
+    'http://blueos.local:6040',
+]
+
+
+class Mavlink2RestClient:
+    """Pooled HTTP client that talks to the last Mavlink2Rest endpoint that worked.
+
+    Requests go only to the current endpoint, over a keep-alive session. When it
+    fails (no connection or a 5xx answer), the request fails fast and a
+    background thread re-probes every candidate with exponential backoff until
+    one answers again, so the sensor loop never walks the whole endpoint list.
+    A 4xx answer (e.g. a message the vehicle has not sent yet) only fails that
+    request; the endpoint is kept. Outgoing NAMED_VALUE_FLOAT
+    messages can be queued with send_async() and are sent from a worker thread.
+    """
+
+    def __init__(self, base_urls=None, timeout=2.0, probe_timeout=1.0,
+                 min_backoff=1.0, max_backoff=60.0, send_queue_size=32):
+        self.base_urls = list(base_urls or DEFAULT_BASE_URLS)
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=4)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._active = None
+        self._backoff = {url: 0.0 for url in self.base_urls}
+        self._next_probe = {url: 0.0 for url in self.base_urls}
+        self._wake = threading.Event()
+        self._send_queue = queue.Queue(maxsize=send_queue_size)
+        self._threads = []
+
+        self.requests_ok = 0
+        self.requests_failed = 0
+        self.requests_rejected = 0
+        self.sends_dropped = 0
+        self.endpoint_switches = 0
+        self.request_seconds = Histogram(
+            "pme_mavlink_request_seconds", "Mavlink2Rest request round trip (failures included)", labels=("method",)
+        )
+
+    @property
+    def active_url(self):
+        return self._active
+
+    def start(self):
+        """Start the endpoint prober and the async sender threads."""
+        if self._threads:
+            return
+        for target, name in ((self._probe_loop, "mavlink-probe"), (self._send_loop, "mavlink-send")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stats(self):
+        return {
+            "active_endpoint": self._active,
+            "requests_ok": self.requests_ok,
+            "requests_failed": self.requests_failed,
+            "requests_rejected": self.requests_rejected,
+            "endpoint_switches": self.endpoint_switches,
+            "send_queue_depth": self._send_queue.qsize(),
+            "sends_dropped": self.sends_dropped,
+        }
+
+    def get_json(self, path, missing=None):
+        """GET a Mavlink2Rest path from the active endpoint.
+
+        Returns None on failure, and `missing` if the endpoint has nothing at
+        that path (404, e.g. a message the vehicle has not sent yet).
+        """
+        response = self._request('GET', path)
+        if response is None:
+            return None
+        if response.status_code == 404:
+            return missing
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def post_json(self, path, payload):
+        """POST a JSON payload to the active endpoint. Returns True on HTTP 200."""
+        response = self._request('POST', path, json=payload)
+        return response is not None and response.status_code == 200
+
+    def send_named_value_float(self, name, value):
+        """Send a NAMED_VALUE_FLOAT message and wait for the result."""
+        # Create name array exactly as shown in the documentation
+        name_array = [name[i] if i < len(name) else '\u0000' for i in range(10)]
+        payload = {
+            "header": {
+                "system_id": 255,
+                "component_id": 0,
+                "sequence": 0
+            },
+            "message": {
+                "type": "NAMED_VALUE_FLOAT",
+                "time_boot_ms": 0,
+                "value": value,
+                "name": name_array
+            }
+        }
+        return self.post_json('/v1/mavlink', payload)
+
+    def send_async(self, values):
+        """Queue (name, value) pairs to be sent in order from the sender thread.
+
+        Later values in the list are only sent if the earlier ones succeeded.
+        Returns False if the queue is full and the values were dropped.
+        """
+        try:
+            self._send_queue.put_nowait(list(values))
+            return True
+        except queue.Full:
+            self.sends_dropped += 1
+            return False
+
+    def _request(self, method, path, **kwargs):
+        """The endpoint's response (a 4xx included), or None if the request failed."""
+        url = self._active
+        if url is None:
+            self._wake.set()
+            return None
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url + path, timeout=self.timeout, **kwargs)
+            self.request_seconds.labels(method).observe(time.perf_counter() - start)
+        except requests.RequestException:
+            self.request_seconds.labels(method).observe(time.perf_counter() - start)
+            response = None
+        if response is not None and response.status_code == 200:
+            self.requests_ok += 1
+            return response
+        if response is not None and response.status_code < 500:
+            # The endpoint answered; it just has nothing for this request
+            self.requests_rejected += 1
+            return response
+        self.requests_failed += 1
+        self._mark_failed(url)
+        return None
+
+    def _mark_failed(self, url):
+        """Drop the active endpoint and let the prober find a working one."""
+        with self._lock:
+            if self._active == url:
+                logger.warning("Mavlink2Rest endpoint %s stopped responding, re-probing", url, extra=RATE_LIMITED)
+                self._active = None
+                for candidate in self.base_urls:
+                    self._backoff[candidate] = 0.0
+                    self._next_probe[candidate] = 0.0
+        self._wake.set()
+
+    def _probe(self, url):
+        try:
+            response = self.session.get(url + '/v1/mavlink/vehicles', timeout=self.probe_timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def _probe_loop(self):
+        while True:
+            if self._active is not None:
+                # Nothing to do until a request reports the endpoint as failed
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            now = time.monotonic()
+            for url in self.base_urls:
+                if self._next_probe[url] > now:
+                    continue
+                if self._probe(url):
+                    with self._lock:
+                        self._active = url
+                        self._backoff[url] = 0.0
+                        self.endpoint_switches += 1
+                    logger.info("Using Mavlink2Rest endpoint %s", url)
+                    break
+                backoff = min(self.max_backoff, max(self.min_backoff, self._backoff[url] * 2))
+                self._backoff[url] = backoff
+                self._next_probe[url] = time.monotonic() + backoff
+
+            if self._active is None:
+                delay = max(0.1, min(self._next_probe.values()) - time.monotonic())
+                self._wake.wait(delay)
+                self._wake.clear()
+
+    def _send_loop(self):
+        while True:
+            values = self._send_queue.get()
+            for name, value in values:
+                if self.send_named_value_float(name, value):
+                    logger.debug("Sent %s=%s to Mavlink2Rest via %s", name, value, self._active)
+                else:
+                    logger.warning("Could not send %s=%s to Mavlink2Rest", name, value, extra=RATE_LIMITED)
+                    break
+
+
+class TelemetryCache:
+    """Latest vehicle position and water temperature, refreshed in the background.
+
+    A single poller thread fetches GLOBAL_POSITION_INT and SCALED_PRESSURE2
+    through the shared client and publishes them, with the monotonic time the
+    vehicle last sent them, as one immutable snapshot. Tagging a sample is
+    then just a read of that snapshot, with no HTTP on the acquisition path,
+    and every sample records how old the telemetry it was tagged with is.
+
+    Mavlink2Rest answers with the last message it received however old it
+    is, so the age comes from the message's status.time.last_update, not
+    from when the poll returned.
+    """
+
+    def __init__(self, client, interval=1.0, max_age=30.0, vehicle_refresh=30.0):
+        self.client = client
+        self.interval = interval
+        self.max_age = max_age
+        self.vehicle_refresh = vehicle_refresh
+        self.system_id = 1
+        self._snapshot = {}
+        self._thread = None
+        self.polls = 0
+        self.poll_failures = 0
+        self.poll_seconds = Histogram(
+            "pme_telemetry_poll_seconds", "Time to fetch the vehicle position and temperature from Mavlink2Rest"
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll_loop, name="telemetry", daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        """Return the latest telemetry snapshot (safe to read without locking)."""
+        return self._snapshot
+
+    def tag(self, measurement):
+        """Add vehicle telemetry and its age in seconds to a measurement dict."""
+        snapshot = self._snapshot
+        now = time.monotonic()
+
+        gps = snapshot.get('gps')
+        if gps is not None:
+            age = now - gps['received']
+            measurement['gps_age'] = round(age, 3)
+            if age <= self.max_age:
+                measurement['latitude'] = gps['lat']
+                measurement['longitude'] = gps['lon']
+        measurement.setdefault('latitude', None)
+        measurement.setdefault('longitude', None)
+        measurement.setdefault('gps_age', None)
+
+        temperature = snapshot.get('vehicle_temperature')
+        if temperature is not None:
+            age = now - temperature['received']
+            measurement['vehicle_temperature_age'] = round(age, 3)
+            if age <= self.max_age:
+                measurement['vehicle_temperature'] = temperature['value']
+        measurement.setdefault('vehicle_temperature', None)
+        measurement.setdefault('vehicle_temperature_age', None)
+        return measurement
+
+    def stats(self):
+        now = time.monotonic()
+        snapshot = self._snapshot
+        ages = {
+            f"{key}_age": round(now - value['received'], 3)
+            for key, value in snapshot.items()
+        }
+        return dict(ages, system_id=self.system_id, polls=self.polls, poll_failures=self.poll_failures)
+
+    def _message(self, name):
+        """(message, monotonic time Mavlink2Rest last received it).
+
+        The message is {} if the vehicle has not sent it yet (Mavlink2Rest
+        answers 404), and None if the request failed.
+        """
+        path = f'/v1/mavlink/vehicles/{self.system_id}/components/1/messages/{name}'
+        data = self.client.get_json(path, missing={})
+        if data is None:
+            return None, None
+        if 'message' not in data:
+            return {}, None
+        return data['message'], _last_update(data)
+
+    def _poll_loop(self):
+        last_vehicle_check = None
+        while True:
+            start = time.monotonic()
+            try:
+                if last_vehicle_check is None or start - last_vehicle_check >= self.vehicle_refresh:
+                    vehicles = self.client.get_json('/v1/mavlink/vehicles')
+                    if vehicles:
+                        self.system_id = vehicles[0]  # Use the first vehicle ID
+                        last_vehicle_check = start
+
+                snapshot = dict(self._snapshot)
+                position, received = self._message('GLOBAL_POSITION_INT')
+                if position and 'lat' in position and 'lon' in position:
+                    # Convert lat/lon from int32 to degrees (divide by 1e7)
+                    snapshot['gps'] = {
+                        'lat': position['lat'] / 1e7,
+                        'lon': position['lon'] / 1e7,
+                        'received': received,
+                    }
+                pressure, received = self._message('SCALED_PRESSURE2')
+                if pressure and 'temperature' in pressure:
+                    # Convert temperature from centidegree Celsius to Celsius
+                    snapshot['vehicle_temperature'] = {
+                        'value': pressure['temperature'] / 100.0,
+                        'received': received,
+                    }
+                # A message the vehicle has not sent yet is not a failure
+                if position is None and pressure is None:
+                    self.poll_failures += 1
+                # Publish by swapping the reference; readers never see a partial update
+                self._snapshot = snapshot
+                self.polls += 1
+                self.poll_seconds.observe(time.monotonic() - start)
+            except Exception as e:
+                self.poll_failures += 1
+                logger.warning("Error polling vehicle telemetry: %s", e, extra=RATE_LIMITED)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+
+def _last_update(data):
+    """Monotonic time of a Mavlink2Rest message's status.time.last_update.
+
+    Falls back to now if the response has no parseable last_update (older
+    Mavlink2Rest versions).
+    """
+    now = time.monotonic()
+    try:
+        updated = datetime.fromisoformat(data['status']['time']['last_update']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return now
+    # Never in the future, should the clocks disagree slightly
+    return now - max(0.0, time.time() - updated)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Retention policy for the logs: compact old segments into rollups, cap disk use."""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from downsample import aggregate
+from grid import ZOOM_LEVELS, aggregate_cells
+from segments import ARCHIVE_SUFFIX, Archive
+
+logger = logging.getLogger(__name__)
+
+# Resolutions (seconds) segments can be compacted to; each is a rollup tier
+COMPACT_RESOLUTIONS = (60, 600)
+# How often the policy is applied (seconds); a config change applies it at once
+CHECK_INTERVAL = 3600.0
+
+
+def log_dir_usage(log_dir):
+    """Bytes taken by the extension's logs, backups, archives and checkpoint in log_dir."""
+    total = 0
+    with os.scandir(log_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith("sensor_data") and entry.is_file():
+                total += entry.stat().st_size
+    return total
+
+
+def _lower_priority():
+    """Give the calling thread the lowest CPU priority (per thread on Linux)."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError) as e:
+        logger.debug("Could not lower the retention thread's priority: %s", e)
+
+
+class RetentionManager:
+    """Background thread applying the retention policy to a store's segments.
+
+    Config keys:
+      raw_days: rotated segments whose newest reading is older than this
+          many days are compacted into rollup buckets of `compact_resolution`
+          seconds (0 keeps raw readings forever).
+      max_total_mb: while the log files take more than this, the oldest
+          segments are compacted and then the oldest archives deleted (0 for
+          no cap). The live log is never touched.
+
+    The thread runs at the lowest CPU priority and does its reading,
+    aggregating and writing without holding any lock acquisition needs;
+    only swapping a segment for its archive in the catalog briefly holds
+    the store's index. Segments whose CSV copy is still being compressed
+    are left for the next pass.
+    """
+
+    def __init__(self, store, config, interval=CHECK_INTERVAL, clock=time.time):
+        self.store = store
+        self.config = dict(config)
+        self.interval = interval
+        self._clock = clock
+        self._wake = threading.Event()
+        # One pass at a time
+        self._lock = threading.Lock()
+        self._thread = None
+        self.runs = 0
+        self.last_run = None
+        self.segments_compacted = 0
+        self.archives_deleted = 0
+        self.bytes_reclaimed = 0
+        self.last_bytes_reclaimed = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def update(self, config):
+        """Switch to a new policy and apply it straight away."""
+        self.config = dict(config)
+        self._wake.set()
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "segments_compacted": self.segments_compacted,
+            "archives_deleted": self.archives_deleted,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "last_bytes_reclaimed": self.last_bytes_reclaimed,
+            "disk_usage_bytes": log_dir_usage(self.store.segments.log_dir),
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        _lower_priority()
+        self.store.ready.wait()
+        while True:
+            try:
+                self.apply()
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error applying the retention policy: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def apply(self):
+        """Apply the policy once. Returns the bytes reclaimed."""
+        with self._lock:
+            config = self.config
+            catalog = self.store.segments
+            reclaimed = 0
+            if config["raw_days"] > 0:
+                cutoff = self._clock() - config["raw_days"] * 86400
+                for segment in list(catalog.segments):
+                    if segment.end <= cutoff and self._compactable(segment):
+                        reclaimed += self._compact(segment, config["compact_resolution"])
+
+            cap = config["max_total_mb"] * 1024 * 1024
+            if cap > 0:
+                usage = log_dir_usage(catalog.log_dir)
+                while usage > cap:
+                    # Each step removes a segment or an archive, so this ends
+                    segments = [segment for segment in catalog.segments if self._compactable(segment)]
+                    if segments:
+                        reclaimed += self._compact(segments[0], config["compact_resolution"])
+                    elif catalog.archives:
+                        reclaimed += self._drop(catalog.archives[0])
+                    else:
+                        logger.warning("Log files take %.1f MB, over the %.1f MB cap, but only the live log is left",
+                                       usage / (1024 * 1024), config["max_total_mb"])
+                        break
+                    usage = log_dir_usage(catalog.log_dir)
+
+            self.runs += 1
+            self.last_run = self._clock()
+            self.last_bytes_reclaimed = reclaimed
+            self.bytes_reclaimed += reclaimed
+            return reclaimed
+
+    @staticmethod
+    def _compactable(segment):
+        # A plain CSV copy is still queued for compression
+        return not os.path.exists(segment.path[:-len(".bin")] + ".csv")
+
+    def _compact(self, segment, resolution):
+        """Replace a segment by an archive of its rollups; returns the bytes freed."""
+        records = segment.records()
+        buckets = {"all": aggregate(records, resolution)}
+        ids = records["sensor_id"]
+        for sensor_id in np.unique(ids):
+            buckets[int(sensor_id)] = aggregate(records[ids == sensor_id], resolution)
+        # The survey grid keeps covering the segment after its records are gone
+        cells = {zoom: aggregate_cells(records, zoom) for zoom in ZOOM_LEVELS}
+        del records
+        size = sum(os.path.getsize(path) for path in segment.files())
+        archive = Archive.write(segment.path[:-len(".bin")] + ARCHIVE_SUFFIX,
+                                segment.start, segment.end, segment.rows, resolution, buckets, cells)
+        self.store.compact_segment(segment, archive)
+        for path in segment.files():
+            os.remove(path)
+        freed = size - archive.size
+        self.segments_compacted += 1
+        logger.info("Compacted %s (%d readings) into %d-second rollups, %d bytes reclaimed",
+                    segment.name, segment.rows, resolution, freed)
+        return freed
+
+    def _drop(self, archive):
+        """Delete the oldest archive; returns the bytes freed."""
+        self.store.drop_archive(archive)
+        self.archives_deleted += 1
+        logger.info("Deleted rollup archive %s to stay under the size cap, %d bytes reclaimed",
+                    archive.name, archive.size)
+        return archive.size
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Fixed-capacity in-memory window of the most recent measurement records."""
+import threading
+
+import numpy as np
+
+from binlog import DTYPE
+
+
+class RecordRing:
+    """Ring buffer of binary log records in a preallocated structured array.
+
+    Appending copies the new records into the array at the write position and
+    wraps around, overwriting the oldest ones, so memory use is fixed and no
+    list is ever rebuilt. The timestamps are also kept in a contiguous column
+    of their own so windows can be binary searched in place, and records are
+    moved through an opaque fixed-size view of the array, which numpy copies
+    as plain memory instead of field by field. Readers copy out only the records they asked for
+    (the latest N, or everything after a timestamp located by binary search),
+    never the whole buffer.
+
+    `complete` is True while the ring holds every record of the current log,
+    i.e. nothing has been evicted yet, so whole-log queries can be answered
+    from memory as well.
+    """
+
+    def __init__(self, capacity, dtype=DTYPE):
+        self.capacity = capacity
+        self._records = np.zeros(capacity, dtype=dtype)
+        self._slots = self._records.view(np.dtype((np.void, dtype.itemsize)))
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._lock = threading.Lock()
+        self._start = 0
+        self._count = 0
+        self.complete = True
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        """Forget every record (the log was deleted or rotated)."""
+        with self._lock:
+            self._start = 0
+            self._count = 0
+            self.complete = True
+
+    def load(self, records, total=None):
+        """Replace the contents with the tail of `records`.
+
+        `total` is the number of records in the log the tail was taken from;
+        the ring is complete only if it holds all of them.
+        """
+        if total is None:
+            total = len(records)
+        with self._lock:
+            tail = records[-self.capacity:] if len(records) else records
+            self._slots[:len(tail)] = self._raw(tail)
+            self._times[:len(tail)] = tail["time"]
+            self._start = 0
+            self._count = len(tail)
+            self.complete = total <= self.capacity
+
+    def append(self, records):
+        """Add a batch of records (oldest first), evicting the oldest if full."""
+        n = len(records)
+        if n == 0:
+            return
+        with self._lock:
+            if n >= self.capacity:
+                self._slots[:] = self._raw(records[-self.capacity:])
+                self._times[:] = self._records["time"]
+                self._start = 0
+                self.complete = self.complete and self._count + n <= self.capacity
+                self._count = self.capacity
+                return
+            end = (self._start + self._count) % self.capacity
+            first = min(n, self.capacity - end)
+            raw = self._raw(records)
+            self._slots[end:end + first] = raw[:first]
+            self._times[end:end + first] = records["time"][:first]
+            if first < n:
+                self._slots[:n - first] = raw[first:]
+                self._times[:n - first] = records["time"][first:]
+            overflow = self._count + n - self.capacity
+            if overflow > 0:
+                self._start = (self._start + overflow) % self.capacity
+                self._count = self.capacity
+                self.complete = False
+            else:
+                self._count += n
+
+    def oldest(self):
+        """Timestamp of the oldest record held, or None if empty."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            return float(self._times[self._start])
+
+    def covers(self, since):
+        """True if every log record newer than `since` is in the ring."""
+        if self.complete:
+            return True
+        # Evicted records are never newer than the oldest one still held
+        oldest = self.oldest()
+        return since is not None and oldest is not None and since >= oldest
+
+    def latest(self, n):
+        """Return a copy of the newest n records, oldest first."""
+        with self._lock:
+            n = min(n, self._count)
+            return self._copy(self._count - n, self._count)
+
+    def since(self, since=None):
+        """Return a copy of the records with time > since, oldest first."""
+        with self._lock:
+            if since is None:
+                return self._copy(0, self._count)
+            # Binary search the two contiguous runs that make up the ring
+            end = self._start + self._count
+            head = self._times[self._start:min(end, self.capacity)]
+            index = int(np.searchsorted(head, since, side='right'))
+            if index == len(head) and end > self.capacity:
+                wrapped = self._times[:end - self.capacity]
+                index += int(np.searchsorted(wrapped, since, side='right'))
+            return self._copy(index, self._count)
+
+    def _copy(self, first, last):
+        """Copy logical positions [first, last) out of the ring."""
+        if last <= first:
+            return self._records[:0].copy()
+        lo = (self._start + first) % self.capacity
+        hi = (self._start + last) % self.capacity
+        if lo < hi:
+            raw = self._slots[lo:hi].copy()
+        else:
+            raw = np.concatenate((self._slots[lo:], self._slots[:hi]))
+        return raw.view(self._records.dtype)
+
+    def _raw(self, records):
+        return np.ascontiguousarray(records).view(self._slots.dtype)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Drift-free periodic schedule on the monotonic clock."""
+import math
+import threading
+import time
+
+# What to do with ticks whose deadline passed while a cycle overran:
+#   "skip":     drop them and resume on the original grid (fixed phase)
+#   "catch_up": run up to MAX_CATCH_UP of them late, back to back, and skip
+#               any older ones
+SCHEDULE_POLICIES = ("skip", "catch_up")
+MAX_CATCH_UP = 3
+
+
+class IntervalScheduler:
+    """Ticks at start + k * interval, measured with time.monotonic().
+
+    Deadlines are absolute, so the time a cycle takes never shifts later
+    ticks, and wall-clock steps (NTP, GPS time sync) do not affect spacing.
+    wait() records how late each tick starts (jitter).
+    """
+
+    def __init__(self, interval, policy="skip", max_catch_up=MAX_CATCH_UP, clock=time.monotonic):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(SCHEDULE_POLICIES)}")
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.deadline = clock()
+        self.ticks = 0
+        self.skipped = 0
+        self.caught_up = 0
+        # Missed ticks run so far since the schedule fell behind
+        self._catching_up = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self._lateness_sum = 0.0
+        self._lateness_sumsq = 0.0
+
+    def wait(self, wake=None):
+        """Sleep until the next tick; returns its lateness in seconds.
+
+        If `wake` (a threading.Event) is set while waiting, returns None
+        straight away without advancing the schedule.
+        """
+        deadline, skipped, caught_up = self._next_deadline()
+        remaining = deadline - self._clock()
+        if remaining > 0:
+            if wake is not None:
+                if wake.wait(remaining):
+                    return None
+            else:
+                time.sleep(remaining)
+        now = self._clock()
+        self.deadline = deadline
+        return self._record(max(0.0, now - deadline), skipped, caught_up)
+
+    def _next_deadline(self):
+        """(deadline, ticks skipped, whether it is a missed tick) of the next tick.
+
+        Only computed; wait() counts the tick once it runs.
+        """
+        if self.ticks == 0:
+            return self.deadline, 0, False
+        deadline = self.deadline + self.interval
+        behind = self._clock() - deadline
+        # Whole intervals missed beyond the next deadline
+        missed = int(math.floor(behind / self.interval)) if behind > 0 else 0
+        if missed == 0:
+            return deadline, 0, False
+        allowed = max(0, self.max_catch_up - self._catching_up) if self.policy == "catch_up" else 0
+        skipped = max(0, missed - allowed)
+        return deadline + skipped * self.interval, skipped, skipped < missed
+
+    def _record(self, lateness, skipped=0, caught_up=False):
+        with self._lock:
+            self.skipped += skipped
+            if caught_up:
+                self.caught_up += 1
+                self._catching_up += 1
+            else:
+                self._catching_up = 0
+            self.ticks += 1
+            self.last_lateness = lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            self._lateness_sum += lateness
+            self._lateness_sumsq += lateness * lateness
+        return lateness
+
+    def stats(self):
+        with self._lock:
+            ticks = self.ticks
+            mean = self._lateness_sum / ticks if ticks else 0.0
+            rms = math.sqrt(self._lateness_sumsq / ticks) if ticks else 0.0
+            return {
+                "interval_s": self.interval,
+                "policy": self.policy,
+                "ticks": ticks,
+                "skipped": self.skipped,
+                "caught_up": self.caught_up,
+                "jitter_last_ms": round(self.last_lateness * 1000, 3),
+                "jitter_mean_ms": round(mean * 1000, 3),
+                "jitter_rms_ms": round(rms * 1000, 3),
+                "jitter_max_ms": round(self.max_lateness * 1000, 3),
+            }
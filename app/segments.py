@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Catalog of rotated log segments (sensor_data_backup_<ts>.bin/.csv[.gz])
+and of the rollup archives old segments are compacted into
+(sensor_data_backup_<ts>.compact.npz)."""
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+
+from binlog import BinaryLog, conform
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "sensor_data_backup_"
+ARCHIVE_SUFFIX = ".compact.npz"
+
+
+class Segment:
+    """One rotated binary log with the time range and row count it holds."""
+
+    def __init__(self, path, start, end, rows, size):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.rows = rows
+        self.size = size
+        self._log = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def to_dict(self):
+        return {"name": self.name, "start": self.start, "end": self.end, "rows": self.rows, "size": self.size}
+
+    def records(self):
+        """Memory-map the segment's records (in the current schema)."""
+        if self._log is None:
+            log = BinaryLog(self.path)
+            # Rotated segments are never appended to, so they are read as they are
+            if not log.validate(repair=False):
+                return np.zeros(0, dtype=log.dtype)
+            self._log = log
+        return conform(self._log.records())
+
+    def window(self, since=None, until=None):
+        """Return the segment's records with since < time <= until."""
+        records = self.records()
+        times = records["time"]
+        lo = 0 if since is None else int(np.searchsorted(times, since, side='right'))
+        hi = len(records) if until is None else int(np.searchsorted(times, until, side='right'))
+        return records[lo:hi]
+
+    def files(self):
+        """Paths of the segment's files on disk (binary log and CSV copy)."""
+        base = self.path[:-len(".bin")]
+        return [path for path in (self.path, base + ".csv", base + ".csv.gz") if os.path.exists(path)]
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+class Archive:
+    """A compacted segment: rollup buckets at one resolution instead of raw records.
+
+    The file holds a JSON "meta" entry (time range, raw row count,
+    resolution), the buckets of all sensors ("all") and of each sensor
+    (keyed by sensor ID), and the segment's survey grid cells at each zoom
+    level ("grid/<zoom>"; absent from archives written before the grid).
+    """
+
+    def __init__(self, path, start, end, rows, size, resolution):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.rows = rows
+        self.size = size
+        self.resolution = resolution
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def to_dict(self):
+        return {"name": self.name, "start": self.start, "end": self.end, "rows": self.rows,
+                "size": self.size, "resolution": self.resolution}
+
+    def buckets(self):
+        """{"all" or sensor ID: bucket array} stored in the archive."""
+        with np.load(self.path) as archive:
+            return {key if key == "all" else int(key): archive[key]
+                    for key in archive.files if key != "meta" and not key.startswith("grid/")}
+
+    def cells(self):
+        """{zoom: grid cell array} stored in the archive."""
+        with np.load(self.path) as archive:
+            return {int(key[len("grid/"):]): archive[key] for key in archive.files if key.startswith("grid/")}
+
+    @classmethod
+    def write(cls, path, start, end, rows, resolution, buckets, cells=None):
+        """Write an archive of `buckets` ({"all" or sensor ID: array}) and grid
+        `cells` ({zoom: array}) atomically."""
+        meta = {"start": start, "end": end, "rows": rows, "resolution": resolution}
+        arrays = {str(key): value for key, value in buckets.items()}
+        arrays.update({f"grid/{zoom}": value for zoom, value in (cells or {}).items()})
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+        return cls(path, start, end, rows, os.path.getsize(path), resolution)
+
+    @classmethod
+    def inspect(cls, path):
+        try:
+            with np.load(path) as archive:
+                meta = json.loads(str(archive["meta"]))
+            return cls(path, meta["start"], meta["end"], meta["rows"], os.path.getsize(path), meta["resolution"])
+        except Exception as e:
+            logger.warning("Skipping unreadable rollup archive %s: %s", path, e)
+            return None
+
+
+class SegmentCatalog:
+    """Time range and row count of every rotated log segment, oldest first.
+
+    Rotating the log moves the CSV and its binary log aside together; the
+    catalog remembers what each rotated binary log covers (persisted in
+    segments.json next to the logs), so a time-window query only opens the
+    segments that overlap it. Rotated CSVs from before the binary log existed
+    are converted once, when they are first cataloged.
+
+    Segments compacted by the retention policy are listed as `archives`;
+    their raw records are gone, only their rollup buckets remain.
+
+    A `read_only` catalog (kept by a process that does not write the logs)
+    never converts CSVs or saves segments.json: rotated CSVs without a
+    binary log are left for the writer, whose catalog update then shows up
+    through changed_on_disk().
+    """
+
+    def __init__(self, log_dir, catalog_name="segments.json", read_only=False):
+        self.log_dir = str(log_dir)
+        self.catalog_path = os.path.join(self.log_dir, catalog_name)
+        self.read_only = read_only
+        self.segments = []
+        self.archives = []
+        # Catalog file as last read or written, to notice another process's changes
+        self._catalog_stat = None
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def rows(self):
+        return sum(segment.rows for segment in self.segments)
+
+    @property
+    def archived_rows(self):
+        """Raw rows the archives were compacted from."""
+        return sum(archive.rows for archive in self.archives)
+
+    def scan(self):
+        """Rebuild the catalog from the backup files on disk.
+
+        Entries whose file size is unchanged since they were cataloged are
+        reused without opening the file.
+        """
+        known = {}
+        # Taken before reading, so a change made meanwhile is noticed next time
+        catalog_stat = self._stat()
+        try:
+            with open(self.catalog_path) as f:
+                catalog = json.load(f)
+            for entry in catalog.get("segments", []) + catalog.get("archives", []):
+                known[entry["name"]] = entry
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+        pattern = os.path.join(self.log_dir, BACKUP_PREFIX + "*.csv*")
+        for csv_path in [] if self.read_only else glob.glob(pattern):
+            if not csv_path.endswith((".csv", ".csv.gz")):
+                continue
+            base = csv_path[:csv_path.rindex(".csv")]
+            bin_path = base + ".bin"
+            # A compacted segment's CSV is about to be deleted, not imported
+            if not os.path.exists(bin_path) and not os.path.exists(base + ARCHIVE_SUFFIX):
+                logger.info("Building binary log for rotated segment %s", os.path.basename(csv_path))
+                BinaryLog(bin_path).import_csv(csv_path)
+
+        for segment in self.segments:
+            segment.close()
+        segments = []
+        for bin_path in glob.glob(os.path.join(self.log_dir, BACKUP_PREFIX + "*.bin")):
+            entry = known.get(os.path.basename(bin_path))
+            try:
+                size = os.path.getsize(bin_path)
+            except FileNotFoundError:
+                continue  # Compacted or deleted by the writer meanwhile
+            if entry is not None and entry.get("size") == size:
+                segments.append(Segment(bin_path, entry["start"], entry["end"], entry["rows"], size))
+                continue
+            segment = self._inspect(bin_path)
+            if segment is not None:
+                segments.append(segment)
+        self.segments = sorted(segments, key=lambda s: (s.start, s.name))
+
+        archives = []
+        for path in glob.glob(os.path.join(self.log_dir, BACKUP_PREFIX + "*" + ARCHIVE_SUFFIX)):
+            entry = known.get(os.path.basename(path))
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if entry is not None and entry.get("size") == size:
+                archives.append(Archive(path, entry["start"], entry["end"], entry["rows"], size, entry["resolution"]))
+                continue
+            archive = Archive.inspect(path)
+            if archive is not None:
+                archives.append(archive)
+        self.archives = sorted(archives, key=lambda a: (a.start, a.name))
+        if self.read_only:
+            self._catalog_stat = catalog_stat
+        else:
+            self._save()
+        return len(self.segments)
+
+    def add(self, bin_path):
+        """Catalog a freshly rotated segment."""
+        segment = self._inspect(str(bin_path))
+        if segment is None:
+            return None
+        self.segments = [s for s in self.segments if s.path != segment.path]
+        self.segments.append(segment)
+        self.segments.sort(key=lambda s: (s.start, s.name))
+        self._save()
+        return segment
+
+    def compact(self, segment, archive):
+        """Replace a segment by the archive it was compacted into."""
+        segment.close()
+        self.segments = [s for s in self.segments if s.path != segment.path]
+        self.archives = sorted(self.archives + [archive], key=lambda a: (a.start, a.name))
+        self._save()
+
+    def remove_archive(self, archive):
+        """Forget an archive (its file is being deleted)."""
+        self.archives = [a for a in self.archives if a.path != archive.path]
+        self._save()
+
+    def changed_on_disk(self):
+        """Whether the catalog file changed since this catalog last read or wrote it."""
+        return self._stat() != self._catalog_stat
+
+    def clear(self):
+        """Forget every segment and archive (the backups were deleted)."""
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.archives = []
+        try:
+            os.remove(self.catalog_path)
+        except OSError:
+            pass
+        self._catalog_stat = None
+
+    def overlapping(self, since=None, until=None):
+        """Segments holding records with since < time <= until, oldest first."""
+        return [
+            segment for segment in self.segments
+            if (since is None or segment.end > since) and (until is None or segment.start <= until)
+        ]
+
+    def count(self, since=None, until=None):
+        """Number of segment records in the window.
+
+        Segments entirely inside the window are counted from the catalog;
+        only those cut by a window edge are searched.
+        """
+        total = 0
+        for segment in self.overlapping(since, until):
+            if (since is None or segment.start > since) and (until is None or segment.end <= until):
+                total += segment.rows
+            else:
+                total += len(segment.window(since, until))
+        return total
+
+    def overlapping_archives(self, since=None, until=None):
+        """Archives compacted from records with since < time <= until, oldest first."""
+        return [
+            archive for archive in self.archives
+            if (since is None or archive.end > since) and (until is None or archive.start <= until)
+        ]
+
+    def archived_count(self, since=None, until=None):
+        """Number of raw records compacted into archives in the window.
+
+        Archives entirely inside the window are counted from the catalog;
+        for those cut by a window edge, the rows of the buckets overlapping
+        the window are counted, so the edges are only as exact as the
+        archive's resolution.
+        """
+        total = 0
+        for archive in self.overlapping_archives(since, until):
+            if (since is None or archive.start > since) and (until is None or archive.end <= until):
+                total += archive.rows
+                continue
+            buckets = archive.buckets()["all"]
+            inside = np.ones(len(buckets), dtype=bool)
+            if since is not None:
+                inside &= buckets["start"] + archive.resolution > since
+            if until is not None:
+                inside &= buckets["start"] <= until
+            total += int(buckets["n"][inside].sum())
+        return total
+
+    def stats(self):
+        return {
+            "segments": [segment.to_dict() for segment in self.segments],
+            "rows": self.rows,
+            "archives": [archive.to_dict() for archive in self.archives],
+        }
+
+    def _inspect(self, bin_path):
+        log = BinaryLog(bin_path)
+        if not log.validate(repair=False):
+            logger.warning("Skipping rotated segment %s: not a binary log", bin_path)
+            return None
+        times = log.records()["time"]
+        size = os.path.getsize(bin_path)
+        if len(times) == 0:
+            return Segment(bin_path, float("inf"), float("-inf"), 0, size)
+        return Segment(bin_path, float(times[0]), float(times[-1]), len(times), size)
+
+    def _save(self):
+        try:
+            # The web and acquisition processes may both save the catalog
+            tmp_path = f"{self.catalog_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    "segments": [segment.to_dict() for segment in self.segments],
+                    "archives": [archive.to_dict() for archive in self.archives],
+                }, f)
+            os.replace(tmp_path, self.catalog_path)
+        except OSError as e:
+            logger.error("Error saving segment catalog: %s", e)
+        self._catalog_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.catalog_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
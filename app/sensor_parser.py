@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Incremental byte-level parser for microDOT output."""
+
+
+class RecordParser:
+    """Turn raw serial bytes into (temperature, do, q) records.
+
+    Bytes are appended to a rolling bytearray so a line split across reads is
+    completed by the next one. Every read, all complete lines are cut off the
+    buffer in one slice and split at the bytes level, and the measurement
+    fields are converted straight from their byte slices with float(); nothing
+    is decoded to str or stripped line by line. Lines that are not readings
+    (command echoes, prompts, noise) are counted and skipped.
+
+    A reading looks like ``<a>,<b>,<temperature>,<do>,<q>[,...]``.
+    """
+
+    def __init__(self, max_line_length=512):
+        self.max_line_length = max_line_length
+        self._buffer = bytearray()
+        self.records = 0
+        self.rejected = 0
+        self.overflows = 0
+
+    def reset(self):
+        """Discard any partial line (e.g. after the port was reopened)."""
+        del self._buffer[:]
+
+    def feed(self, data):
+        """Add bytes read from the port and return every complete record in them."""
+        buf = self._buffer
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            if len(buf) > self.max_line_length:
+                # No line terminator in sight; drop the garbage rather than grow forever
+                self.overflows += 1
+                del buf[:]
+            return []
+        block = bytes(buf[:end])
+        del buf[:end + 1]
+
+        records = []
+        append = records.append
+        for line in block.split(b"\n"):
+            fields = line.split(b",", 5)
+            if len(fields) < 5:
+                # Empty lines (at most a stray \r) are not worth counting
+                if len(line) > 1:
+                    self.rejected += 1
+                continue
+            try:
+                # float() accepts bytes and ignores surrounding whitespace and \r
+                append((float(fields[2]), float(fields[3]), float(fields[4])))
+            except ValueError:
+                self.rejected += 1
+        self.records += len(records)
+        return records
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Several microDOTs on one vehicle, each sampled by its own thread."""
+import logging
+import threading
+
+from serial_sensor import SerialSensor
+
+logger = logging.getLogger(__name__)
+
+# sensor_id is stored as float32, so any small integer works; this bounds
+# typos and matches the serial devices the container can be given
+MAX_SENSOR_ID = 255
+
+
+class SensorChannel:
+    """One sensor: its serial reader and the state of its sampling loop."""
+
+    def __init__(self, sensor_id, port, baudrate):
+        self.id = sensor_id
+        self.reader = SerialSensor(port, baudrate)
+        # Wakes the sampling loop early (config change, stop)
+        self.changed = threading.Event()
+        self.stopping = threading.Event()
+        self.schedule = None  # IntervalScheduler of the current polled run
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.reader.port
+
+
+class SensorManager:
+    """Runs `loop(channel)` in a thread for every configured sensor.
+
+    Each loop only ever blocks on its own port, so a slow or unplugged
+    sensor does not hold up the others. What the loops do with a reading
+    (tagging, the log writer, Mavlink2Rest) is shared, so additional
+    sensors add no HTTP polling or fsyncs of their own.
+    """
+
+    def __init__(self, baudrate, loop):
+        self.baudrate = baudrate
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def __iter__(self):
+        with self._lock:
+            return iter(sorted(self._channels.values(), key=lambda channel: channel.id))
+
+    def __len__(self):
+        return len(self._channels)
+
+    def get(self, sensor_id):
+        return self._channels.get(sensor_id)
+
+    def ports(self):
+        """{sensor_id: port} of every sensor."""
+        return {channel.id: channel.port for channel in self}
+
+    def owner(self, port):
+        """ID of the sensor using `port`, or None."""
+        for channel in self:
+            if channel.port == port:
+                return channel.id
+        return None
+
+    def start(self, sensor_id, port):
+        """Open `port` and start sampling it as `sensor_id`.
+
+        The loop keeps retrying a port that cannot be opened yet.
+        """
+        with self._lock:
+            if sensor_id in self._channels:
+                raise ValueError(f"sensor {sensor_id} is already running")
+            channel = SensorChannel(sensor_id, port, self.baudrate)
+            self._channels[sensor_id] = channel
+        if not channel.reader.open():
+            logger.warning("Failed to open %s for sensor %d. Will retry periodically.", port, sensor_id)
+        channel.thread = threading.Thread(
+            target=self._loop, args=(channel,), name=f"sensor-{sensor_id}", daemon=True
+        )
+        channel.thread.start()
+        return channel
+
+    def stop(self, sensor_id, timeout=5.0):
+        """Stop sampling a sensor and close its port. Returns False if unknown."""
+        with self._lock:
+            channel = self._channels.pop(sensor_id, None)
+        if channel is None:
+            return False
+        channel.stopping.set()
+        channel.changed.set()
+        channel.thread.join(timeout)
+        channel.reader.close()
+        logger.info("Stopped sensor %d on %s", sensor_id, channel.port)
+        return True
+
+    def notify(self):
+        """Wake every sampling loop, e.g. after a sampling config change."""
+        for channel in self:
+            channel.changed.set()
+
+    def stats(self):
+        return [
+            {"sensor_id": channel.id, "port": channel.port, "reader": channel.reader.stats()}
+            for channel in self
+        ]
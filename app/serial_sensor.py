@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Event-driven serial link to the microDOT with a dedicated line reader."""
+import logging
+import queue
+import threading
+import time
+
+import serial
+
+from sensor_parser import RecordParser
+
+logger = logging.getLogger(__name__)
+
+
+class SerialSensor:
+    """Serial port wrapper with a background reader that parses readings.
+
+    The reader thread pulls whatever bytes are available, feeds them to a
+    RecordParser and queues every complete (temperature, do, q) record with
+    its receive time. A command is answered by the first record received
+    after it was written, waiting only until a deadline instead of sleeping a
+    fixed time.
+    `lock` is held only while the port is opened, closed or written to, so a
+    port switch from the API never waits behind a whole sampling cycle.
+    """
+
+    def __init__(self, port, baudrate, read_timeout=0.1, record_queue_size=256):
+        self.port = port
+        self.baudrate = baudrate
+        self.read_timeout = read_timeout
+        self.parser = RecordParser()
+        self.lock = threading.Lock()
+        self.connection = None
+        self._records = queue.Queue(maxsize=record_queue_size)
+        self._reader = None
+        self._generation = 0
+
+        self.records_dropped = 0
+        self.reconnects = 0
+
+    @property
+    def is_open(self):
+        connection = self.connection
+        return connection is not None and connection.is_open
+
+    def open(self, port=None):
+        """(Re)open the serial port, closing any existing connection first."""
+        with self.lock:
+            if port is not None:
+                self.port = port
+            self._close()
+            try:
+                self.connection = serial.Serial(
+                    port=self.port,
+                    baudrate=self.baudrate,
+                    bytesize=serial.EIGHTBITS,
+                    parity=serial.PARITY_NONE,
+                    stopbits=serial.STOPBITS_ONE,
+                    timeout=self.read_timeout
+                )
+            except serial.SerialException as e:
+                logger.error("Error opening serial port %s: %s", self.port, e)
+                self.connection = None
+                return False
+
+            self._generation += 1
+            self.reconnects += 1
+            self.parser.reset()
+            self._drain()
+            self._reader = threading.Thread(
+                target=self._read_loop, args=(self.connection, self._generation),
+                name="serial-reader", daemon=True
+            )
+            self._reader.start()
+            logger.info("Serial port %s opened successfully", self.port)
+            return True
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def write(self, payload):
+        """Write raw bytes to the port. Returns False if the port is unusable."""
+        with self.lock:
+            if not self.is_open:
+                return False
+            try:
+                self.connection.write(payload)
+                return True
+            except (serial.SerialException, OSError) as e:
+                logger.error("Error writing to serial port: %s", e)
+                self._close()
+                return False
+
+    def command(self, payload, timeout):
+        """Send a command and wait up to `timeout` seconds for the reading it returns.
+
+        Records received before the command was written are discarded.
+        Returns (received_at, (temperature, do, q)), received_at being the
+        time.monotonic() the line arrived, or None on timeout or I/O error.
+        """
+        self._drain()
+        sent_at = time.monotonic()
+        if not self.write(payload):
+            return None
+
+        deadline = sent_at + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                received_at, record = self._records.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if received_at >= sent_at:
+                return received_at, record
+
+    def read_record(self, timeout):
+        """Return the next (received_at, (temperature, do, q)), or None after `timeout` seconds."""
+        try:
+            return self._records.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "open": self.is_open,
+            "records": self.parser.records,
+            "rejected_lines": self.parser.rejected,
+            "overflows": self.parser.overflows,
+            "records_dropped": self.records_dropped,
+            "reconnects": self.reconnects,
+        }
+
+    def _drain(self):
+        while True:
+            try:
+                self._records.get_nowait()
+            except queue.Empty:
+                return
+
+    def _close(self):
+        self._generation += 1
+        if self.connection is not None:
+            try:
+                if self.connection.is_open:
+                    self.connection.close()
+                    logger.info("Closed existing serial connection")
+            except Exception as e:
+                logger.error("Error closing existing serial connection: %s", e)
+        self.connection = None
+
+    def _read_loop(self, connection, generation):
+        parser = self.parser
+        while generation == self._generation:
+            try:
+                chunk = connection.read(connection.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if generation == self._generation:
+                    logger.error("Serial read error on %s: %s", self.port, e)
+                    with self.lock:
+                        if generation == self._generation:
+                            self._close()
+                return
+            if not chunk:
+                continue
+
+            received_at = time.monotonic()
+            for record in parser.feed(chunk):
+                self._queue_record(received_at, record)
+
+    def _queue_record(self, received_at, record):
+        try:
+            self._records.put_nowait((received_at, record))
+        except queue.Full:
+            # Nobody is consuming; keep the newest records
+            try:
+                self._records.get_nowait()
+            except queue.Empty:
+                pass
+            self.records_dropped += 1
+            self._records.put_nowait((received_at, record))
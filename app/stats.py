@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Summary statistics of a time window for /api/stats.
+
+For each field the summary is: count, mean, sample standard deviation, min,
+max and rate of change (least-squares slope, units per second).
+
+Trailing windows of standard lengths are kept up to date as samples are
+stored. Each window holds streaming accumulators: Welford mean/variance
+(and the time/value co-moment for the slope), which are updated when a
+sample enters and reversed when it expires, and monotonic deques for min
+and max. A query therefore costs the same however many samples the window
+holds. Any other window is summarized from the store's rollup buckets (see
+MeasurementStore.stats_buckets()).
+"""
+import math
+import re
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from downsample import STATS_FIELDS
+
+# Trailing windows kept incrementally, in seconds (the graph's durations up
+# to an hour)
+STANDARD_WINDOWS = (60, 300, 600, 1800, 3600)
+
+_WINDOW_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_WINDOW_PATTERN = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*([smhd]?)\s*$")
+
+
+def parse_window(text):
+    """Parse a window length like 600, 90s, 10m, 1h or 2d into seconds."""
+    match = _WINDOW_PATTERN.match(str(text).lower())
+    if not match:
+        raise ValueError(f"invalid window {text!r} (use seconds or a number with s, m, h or d)")
+    seconds = float(match.group(1)) * _WINDOW_UNITS[match.group(2)]
+    if seconds <= 0:
+        raise ValueError("window must be longer than 0 seconds")
+    return seconds
+
+
+def _round(value):
+    if value is None or value != value:
+        return None
+    return float(f"{value:.7g}")
+
+
+def _summary(count, mean, m2, low, high, m2_t, co):
+    return {
+        "count": count,
+        "mean": _round(mean) if count else None,
+        "std": _round(math.sqrt(max(m2, 0.0) / (count - 1))) if count > 1 else None,
+        "min": _round(low),
+        "max": _round(high),
+        "rate_per_s": _round(co / m2_t) if count > 1 and m2_t > 0 else None,
+    }
+
+
+class _Moments:
+    """Welford accumulators of one field: value mean/M2 and the time/value co-moment."""
+
+    __slots__ = ("n", "mean", "m2", "mean_t", "m2_t", "co")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = self.m2 = 0.0
+        self.mean_t = self.m2_t = self.co = 0.0
+
+    def add(self, t, value):
+        self.n += 1
+        dt = t - self.mean_t
+        dv = value - self.mean
+        self.mean_t += dt / self.n
+        self.mean += dv / self.n
+        self.m2 += dv * (value - self.mean)
+        self.m2_t += dt * (t - self.mean_t)
+        self.co += dt * (value - self.mean)
+
+    def remove(self, t, value):
+        """Undo add(t, value) for the oldest sample."""
+        if self.n <= 1:
+            self.reset()
+            return
+        self.n -= 1
+        dt = t - self.mean_t
+        dv = value - self.mean
+        self.mean_t -= dt / self.n
+        self.mean -= dv / self.n
+        self.m2 -= dv * (value - self.mean)
+        self.m2_t -= dt * (t - self.mean_t)
+        self.co -= (t - self.mean_t) * dv
+
+
+class _Window:
+    """Streaming statistics of the samples in (now - seconds, now].
+
+    Samples are tuples (time, value of each field), oldest first; NaN values
+    are left out of that field's statistics.
+    """
+
+    def __init__(self, seconds, field_count):
+        self.seconds = seconds
+        self.samples = deque()
+        self.moments = [_Moments() for _ in range(field_count)]
+        # Candidates for the minimum (values increasing) and maximum
+        # (decreasing); the front is the current extreme
+        self.lows = [deque() for _ in range(field_count)]
+        self.highs = [deque() for _ in range(field_count)]
+
+    def add(self, sample):
+        self.samples.append(sample)
+        t = sample[0]
+        for i, value in enumerate(sample[1:]):
+            if value != value:
+                continue
+            self.moments[i].add(t, value)
+            lows, highs = self.lows[i], self.highs[i]
+            while lows and lows[-1][1] >= value:
+                lows.pop()
+            lows.append((t, value))
+            while highs and highs[-1][1] <= value:
+                highs.pop()
+            highs.append((t, value))
+
+    def expire(self, now):
+        cutoff = now - self.seconds
+        samples = self.samples
+        while samples and samples[0][0] <= cutoff:
+            sample = samples.popleft()
+            for i, value in enumerate(sample[1:]):
+                if value == value:
+                    self.moments[i].remove(sample[0], value)
+        for extremes in self.lows + self.highs:
+            while extremes and extremes[0][0] <= cutoff:
+                extremes.popleft()
+
+    def summary(self, i):
+        m = self.moments[i]
+        low = self.lows[i][0][1] if self.lows[i] else None
+        high = self.highs[i][0][1] if self.highs[i] else None
+        return _summary(m.n, m.mean, m.m2, low, high, m.m2_t, m.co)
+
+
+class RollingStats:
+    """Trailing-window statistics of every sensor and each one, kept current
+    from a MeasurementStore.
+
+    add() is registered as a store listener. The windows are (re)filled
+    from the store whenever its index is rebuilt (logs loaded, rotated by
+    another process or deleted), so they also cover samples stored before
+    the process started.
+    """
+
+    def __init__(self, store, windows=STANDARD_WINDOWS, fields=STATS_FIELDS, clock=time.time):
+        self.windows = tuple(sorted(windows))
+        self.fields = tuple(fields)
+        self._store = store
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Sensor ID (None for all sensors) -> {seconds: _Window}
+        self._sensors = {}
+        self._generation = None
+        # Newest sample of the last refill; listeners may still deliver it
+        self._filled_until = -math.inf
+
+    def add(self, records):
+        """Fold newly stored records into every window."""
+        with self._lock:
+            # A refill reads these records from the store as well
+            if not self._sync():
+                self._add(records)
+                self._expire()
+
+    def get(self, seconds, sensor=None, fields=None):
+        """{field: summary} of the trailing window of `seconds`, one of self.windows."""
+        with self._lock:
+            self._sync()
+            self._expire()
+            windows = self._sensors.get(sensor)
+            if windows is None:
+                return {field: _summary(0, 0.0, 0.0, None, None, 0.0, 0.0) for field in fields or self.fields}
+            window = windows[seconds]
+            return {field: window.summary(self.fields.index(field)) for field in fields or self.fields}
+
+    def _sync(self):
+        """Refill the windows if the store was re-indexed; True if it was."""
+        generation = self._store.generation
+        if generation == self._generation or not self._store.ready.is_set():
+            return False
+        self._sensors = {}
+        self._filled_until = -math.inf
+        self._generation = generation
+        records = self._store.window(self._clock() - self.windows[-1])
+        self._add(records)
+        if len(records):
+            self._filled_until = float(records["time"][-1])
+        return True
+
+    def _add(self, records):
+        # Samples older than the longest window, or added by the last refill,
+        # are skipped
+        keep = records["time"] > max(self._filled_until, self._clock() - self.windows[-1])
+        if not np.all(keep):
+            records = records[keep]
+        if len(records) == 0:
+            return
+        columns = [records[field].astype(np.float64).tolist() for field in self.fields]
+        sensor_ids = records["sensor_id"].astype(np.int64).tolist()
+        for t, sensor_id, *values in zip(records["time"].tolist(), sensor_ids, *columns):
+            sample = (t, *values)
+            for key in (None, sensor_id):
+                windows = self._sensors.get(key)
+                if windows is None:
+                    windows = self._sensors[key] = {
+                        seconds: _Window(seconds, len(self.fields)) for seconds in self.windows
+                    }
+                for window in windows.values():
+                    window.add(sample)
+
+    def _expire(self):
+        now = self._clock()
+        for windows in self._sensors.values():
+            for window in windows.values():
+                window.expire(now)
+
+
+def bucket_stats(buckets, fields=STATS_FIELDS):
+    """{field: summary} of every record folded into an array of rollup buckets.
+
+    Mean, variance, min and max are exact. The rate of change is the
+    count-weighted least-squares slope of the bucket means, which is exact
+    for buckets holding single records.
+    """
+    stats = {}
+    times = buckets["t_sum"] / np.maximum(buckets["n"], 1)
+    for field in fields:
+        counts = buckets[f"{field}_n"].astype(np.float64)
+        count = int(counts.sum())
+        if count == 0:
+            stats[field] = _summary(0, 0.0, 0.0, None, None, 0.0, 0.0)
+            continue
+        total = float(buckets[f"{field}_sum"].sum())
+        mean = total / count
+        m2 = float(buckets[f"{field}_sumsq"].sum()) - total * mean
+        low = float(np.nanmin(buckets[f"{field}_min"]))
+        high = float(np.nanmax(buckets[f"{field}_max"]))
+        has = counts > 0
+        weights = counts[has]
+        t = times[has]
+        means = buckets[f"{field}_sum"][has] / weights
+        mean_t = float(np.dot(weights, t)) / count
+        m2_t = float(np.dot(weights, (t - mean_t) ** 2))
+        co = float(np.dot(weights, (t - mean_t) * (means - mean)))
+        stats[field] = _summary(count, mean, m2, low, high, m2_t, co)
+    return stats
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""Time-indexed view of the sensor log used to answer /api/data."""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from applog import RATE_LIMITED
+from binlog import BinaryLog, DTYPE, conform, csv_chunks, encode, to_rows
+from downsample import (BUCKET_DTYPE, OVERSAMPLE, Rollups, aggregate_each, bucket_means, bucket_rows,
+                        lttb_indices, rebucket)
+from ring import RecordRing
+from segments import Archive, SegmentCatalog
+
+logger = logging.getLogger(__name__)
+
+# The in-memory window holds this many hours of samples at this rate
+RECENT_WINDOW_HOURS = 6
+RECENT_SAMPLE_RATE = 5.0
+
+# Bumped when the checkpoint layout changes; older checkpoints are ignored
+CHECKPOINT_VERSION = 2
+
+# stats_buckets() reads windows of up to STATS_RAW_ROWS records raw; larger
+# ones come from the coarsest rollup tier that fits the window at least
+# MIN_STATS_BUCKETS times
+STATS_RAW_ROWS = 10000
+MIN_STATS_BUCKETS = 10
+
+
+class MeasurementStore:
+    """Measurement index backed by the binary log next to the CSV and the
+    rotated segments before it.
+
+    The binary log is opened once at startup (and imported from the CSV the
+    first time), after which the sensor loop appends each stored measurement.
+    Queries memory-map the log and binary search the timestamp column, so a
+    short window only touches the matching tail of the file. The newest
+    records are also kept in an in-memory ring, which answers any window it
+    fully covers without touching the file, and rollup tiers are kept
+    alongside for downsampled views of long windows. Rotated segments that
+    overlap a window are read before the current log, and the rollup tiers
+    span all of them, so "all data" covers every segment still on disk.
+    Segments compacted by the retention policy (see retention.py) only
+    contribute their archived buckets to the rollups. Every sensor also gets
+    rollups of its own, so a query for one sensor is reduced the same way.
+
+    When another process writes the log, follow() keeps this view current by
+    picking up appended records and noticing rotations, compactions and
+    deletions; the store then only reads the files, leaving CSV imports,
+    segments.json and the checkpoint to the writer.
+    Listeners are called with every batch of new records either way.
+
+    The rollups are checkpointed next to the log (after a rebuild, on
+    rotation and at shutdown), so opening the logs again only has to fold in
+    the records appended since, not every row on disk. `ready` is set once
+    the logs have been indexed.
+    """
+
+    def __init__(self, path, recent_capacity=int(RECENT_WINDOW_HOURS * 3600 * RECENT_SAMPLE_RATE)):
+        self.log = BinaryLog(path)
+        self.checkpoint_path = os.path.splitext(str(path))[0] + ".rollups.npz"
+        self.ready = threading.Event()
+        self.segments = SegmentCatalog(os.path.dirname(str(path)))
+        self.rollups = Rollups()
+        # Per sensor_id, built alongside self.rollups
+        self.sensor_rollups = {}
+        self.recent = RecordRing(recent_capacity)
+        # Bumped whenever the stored data changes; used to validate cached responses
+        self.version = 0
+        # Bumped whenever the index is rebuilt from the files or cleared, as
+        # listeners do not see those records
+        self.generation = 0
+        # Bumped whenever stored records are deleted (logs cleared, archives
+        # dropped), so aggregates that cannot be trimmed know to rebuild
+        self.removals = 0
+        self.last_modified = time.time()
+        self.listeners = []
+        # Set by follow(): another process writes the logs
+        self.read_only = False
+        # Identity and length of the log file as last indexed
+        self._inode = None
+        self._indexed = 0
+        # Time of the newest record passed to the listeners
+        self._notified_until = None
+        # Held while the index (rollups, ring, indexed count) changes
+        self._index_lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.log) + self.segments.rows
+
+    def clear(self):
+        """Drop all indexed rows (logs and rotated segments deleted)."""
+        with self._index_lock:
+            self.log.create()
+            self.segments.clear()
+            self.rollups.clear()
+            self.sensor_rollups = {}
+            self.recent.clear()
+            self._mark_indexed(0)
+            self._remove_checkpoint()
+            self.generation += 1
+            self.removals += 1
+            self.ready.set()
+        self._changed()
+
+    def rotate(self, backup_path):
+        """Move the current log aside next to a rotated CSV and start a new one.
+
+        The rotated log becomes a segment; the rollups still cover it.
+        """
+        with self._index_lock:
+            self.log.close()
+            if self.log.exists():
+                os.rename(self.log.path, str(backup_path))
+                self.segments.add(backup_path)
+            self.log.create()
+            self.recent.clear()
+            self._mark_indexed(0)
+            # The checkpoint named the rotated log's rows as part of the
+            # current log; the new one names them as a segment
+            self.save_checkpoint()
+
+    def outdated(self):
+        """Whether the current log is in an older schema (and must not be appended to)."""
+        return self.log.exists() and self.log.dtype != DTYPE
+
+    def load(self, csv_path):
+        """Open the binary log, importing it from the CSV log if needed.
+
+        A log in an older schema is opened as is; the log writer moves it
+        aside as a segment before appending (see LogWriter).
+        """
+        if self.log.exists() and self.log.validate():
+            logger.info("Opened binary log %s with %d records", self.log.path, len(self.log))
+        elif os.path.exists(csv_path):
+            self.log.import_csv(csv_path)
+        else:
+            self.log.create()
+        if self.segments.scan():
+            logger.info("Found %d rotated log segments with %d records", len(self.segments), self.segments.rows)
+        with self._index_lock:
+            self._reindex()
+        return len(self)
+
+    def _reindex(self):
+        """Rebuild the rollups and the recent ring from the files on disk.
+
+        The rollups are restored from the checkpoint if it still matches the
+        files, and only rebuilt from every row otherwise.
+        """
+        records = conform(self.log.records())
+        restored = self._restore_checkpoint(records)
+        if restored is not None:
+            rollups, sensor_rollups, covered = restored
+            _roll_up(records[covered:], rollups, sensor_rollups)
+            logger.info("Restored rollups from %s (%d newer records added)", self.checkpoint_path, len(records) - covered)
+        else:
+            # Rollups span every segment, built one file at a time, and are
+            # swapped in whole so queries never see a half-built set
+            start = time.perf_counter()
+            rollups, sensor_rollups = Rollups(), {}
+            # Tiers are filled in time order; archives are the oldest data
+            for source in sorted(self.segments.archives + self.segments.segments, key=lambda s: s.start):
+                if isinstance(source, Archive):
+                    _add_archive(source, rollups, sensor_rollups)
+                else:
+                    _roll_up(source.records(), rollups, sensor_rollups)
+            _roll_up(records, rollups, sensor_rollups)
+            logger.info("Built rollups from %d records in %.1f s", len(self), time.perf_counter() - start)
+        self.rollups, self.sensor_rollups = rollups, sensor_rollups
+        self.recent.load(records)
+        self._mark_indexed(len(records))
+        if self._notified_until is None:
+            # Everything on disk when the logs are first read is history
+            self._notified_until = self.newest_time()
+        self.generation += 1
+        self.ready.set()
+        if restored is None:
+            self.save_checkpoint()
+        self._changed()
+
+    def save_checkpoint(self):
+        """Write the rollups and what they cover to the checkpoint file."""
+        if not self.ready.is_set() or self.read_only:
+            return False
+        with self._index_lock:
+            indexed = self._indexed
+            times = self.log.records()["time"][:indexed]
+            if len(times) < indexed:
+                # The log was removed or replaced under us; the next load rebuilds
+                return False
+            meta = {
+                "version": CHECKPOINT_VERSION,
+                "bucket_dtype": str(BUCKET_DTYPE.descr),
+                "resolutions": [tier.resolution for tier in self.rollups.tiers],
+                "segments": [[segment.name, segment.rows] for segment in self.segments.segments],
+                "archives": [[archive.name, archive.rows] for archive in self.segments.archives],
+                "log_rows": indexed,
+                "log_first": float(times[0]) if indexed else None,
+                "log_last": float(times[-1]) if indexed else None,
+            }
+            arrays = {f"all/{resolution}": buckets for resolution, buckets in self.rollups.snapshot().items()}
+            for sensor_id, rollups in self.sensor_rollups.items():
+                for resolution, buckets in rollups.snapshot().items():
+                    arrays[f"{sensor_id}/{resolution}"] = buckets
+        # Both processes may save; each writes its own temporary file
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+            os.replace(tmp_path, self.checkpoint_path)
+            return True
+        except OSError as e:
+            logger.error("Error saving rollup checkpoint: %s", e)
+            return False
+
+    def _restore_checkpoint(self, records):
+        """(rollups, sensor_rollups, covered log rows) from a matching checkpoint, or None."""
+        try:
+            with np.load(self.checkpoint_path) as checkpoint:
+                meta = json.loads(str(checkpoint["meta"]))
+                covered = meta["log_rows"]
+                if (meta["version"] != CHECKPOINT_VERSION
+                        or meta["bucket_dtype"] != str(BUCKET_DTYPE.descr)
+                        or meta["resolutions"] != [tier.resolution for tier in Rollups().tiers]
+                        or meta["segments"] != [[segment.name, segment.rows] for segment in self.segments.segments]
+                        or meta["archives"] != [[archive.name, archive.rows] for archive in self.segments.archives]
+                        or covered > len(records)
+                        or covered and (records["time"][0] != meta["log_first"]
+                                        or records["time"][covered - 1] != meta["log_last"])):
+                    logger.info("Rollup checkpoint does not match the logs, rebuilding")
+                    return None
+                snapshots = {}
+                for key in checkpoint.files:
+                    if key != "meta":
+                        owner, resolution = key.split("/")
+                        snapshots.setdefault(owner, {})[float(resolution)] = checkpoint[key]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable rollup checkpoint %s: %s", self.checkpoint_path, e)
+            return None
+        rollups = Rollups.restore(snapshots.pop("all"))
+        sensor_rollups = {int(owner): Rollups.restore(snapshot) for owner, snapshot in snapshots.items()}
+        return rollups, sensor_rollups, covered
+
+    def _remove_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+
+    def compact_segment(self, segment, archive):
+        """Replace a rotated segment by the archive of its rollups.
+
+        The rollups already hold the same buckets, so only the catalog and
+        the checkpoint change; the caller deletes the segment's files.
+        """
+        with self._index_lock:
+            self.segments.compact(segment, archive)
+            self.save_checkpoint()
+        self._changed()
+
+    def drop_archive(self, archive):
+        """Delete an archive and take its data out of the rollups.
+
+        Archives are the oldest data, so the rollups are trimmed to start
+        where the next oldest data does.
+        """
+        with self._index_lock:
+            self.segments.remove_archive(archive)
+            try:
+                os.remove(archive.path)
+            except FileNotFoundError:
+                pass
+            starts = [source.start for source in self.segments.archives + self.segments.segments]
+            if len(self.log):
+                starts.append(float(self.log.records()["time"][0]))
+            oldest = min(starts, default=np.inf)
+            self.rollups.trim(oldest)
+            for rollups in self.sensor_rollups.values():
+                rollups.trim(oldest)
+            self.removals += 1
+            self.save_checkpoint()
+        self._changed()
+
+    def append(self, measurement):
+        """Add a freshly stored measurement dict to the log."""
+        self.append_many([measurement])
+
+    def append_many(self, measurements):
+        """Add a batch of measurement dicts to the log with a single write."""
+        payload = b"".join(encode(m) for m in measurements)
+        records = np.frombuffer(payload, dtype=DTYPE)
+        with self._index_lock:
+            self.log.append_bytes(payload)
+            self.recent.append(records)
+            _roll_up(records, self.rollups, self.sensor_rollups)
+            self._indexed += len(records)
+        self._changed(records)
+
+    def refresh(self):
+        """Index records another process appended to the log since the last call.
+
+        A log that was replaced (rotated or deleted) is re-read from scratch,
+        and so are the segments when the writer changed their catalog
+        (compaction). Returns the number of new records.
+        """
+        with self._index_lock:
+            try:
+                inode = os.stat(self.log.path).st_ino
+            except FileNotFoundError:
+                return 0
+            # Rotation and compaction keep every row (an archive counts the
+            # rows it summarizes); fewer rows afterwards means some were deleted
+            rows = self._stored_rows()
+            if inode == self._inode and self.segments.changed_on_disk():
+                logger.info("Log segments were changed by the writer, re-reading them")
+                self.segments.scan()
+                self._reindex()
+                if self._stored_rows() < rows:
+                    self.removals += 1
+            if inode != self._inode or len(self.log) < self._indexed:
+                logger.info("Binary log was replaced by the writer, re-reading the logs")
+                self.log.validate(repair=False)
+                self.segments.scan()
+                self._reindex()
+                if self._stored_rows() < rows:
+                    self.removals += 1
+                # Listeners get what was stored since the last records they
+                # saw, which may include the tail of a rotated log
+                records = self.window(self._notified_until)
+                if len(records):
+                    self._changed(records)
+                return len(records)
+            records = conform(self.log.records()[self._indexed:])
+            if len(records) == 0:
+                return 0
+            self.recent.append(records)
+            _roll_up(records, self.rollups, self.sensor_rollups)
+            self._indexed += len(records)
+            self._changed(records)
+            return len(records)
+
+    def follow(self, interval=0.25):
+        """Start a thread calling refresh() every `interval` seconds.
+
+        From then on the store is read-only: the process writing the logs
+        imports rotated CSVs and saves the segment catalog and checkpoint.
+        """
+        self.read_only = True
+        self.segments.read_only = True
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error("Error following binary log: %s", e, extra=RATE_LIMITED)
+                time.sleep(interval)
+        thread = threading.Thread(target=loop, name="store-follower", daemon=True)
+        thread.start()
+        return thread
+
+    def _mark_indexed(self, count):
+        try:
+            self._inode = os.stat(self.log.path).st_ino
+        except FileNotFoundError:
+            self._inode = None
+        self._indexed = count
+
+    def newest_time(self):
+        """Time of the newest stored record (epoch seconds), or None if there is none."""
+        times = self.log.records()["time"]
+        if len(times):
+            return float(times[-1])
+        return max((segment.end for segment in self.segments.segments if segment.rows), default=None)
+
+    def _stored_rows(self):
+        """Rows in the current log, the segments and (as raw rows) the archives."""
+        return self._indexed + self.segments.rows + self.segments.archived_rows
+
+    def _changed(self, records=None):
+        self.last_modified = time.time()
+        self.version += 1
+        if records is not None and len(records):
+            self._notified_until = float(records["time"][-1])
+            for listener in self.listeners:
+                try:
+                    listener(records)
+                except Exception as e:
+                    logger.error("Error in store listener: %s", e, extra=RATE_LIMITED)
+
+    def sync(self):
+        """Force appended measurements to stable storage."""
+        self.log.sync()
+
+    def close(self):
+        """Release the append handle on the log file."""
+        self.log.close()
+
+    def sensor_ids(self):
+        """IDs of the sensors with stored records."""
+        return sorted(self.sensor_rollups)
+
+    def iter_window(self, since=None, until=None, sensor=None):
+        """Yield the raw records of a time window (epoch seconds), oldest first,
+        one segment at a time and then the current log.
+
+        Only segments overlapping the window are opened. Open-ended windows
+        of the current log covered by the in-memory ring are copied from it;
+        anything else is a zero-copy slice of a memory-mapped file. With
+        `sensor`, only that sensor's records are yielded.
+        """
+        for segment in self.segments.overlapping(since, until):
+            records = segment.window(since, until)
+            if len(records):
+                yield _only(records, sensor)
+        if until is None and self.recent.covers(since):
+            yield _only(self.recent.since(since), sensor)
+        else:
+            yield _only(conform(self.log.window(since, until)), sensor)
+
+    def window(self, since=None, until=None, sensor=None):
+        """Return the raw records for a time window as a single array."""
+        parts = list(self.iter_window(since, until, sensor))
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def count(self, since=None, until=None, sensor=None):
+        """Number of records in a time window, without reading whole segments.
+
+        Records compacted into archives are counted too (see
+        SegmentCatalog.archived_count()). For a single sensor the count comes
+        from its finest rollup tier and includes the rest of the bucket the
+        window starts in.
+        """
+        if sensor is None:
+            return self._raw_count(since, until) + self.segments.archived_count(since, until)
+        rollups = self.sensor_rollups.get(sensor)
+        return rollups.tiers[0].rows(since, until) if rollups else 0
+
+    def _raw_count(self, since=None, until=None):
+        """Number of raw records (segments and current log) in a time window."""
+        return self.segments.count(since, until) + len(self.log.window(since, until))
+
+    def select(self, since=None, max_points=0, mode="lttb", sensor=None):
+        """Decide what a query for the window newer than `since` returns.
+
+        Returns (kind, parts, scanned): kind is "records" (raw rows) or
+        "buckets" (mean/min/max rows), parts() yields the arrays to serve,
+        oldest first, and scanned is how many stored rows (or rollup buckets)
+        are read to answer. With max_points <= 0 every stored row is
+        returned, streamed one segment at a time, up to the newest row
+        stored when select() was called: parts() may be called once per
+        column (see json_columns()) and must yield the same rows each time.
+        If the window holds more than max_points rows it is reduced:
+        mode="lttb" keeps representative samples, mode="minmax" returns
+        per-bucket mean/min/max rows. Windows too large to reduce from raw
+        rows are served from a rollup tier, so memory use stays bounded
+        however many segments the window spans; a window too short for even
+        the finest tier to fill max_points is reduced from its raw rows
+        instead. A window reaching into compacted segments, whose raw rows
+        are gone, is always served from a rollup tier.
+        `sensor` restricts the answer to one sensor's readings.
+        """
+        if max_points <= 0:
+            until = self.newest_time()
+            if until is None:
+                return "records", lambda: iter([]), 0
+            scanned = self._raw_count(since, until) if sensor is None else self.count(since, until, sensor)
+            return "records", lambda: self.iter_window(since, until, sensor), scanned
+
+        count = self.count(since, sensor=sensor)
+        archived = bool(self.segments.overlapping_archives(since))
+
+        tier = None
+        if archived or count > max_points * OVERSAMPLE:
+            rollups = self.rollups if sensor is None else self.sensor_rollups.get(sensor, Rollups())
+            tier = rollups.select(since, None, max_points)
+            if not archived and tier.count(since) < max_points:
+                tier = None
+        if tier is None:
+            records = self.window(since, sensor=sensor)
+            if len(records) <= max_points:
+                return "records", lambda: iter([records]), len(records)
+            if mode == "minmax":
+                buckets = rebucket(aggregate_each(records), max_points)
+                return "buckets", lambda: iter([buckets]), len(records)
+            selected = records[lttb_indices(records["time"], records["do"], max_points)]
+            return "records", lambda: iter([selected]), len(records)
+
+        buckets = tier.window(since)
+        scanned = len(buckets)
+        if mode == "minmax":
+            buckets = rebucket(buckets, max_points)
+        else:
+            times = buckets["t_sum"] / np.maximum(buckets["n"], 1)
+            buckets = buckets[lttb_indices(times, bucket_means(buckets, "do"), max_points)]
+        return "buckets", lambda: iter([buckets]), scanned
+
+    def query(self, since=None, max_points=0, mode="lttb", sensor=None):
+        """Return measurement dicts newer than `since` (epoch seconds), oldest first.
+
+        See select() for how the window is reduced to max_points.
+        """
+        kind, parts, _ = self.select(since, max_points, mode, sensor)
+        convert = to_rows if kind == "records" else bucket_rows
+        return [row for part in parts() for row in convert(part)]
+
+    def stats_buckets(self, since=None, until=None, sensor=None):
+        """Buckets holding exactly the records of (since, until], for bucket_stats().
+
+        Small windows are read raw, one bucket per record. Otherwise the
+        whole buckets of the coarsest rollup tier that fits the window at
+        least MIN_STATS_BUCKETS times are used as they are, and the records
+        in the partial buckets at either end are read raw, so the edges of
+        the window are exact. A window reaching into compacted segments has
+        no raw records there, so it is answered from whole buckets (of the
+        finest tier if no tier fits it MIN_STATS_BUCKETS times), exact only
+        to the bucket. Returns (buckets, scanned).
+        """
+        rollups = self.rollups if sensor is None else self.sensor_rollups.get(sensor)
+        if rollups is None:
+            return np.zeros(0, dtype=BUCKET_DTYPE), 0
+        span = np.inf if since is None else (time.time() if until is None else until) - since
+        tier = next((tier for tier in reversed(rollups.tiers) if span >= tier.resolution * MIN_STATS_BUCKETS), None)
+        if self.segments.overlapping_archives(since, until):
+            buckets = (tier or rollups.tiers[0]).window(since, until)
+            return buckets, len(buckets)
+        if tier is None or rollups.tiers[0].rows(since, until) <= STATS_RAW_ROWS:
+            records = self.window(since, until, sensor)
+            return aggregate_each(records), len(records)
+
+        resolution = tier.resolution
+        lo = None if since is None else np.ceil(since / resolution) * resolution
+        hi = None if until is None else np.floor(until / resolution) * resolution
+        buckets = tier.window(lo, hi)
+        whole = np.ones(len(buckets), dtype=bool)
+        if lo is not None:
+            whole &= buckets["start"] >= lo
+        if hi is not None:
+            whole &= buckets["start"] < hi
+        parts = [buckets[whole]]
+        scanned = len(parts[0])
+        # window() is (since, until]; the edges are (since, lo) and [hi, until]
+        if lo is not None:
+            records = self.window(since, np.nextafter(lo, -np.inf), sensor)
+            parts.append(aggregate_each(records))
+            scanned += len(records)
+        if hi is not None:
+            records = self.window(np.nextafter(hi, -np.inf), until, sensor)
+            parts.append(aggregate_each(records))
+            scanned += len(records)
+        return np.concatenate(parts), scanned
+
+    def export_csv(self, since=None, until=None):
+        """Yield the measurements in a time window, across every segment, as CSV text."""
+        return csv_chunks(self.iter_window(since, until))
+
+
+def _only(records, sensor):
+    """The records of one sensor (all of them if sensor is None)."""
+    if sensor is None:
+        return records
+    return records[records["sensor_id"] == sensor]
+
+
+def _add_archive(archive, rollups, sensor_rollups):
+    """Fold a compacted segment's buckets into the all-sensor rollups and each sensor's own."""
+    for owner, buckets in archive.buckets().items():
+        if owner == "all":
+            rollups.add_buckets(buckets)
+        else:
+            sensor_rollups.setdefault(owner, Rollups()).add_buckets(buckets)
+
+
+def _roll_up(records, rollups, sensor_rollups):
+    """Fold records into the all-sensor rollups and each sensor's own."""
+    if len(records) == 0:
+        return
+    rollups.add(records)
+    ids = records["sensor_id"]
+    first = ids[0]
+    # Usually one sensor per batch; split only when there are several
+    if np.all(ids == first):
+        groups = [(first, records)]
+    else:
+        groups = [(sensor_id, records[ids == sensor_id]) for sensor_id in np.unique(ids)]
+    for sensor_id, group in groups:
+        sensor_id = int(sensor_id)
+        if sensor_id not in sensor_rollups:
+            sensor_rollups[sensor_id] = Rollups()
+        sensor_rollups[sensor_id].add(group)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Fan-out of newly stored measurements to /api/stream subscribers (SSE)."""
+import json
+import threading
+from collections import deque
+
+
+class Broadcaster:
+    """Shared, bounded buffer of recent events that every subscriber reads from.
+
+    publish() encodes an event once and appends it to a ring of the last
+    `buffer_size` events; it never waits on subscribers. Each subscriber only
+    keeps a cursor (the last sequence number it sent). A client that falls so
+    far behind that its next event has already left the ring is sent a
+    "reset" event instead, telling it to reload a snapshot from /api/data,
+    so one slow browser can neither block acquisition nor grow memory.
+
+    Each subscriber holds a server thread for as long as it is connected,
+    so at most `max_subscribers` (0 for no limit) are let in at a time.
+    """
+
+    def __init__(self, buffer_size=256, keepalive=15.0, max_subscribers=0):
+        self.keepalive = keepalive
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.subscribers = 0
+        self.published = 0
+        self.resets = 0
+        self.rejected = 0
+
+    def publish(self, event, data):
+        """Queue an event for all subscribers."""
+        payload = json.dumps(data)
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, f"id: {self._seq}\nevent: {event}\ndata: {payload}\n\n"))
+            self.published += 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "subscribers": self.subscribers,
+                "max_subscribers": self.max_subscribers,
+                "rejected": self.rejected,
+                "published": self.published,
+                "resets": self.resets,
+                "buffered": len(self._events),
+                "last_id": self._seq,
+            }
+
+    def subscribe(self, last_event_id=None):
+        """Iterable of SSE text for one client, starting after last_event_id.
+
+        Returns None if max_subscribers are already connected. The client's
+        slot is freed when the iterable is closed (the WSGI server closes it
+        when the connection ends).
+        """
+        with self._cond:
+            if self.max_subscribers and self.subscribers >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self.subscribers += 1
+            if last_event_id is None or last_event_id > self._seq:
+                cursor = self._seq
+            else:
+                cursor = last_event_id
+        return _Subscription(self, self._stream(cursor))
+
+    def _unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def _stream(self, cursor):
+        # Ask the browser to retry quickly if the connection drops
+        yield "retry: 3000\n\n"
+        while True:
+            with self._cond:
+                if cursor >= self._seq:
+                    self._cond.wait(self.keepalive)
+                pending = [text for seq, text in self._events if seq > cursor]
+                oldest = self._events[0][0] if self._events else self._seq + 1
+                behind = cursor + 1 < oldest and cursor < self._seq
+                cursor = self._seq
+
+            if behind:
+                # Missed events already dropped from the buffer; resync instead
+                with self._cond:
+                    self.resets += 1
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+            elif pending:
+                yield "".join(pending)
+            else:
+                yield ": keepalive\n\n"
+
+
+class _Subscription:
+    """One subscriber's event stream; close() frees its slot, even if it was never read."""
+
+    def __init__(self, broadcaster, events):
+        self._broadcaster = broadcaster
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._broadcaster._unsubscribe()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""/api/data latency on synthetic logs of different sizes.
+
+For each log size a synthetic CSV log is generated in a temporary log
+directory and the extension is started on it in a fresh process (so the
+one-time binary log import is measured as startup time). Every query the
+web interface and the widget make is then timed through Flask's test client,
+both with the response cache disabled (each request does the work) and
+enabled (repeated polls). Results are saved as JSON under bench/results/.
+
+    python bench/bench_api.py --sizes 1M,10M,100M,1G [--repeat 20] [--interval 1.0]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import format_size, parse_size, percentiles, save_results
+
+# Queries made by static/index.html (each duration choice) and static/widget.html
+FRONTEND_QUERIES = [
+    "/api/data?duration=1&max_points=500&sensor=0",
+    "/api/data?duration=5&max_points=500&sensor=0",
+    "/api/data?duration=10&max_points=500&sensor=0",
+    "/api/data?duration=30&max_points=500&sensor=0",
+    "/api/data?max_points=500&sensor=0",
+]
+
+
+def time_requests(client, url, repeat, headers=None):
+    latencies = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers or {})
+        body = response.get_data()
+        latencies.append((time.perf_counter() - start) * 1000)
+        size = len(body)
+    return {"latency_ms": percentiles(latencies), "bytes": size, "status": response.status_code}
+
+
+def bench_log_dir(log_dir, repeat):
+    """Start the extension on log_dir in this process and time every frontend query."""
+    os.environ["PME_LOG_DIR"] = log_dir
+    os.environ.setdefault("PME_LOG_LEVEL", "WARNING")
+    start = time.perf_counter()
+    import main
+    main.prepare_logs()
+    startup = time.perf_counter() - start
+    from cache import ResponseCache
+
+    client = main.app.test_client()
+    results = {"startup_s": startup, "rows": len(main.STORE), "queries": {}}
+    cached_cache = main.DATA_CACHE
+    for url in FRONTEND_QUERIES:
+        # A cache that keeps nothing, so every request reads and encodes the window
+        main.DATA_CACHE = ResponseCache(max_entries=0)
+        uncached = time_requests(client, url, repeat)
+        gzipped = time_requests(client, url, repeat, {"Accept-Encoding": "gzip"})
+        main.DATA_CACHE = cached_cache
+        time_requests(client, url, 1)
+        cached = time_requests(client, url, repeat)
+        results["queries"][url] = {
+            "uncached": uncached,
+            "uncached_gzip": gzipped,
+            "cached": cached,
+            "rows_returned": len(json.loads(client.get(url).get_data())),
+        }
+    return results
+
+
+def bench_size(size, repeat, interval, keep):
+    """Generate a log of `size` bytes and benchmark it in a child process."""
+    from make_logs import generate_log
+
+    log_dir = tempfile.mkdtemp(prefix=f"pme-bench-{format_size(size)}-")
+    try:
+        start = time.perf_counter()
+        _, rows = generate_log(log_dir, size, interval)
+        generate_s = time.perf_counter() - start
+        result_path = os.path.join(log_dir, "result.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--log-dir", log_dir,
+             "--repeat", str(repeat), "--output", result_path],
+            check=True,
+        )
+        with open(result_path) as f:
+            result = json.load(f)
+        result.update(csv_bytes=os.path.getsize(os.path.join(log_dir, "sensor_data.csv")),
+                      csv_rows=rows, generate_s=generate_s)
+        return result
+    finally:
+        if not keep:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="1M,10M,100M", help="comma-separated CSV log sizes (1M to 1G)")
+    parser.add_argument("--repeat", type=int, default=20, help="requests per query and cache setting")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between synthetic readings")
+    parser.add_argument("--keep-logs", action="store_true", help="keep the generated log directories")
+    parser.add_argument("--log-dir", help=argparse.SUPPRESS)  # internal: benchmark one existing log dir
+    parser.add_argument("--output", help="result file (default: bench/results/api-<time>.json)")
+    args = parser.parse_args()
+
+    if args.log_dir:
+        with open(args.output, "w") as f:
+            json.dump(bench_log_dir(args.log_dir, args.repeat), f)
+        return
+
+    results = {}
+    for text in args.sizes.split(","):
+        size = parse_size(text)
+        result = bench_size(size, args.repeat, args.interval, args.keep_logs)
+        results[format_size(size)] = result
+        print(f"{format_size(size)}: {result['rows']} rows, startup {result['startup_s']:.2f} s")
+        for url, query in result["queries"].items():
+            print(f"  {url:40s} uncached p50 {query['uncached']['latency_ms']['p50']:8.2f} ms"
+                  f"  cached p50 {query['cached']['latency_ms']['p50']:6.2f} ms"
+                  f"  {query['rows_returned']} rows")
+    params = {"sizes": args.sizes, "repeat": args.repeat, "interval": args.interval, "queries": FRONTEND_QUERIES}
+    path = save_results("api", params, results, args.output)
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Per-record cost of parsing microDOT output.
+
+Compares the old str-based path (decode the buffer, split into lines, strip,
+split on commas, float each field) with RecordParser, which works on the raw
+bytes read from the port. The synthetic stream is cut into fixed-size chunks,
+like serial reads, so records are split across reads.
+
+    python bench/bench_parser.py [--records 100000] [--chunk-size 64] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from sensor_parser import RecordParser  # noqa: E402
+
+
+def make_stream(count):
+    rng = random.Random(0)
+    lines = []
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append(b"MDOT\r\n")
+        lines.append(
+            f"0,{1700000000 + i},{20 + rng.random():.3f},{8 + rng.random():.3f},0.950\r\n".encode()
+        )
+    return b"".join(lines)
+
+
+def chunks(stream, size):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def legacy_parse(chunk_list):
+    """The old clean_response() approach, minus its per-line prints."""
+    records = []
+    pending = ""
+    for chunk in chunk_list:
+        text = pending + chunk.decode("utf-8", errors="replace")
+        lines = text.split("\n")
+        pending = lines.pop()
+        for line in [line.strip() for line in lines if line.strip()]:
+            if "," not in line:
+                continue
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) < 5:
+                continue
+            try:
+                records.append((float(parts[2]), float(parts[3]), float(parts[4])))
+            except ValueError:
+                continue
+    return records
+
+
+def parser_parse(chunk_list):
+    parser = RecordParser()
+    records = []
+    for chunk in chunk_list:
+        records.extend(parser.feed(chunk))
+    return records
+
+
+def bench(name, func, chunk_list, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = func(chunk_list)
+        best = min(best, time.perf_counter() - start)
+    per_record = best / len(records) * 1e9
+    print(f"{name:<14} {len(records):>8} records  {best * 1e3:8.2f} ms  {per_record:7.0f} ns/record")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--records", type=int, default=100000, help="records in the synthetic stream")
+    parser.add_argument("--chunk-size", type=int, default=64, help="bytes per simulated serial read")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per parser (the best is reported)")
+    args = parser.parse_args()
+
+    chunk_list = chunks(make_stream(args.records), args.chunk_size)
+    print(f"{args.records} records in {len(chunk_list)} chunks of {args.chunk_size} bytes")
+
+    legacy = bench("str/split", legacy_parse, chunk_list, args.repeat)
+    parsed = bench("RecordParser", parser_parse, chunk_list, args.repeat)
+    assert legacy == parsed, "parsers disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Sampling throughput and latency of read_sensor_loop() off-vehicle.
+
+Runs the extension's acquisition (sensor loops, log writer, telemetry and
+Mavlink2Rest forwarding) in this process against one or more microDOT
+simulators and the fake Mavlink2Rest, in a temporary log directory, and
+reports how many
+readings were stored, how evenly they were spaced (on their monotonic
+capture times), polling jitter, per-stage latency histograms and CPU use. Results are saved as JSON under bench/results/.
+
+    python bench/bench_sampling.py --mode polled --interval 0.5 --latency 0.05 --duration 30
+    python bench/bench_sampling.py --mode polled --interval 0.5 --latency 0.6 --schedule catch_up
+    python bench/bench_sampling.py --mode continuous --rate 20 --duration 30
+    python bench/bench_sampling.py --mode continuous --rate 20 --sensors 3
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from common import histogram_summary, percentiles, save_results
+from simulators import FakeMavlink2Rest, MicroDotSimulator
+
+
+def run(args):
+    sims = [MicroDotSimulator(args.latency, args.jitter, stream_rate=args.rate, seed=i).start()
+            for i in range(args.sensors)]
+    mavlink = FakeMavlink2Rest(latency=args.m2r_latency).start()
+    log_dir = tempfile.mkdtemp(prefix="pme-bench-")
+    with open(os.path.join(log_dir, "serial_config.json"), "w") as f:
+        json.dump({"sensors": [{"id": i, "port": sim.port} for i, sim in enumerate(sims)]}, f)
+    sampling = {"mode": args.mode, "interval": args.interval, "schedule": args.schedule}
+    if args.mode == "continuous":
+        sampling.update(start_command="STREAM", stop_command="STOP")
+    with open(os.path.join(log_dir, "sampling_config.json"), "w") as f:
+        json.dump(sampling, f)
+
+    # The extension reads these at import time
+    os.environ["PME_LOG_DIR"] = log_dir
+    os.environ["PME_MAVLINK2REST_URL"] = mavlink.url
+    os.environ.setdefault("PME_LOG_LEVEL", "WARNING")
+    import main
+
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    main.start_acquisition()
+    time.sleep(args.duration)
+    main.LOG_WRITER.stop()
+    wall = time.time() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Spacing is measured per sensor
+    gaps = []
+    for sensor_id in range(args.sensors):
+        times = main.STORE.window(wall_start, sensor=sensor_id)["monotonic"].tolist()
+        gaps += [(b - a) * 1000 for a, b in zip(times, times[1:])]
+    samples = len(main.STORE.window(wall_start))
+    target_ms = (1000 / args.rate if args.mode == "continuous" else args.interval * 1000)
+    results = {
+        "samples": samples,
+        "samples_per_s": samples / wall,
+        "interval_ms": percentiles(gaps),
+        "interval_error_ms": percentiles([abs(gap - target_ms) for gap in gaps]),
+        "cpu_s": cpu,
+        "cpu_percent": 100 * cpu / wall,
+        "stages": histogram_summary(main.SAMPLE_STAGE_SECONDS),
+        "log_write": histogram_summary(main.LOG_WRITER.write_seconds),
+        "log_fsync": histogram_summary(main.LOG_WRITER.fsync_seconds),
+        "mavlink_requests": histogram_summary(main.MAVLINK.request_seconds),
+        "telemetry_poll": histogram_summary(main.TELEMETRY.poll_seconds),
+        "sample_results": {",".join(k): c.value for k, c in main.SAMPLES._children.items()},
+        "overruns": main.SAMPLE_OVERRUNS.labels().value,
+        "schedule": main.schedule_status(),
+        "jitter": histogram_summary(main.SAMPLE_JITTER_SECONDS),
+        "writer": main.LOG_WRITER.stats(),
+        "sensors": main.SENSORS.stats(),
+        "simulators": [sim.stats() for sim in sims],
+        "fake_mavlink2rest": mavlink.stats(),
+    }
+    # The sensor loop keeps running; keep its complaints about the
+    # simulator going away out of the output
+    logging.disable(logging.CRITICAL)
+    for sim in sims:
+        sim.stop()
+    mavlink.stop()
+    shutil.rmtree(log_dir, ignore_errors=True)
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mode", choices=("polled", "continuous"), default="polled")
+    parser.add_argument("--interval", type=float, default=1.0, help="polling interval in seconds")
+    parser.add_argument("--latency", type=float, default=0.3, help="simulated MDOT response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds on the response time")
+    parser.add_argument("--sensors", type=int, default=1, help="number of simulated sensors")
+    parser.add_argument("--schedule", choices=("skip", "catch_up"), default="skip",
+                        help="what polled mode does after an overrun")
+    parser.add_argument("--rate", type=float, default=10.0, help="readings per second in continuous mode")
+    parser.add_argument("--m2r-latency", type=float, default=0.005, help="fake Mavlink2Rest response time")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to sample")
+    parser.add_argument("--output", help="result file (default: bench/results/sampling-<time>.json)")
+    args = parser.parse_args()
+
+    results = run(args)
+    path = save_results("sampling", vars(args), results, args.output)
+    interval = results["interval_ms"]
+    print(f"{results['samples']} samples in {args.duration:.0f} s ({results['samples_per_s']:.2f}/s), "
+          f"interval p50 {interval.get('p50', 0):.1f} ms p99 {interval.get('p99', 0):.1f} ms, "
+          f"CPU {results['cpu_percent']:.1f}%")
+    if args.mode == "polled":
+        for schedule in results["schedule"]["sensors"]:
+            print(f"Sensor {schedule['sensor_id']}: jitter mean {schedule.get('jitter_mean_ms', 0):.2f} ms "
+                  f"max {schedule.get('jitter_max_ms', 0):.2f} ms, {schedule.get('skipped', 0)} polls skipped")
+    print(f"{results['overruns']:.0f} overruns, {results['writer']['flush_count']} log flushes for {results['writer']['rows_written']} rows")
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
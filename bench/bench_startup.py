@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Time from process start until the extension serves requests.
+
+For each log size a synthetic CSV log is generated and the extension is
+started on it (as in the container: waitress, acquisition in its own
+process) three times:
+
+    cold:          only the legacy CSV; the binary log is imported
+    warm:          binary log and rollup checkpoint from the previous run
+    no_checkpoint: binary log, checkpoint removed, so rollups are rebuilt
+
+Each run reports how long until the HTTP server answers, and how long until
+/api/data answers with data instead of "still loading". Results are saved as
+JSON under bench/results/.
+
+    python bench/bench_startup.py --sizes 1M,10M,100M [--timeout 600]
+"""
+import argparse
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from common import APP_DIR, format_size, parse_size, save_results
+
+SCENARIOS = ("cold", "warm", "no_checkpoint")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def status(url):
+    """HTTP status of a GET, or None if nothing is listening yet."""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def time_startup(log_dir, timeout):
+    """Start the extension on log_dir; seconds until it listens and until it serves data."""
+    port = free_port()
+    env = dict(os.environ, PME_LOG_DIR=log_dir, PME_HTTP_PORT=str(port),
+               PME_SERVER="waitress", PME_LOG_LEVEL="WARNING")
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(APP_DIR, "main.py")], cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"listening_s": None, "data_s": None}
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"extension exited with status {process.returncode}")
+            if result["listening_s"] is None and status(base + "/api/sampling") == 200:
+                result["listening_s"] = time.perf_counter() - start
+            if result["listening_s"] is not None and status(base + "/api/data?max_points=500") == 200:
+                result["data_s"] = time.perf_counter() - start
+                break
+            time.sleep(0.02)
+    finally:
+        # SIGTERM exits normally, so the checkpoint is written as in the container
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def bench_size(size, interval, timeout, keep):
+    from make_logs import generate_log
+
+    log_dir = tempfile.mkdtemp(prefix=f"pme-startup-{format_size(size)}-")
+    try:
+        _, rows = generate_log(log_dir, size, interval)
+        result = {"rows": rows}
+        for scenario in SCENARIOS:
+            if scenario == "no_checkpoint":
+                for path in glob.glob(os.path.join(log_dir, "*.rollups.npz")):
+                    os.remove(path)
+            result[scenario] = time_startup(log_dir, timeout)
+        return result
+    finally:
+        if not keep:
+            shutil.rmtree(log_dir, ignore_errors=True)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="1M,10M,100M", help="comma-separated CSV log sizes (1M to 1G)")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between synthetic readings")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for each start")
+    parser.add_argument("--keep-logs", action="store_true", help="keep the generated log directories")
+    parser.add_argument("--output", help="result file (default: bench/results/startup-<time>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    for text in args.sizes.split(","):
+        size = parse_size(text)
+        result = bench_size(size, args.interval, args.timeout, args.keep_logs)
+        results[format_size(size)] = result
+        print(f"{format_size(size)}: {result['rows']} rows")
+        for scenario in SCENARIOS:
+            timing = result[scenario]
+            data = f"{timing['data_s']:.2f} s" if timing["data_s"] is not None else "timed out"
+            print(f"  {scenario:14s} listening {timing['listening_s'] or 0:6.2f} s  data {data}")
+    path = save_results("startup", vars(args), results, args.output)
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Shared helpers for the benchmark scripts: import path, result files, summaries."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a size like 1M, 250M or 1G into bytes."""
+    text = text.strip().upper().rstrip("B")
+    unit = text[-1] if text and text[-1] in _UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def format_size(size):
+    for unit in ("G", "M", "K"):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return f"{size // _UNITS[unit]}{unit}"
+    return str(size)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Nearest-rank percentiles of a list of numbers, plus min/max/mean."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {f"p{p}": ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] for p in points}
+    summary.update(min=ordered[0], max=ordered[-1], mean=sum(ordered) / len(ordered), n=len(ordered))
+    return summary
+
+
+def histogram_summary(histogram):
+    """Count, mean and bucket-bound percentiles of each child of a metrics.Histogram."""
+    summary = {}
+    bounds = list(histogram.buckets) + [float("inf")]
+    for values, child in list(histogram._children.items()):
+        counts, total = child.snapshot()
+        count = sum(counts)
+        entry = {"count": count, "mean": total / count if count else None}
+        for p in (50, 95, 99):
+            target = p / 100 * count
+            cumulative = 0
+            for bound, n in zip(bounds, counts):
+                cumulative += n
+                if count and cumulative >= target:
+                    entry[f"p{p}_le"] = bound
+                    break
+        summary[",".join(values) or "all"] = entry
+    return summary
+
+
+def environment():
+    """Where and on what a result was measured."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def save_results(name, params, results, output=None):
+    """Write results as JSON (default: bench/results/<name>-<UTC time>.json) and return the path."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        output = os.path.join(RESULTS_DIR, f"{name}-{stamp}.json")
+    document = {
+        "benchmark": name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    return output
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Generate a synthetic sensor log of a given size.
+
+Writes sensor_data.csv into a log directory (in the format the extension
+writes), with one reading every --interval seconds ending now, so the
+graph's relative time windows all have data. The extension builds its
+binary log from the CSV on first start, as it would for a real legacy log.
+
+    python bench/make_logs.py LOG_DIR --size 100M [--interval 1.0]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from common import parse_size  # also puts app/ on the import path
+from binlog import DTYPE, csv_chunks  # noqa: E402
+
+
+def synthetic_records(count, interval=1.0, end=None, seed=0, chunk_rows=65536):
+    """Yield record arrays of synthetic readings, oldest first."""
+    rng = np.random.default_rng(seed)
+    end = time.time() if end is None else end
+    start = end - (count - 1) * interval
+    for offset in range(0, count, chunk_rows):
+        n = min(chunk_rows, count - offset)
+        records = np.zeros(n, dtype=DTYPE)
+        index = np.arange(offset, offset + n)
+        records["time"] = start + index * interval
+        records["temperature"] = 20 + 2 * np.sin(index / 3600) + rng.normal(0, 0.05, n)
+        records["do"] = 8 + np.cos(index / 1800) + rng.normal(0, 0.05, n)
+        records["q"] = 0.95
+        records["vehicle_temperature"] = 15.23
+        records["latitude"] = 45.123456 + rng.normal(0, 1e-4, n)
+        records["longitude"] = -122.234567 + rng.normal(0, 1e-4, n)
+        records["gps_age"] = rng.uniform(0, 1, n)
+        records["vehicle_temperature_age"] = rng.uniform(0, 1, n)
+        yield records
+
+
+def generate_log(log_dir, size_bytes, interval=1.0, seed=0):
+    """Write LOG_DIR/sensor_data.csv of roughly size_bytes. Returns (path, rows)."""
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, "sensor_data.csv")
+    # Measure the CSV row size on a sample to pick the row count
+    sample = "".join(csv_chunks(synthetic_records(1000, interval, seed=seed)))
+    header_bytes = len(sample.split("\n", 1)[0]) + 1
+    row_bytes = (len(sample) - header_bytes) / 1000
+    count = max(1, int((size_bytes - header_bytes) / row_bytes))
+    with open(path, "w", newline="") as f:
+        for chunk in csv_chunks(synthetic_records(count, interval, seed=seed)):
+            f.write(chunk)
+    return path, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("log_dir")
+    parser.add_argument("--size", default="10M", help="approximate CSV size, e.g. 1M, 100M, 1G")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between readings")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path, rows = generate_log(args.log_dir, parse_size(args.size), args.interval, args.seed)
+    print(f"Wrote {path}: {rows} rows, {os.path.getsize(path)} bytes in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
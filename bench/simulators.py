@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Off-vehicle stand-ins for the microDOT sensor and BlueOS' Mavlink2Rest.
+
+MicroDotSimulator answers on a pseudo-terminal like the sensor does on its
+serial adapter: "MDOT" is echoed and answered with one reading after a
+configurable latency, and "STREAM"/"STOP" switch continuous output at a
+fixed rate. FakeMavlink2Rest is a local HTTP server answering the requests
+the extension makes (vehicle list, position, water temperature, and
+NAMED_VALUE_FLOAT posts).
+
+Run this module directly to keep both up for manual testing:
+
+    python bench/simulators.py [--latency 0.3] [--rate 10]
+"""
+import argparse
+import json
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MicroDotSimulator:
+    """microDOT on a pty; `port` is the path to open with pyserial."""
+
+    def __init__(self, latency=0.3, jitter=0.0, noise=0.5, stream_rate=10.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self.stream_rate = stream_rate
+        self.port = None
+        self.commands = 0
+        self.records_sent = 0
+        self._rng = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._streaming = False
+        self._stopping = threading.Event()
+        self._write_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        for target in (self._command_loop, self._stream_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(2.0)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def stats(self):
+        return {"port": self.port, "commands": self.commands, "records_sent": self.records_sent}
+
+    def _record(self):
+        temperature = 20.0 + self._rng.gauss(0.0, self.noise)
+        dissolved_oxygen = 8.0 + self._rng.gauss(0.0, self.noise)
+        return f"0,{int(time.time())},{temperature:.3f},{dissolved_oxygen:.3f},0.950\r\n".encode()
+
+    def _write(self, data):
+        with self._write_lock:
+            os.write(self._master, data)
+
+    def _command_loop(self):
+        buffer = b""
+        while not self._stopping.is_set():
+            ready, _, _ = select.select([self._master], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self._master, 256)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.strip()
+                self.commands += 1
+                if line == b"MDOT":
+                    time.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+                    self._write(b"MDOT\r\n" + self._record())
+                    self.records_sent += 1
+                elif line == b"STREAM":
+                    self._streaming = True
+                elif line == b"STOP":
+                    self._streaming = False
+
+    def _stream_loop(self):
+        period = 1.0 / self.stream_rate
+        next_time = time.monotonic()
+        while not self._stopping.is_set():
+            if self._streaming:
+                self._write(self._record())
+                self.records_sent += 1
+            next_time += period
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+
+class FakeMavlink2Rest:
+    """Local HTTP server imitating the Mavlink2Rest endpoints the extension uses."""
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.requests = 0
+        self.named_values = {}
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                fake.requests += 1
+                time.sleep(fake.latency)
+                if self.path == "/v1/mavlink/vehicles":
+                    self._reply([1])
+                elif self.path.endswith("/GLOBAL_POSITION_INT"):
+                    self._reply({"message": {"lat": 451234560, "lon": -1222345670}, "status": fake._status()})
+                elif self.path.endswith("/SCALED_PRESSURE2"):
+                    self._reply({"message": {"temperature": 1523}, "status": fake._status()})
+                else:
+                    self._reply({"error": "not found"}, 404)
+
+            def do_POST(self):
+                fake.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(fake.latency)
+                message = payload.get("message", {})
+                if message.get("type") == "NAMED_VALUE_FLOAT":
+                    name = "".join(message.get("name", [])).rstrip("\u0000")
+                    fake.named_values[name] = fake.named_values.get(name, 0) + 1
+                self._reply({"ok": True})
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{host}:{self._server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        return {"url": self.url, "requests": self.requests, "named_values": dict(self.named_values)}
+
+    def _status(self):
+        # As Mavlink2Rest reports it: the message was last received just now
+        now = datetime.now(timezone.utc).isoformat()
+        return {"time": {"first_update": now, "last_update": now, "counter": self.requests, "frequency": 1.0}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before answering MDOT")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds added to the latency")
+    parser.add_argument("--rate", type=float, default=10.0, help="readings per second when streaming")
+    parser.add_argument("--m2r-port", type=int, default=0, help="port for the fake Mavlink2Rest (0: any)")
+    args = parser.parse_args()
+
+    sensor = MicroDotSimulator(args.latency, args.jitter, stream_rate=args.rate).start()
+    mavlink = FakeMavlink2Rest(port=args.m2r_port).start()
+    print(f"microDOT simulator on {sensor.port}")
+    print(f"Fake Mavlink2Rest at {mavlink.url}")
+    print(f"Run the extension with PME_MAVLINK2REST_URL={mavlink.url} and select {sensor.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sensor.stop()
+        mavlink.stop()
+
+
+if __name__ == "__main__":
+    main()
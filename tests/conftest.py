@@ -0,0 +1,42 @@
+"""Shared fixtures: import path to the app modules, stores on temporary logs."""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from store import MeasurementStore  # noqa: E402
+
+# Start of the synthetic readings (2001-09-09), far from the test's wall
+# clock and on a bucket boundary of every rollup tier
+T0 = 600 * 1666667.0
+
+
+def measurement(t, sensor_id=0, do=5.0, temperature=10.0, latitude=None, longitude=None):
+    """A measurement dict as the sensor loop stores it, taken at epoch second t."""
+    return {
+        "timestamp": datetime.fromtimestamp(t).isoformat(),
+        "sensor_id": sensor_id,
+        "do": do,
+        "temperature": temperature,
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+
+
+def open_store(log_dir):
+    store = MeasurementStore(os.path.join(str(log_dir), "sensor_data.bin"))
+    store.load(os.path.join(str(log_dir), "sensor_data.csv"))
+    return store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = open_store(tmp_path)
+    yield store
+    store.close()
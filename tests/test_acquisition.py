@@ -0,0 +1,59 @@
+import os
+import time
+
+import pytest
+
+from acquisition import AcquisitionProcess, AcquisitionUnavailable, serve_control
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError("no sensor")
+
+
+def control_target(conn):
+    """Acquisition process stand-in answering a few control calls."""
+    serve_control(conn, {"add": add, "fail": fail, "exit": lambda: os._exit(3)})
+
+
+@pytest.fixture
+def acquisition():
+    process = AcquisitionProcess(control_target, call_timeout=10.0, restart_delay=0.1)
+    process.start()
+    yield process
+    process.stop()
+
+
+def test_call_runs_handler_in_child(acquisition):
+    assert acquisition.call("add", 2, 3) == 5
+    stats = acquisition.stats()
+    assert stats["running"] and stats["pid"] != os.getpid()
+    assert stats["calls"] == 1
+
+
+def test_handler_errors_are_raised(acquisition):
+    with pytest.raises(RuntimeError, match="ValueError: no sensor"):
+        acquisition.call("fail")
+    # The connection is still usable afterwards
+    assert acquisition.call("add", 1, 1) == 2
+
+
+def test_dead_process_is_restarted(acquisition):
+    with pytest.raises(AcquisitionUnavailable):
+        acquisition.call("exit", timeout=5.0)
+    deadline = time.monotonic() + 10.0
+    while acquisition.restarts == 0 or not acquisition.stats()["running"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert acquisition.call("add", 4, 5) == 9
+
+
+def test_calls_fail_after_stop():
+    process = AcquisitionProcess(control_target, restart_delay=0.1)
+    process.start()
+    process.stop()
+    with pytest.raises(AcquisitionUnavailable):
+        process.call("add", 1, 2)
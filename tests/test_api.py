@@ -0,0 +1,105 @@
+import gzip
+import importlib
+import os
+import time
+
+import pytest
+
+from conftest import measurement
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    """The web app on empty logs in a temporary directory (nothing started)."""
+    os.environ["PME_LOG_DIR"] = str(tmp_path_factory.mktemp("logs"))
+    main = importlib.import_module("main")
+    main.prepare_logs()
+    yield main
+    main.STORE.close()
+
+
+@pytest.fixture
+def client(main):
+    main.STORE.clear()
+    return main.app.test_client()
+
+
+def store_readings(main, count):
+    now = time.time()
+    main.STORE.append_many([measurement(now - count + i, sensor_id=i % 2, do=float(i)) for i in range(count)])
+
+
+@pytest.mark.parametrize("zoom", ["abc", "1.5"])
+def test_grid_rejects_invalid_zoom(client, zoom):
+    response = client.get(f"/api/grid?zoom={zoom}")
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+def test_grid_without_zoom_uses_finest_level(client):
+    response = client.get("/api/grid?zoom=")
+    assert response.status_code == 200
+
+
+def test_data_rows_and_columns(main, client):
+    store_readings(main, 20)
+    rows = client.get("/api/data?duration=0").get_json()
+    assert len(rows) == 20
+    assert [row["do"] for row in rows] == [float(i) for i in range(20)]
+    columns = client.get("/api/data?duration=0&format=columns").get_json()
+    assert len(columns["t"]) == len(columns["do"]) == 20
+    assert columns["do"] == [row["do"] for row in rows]
+    assert client.get("/api/data?duration=0&sensor=1&format=columns").get_json()["do"] == [float(i) for i in range(1, 20, 2)]
+
+
+def test_data_is_gzipped_when_accepted(main, client):
+    store_readings(main, 20)
+    plain = client.get("/api/data?duration=0")
+    for max_points in (1000, 0):
+        response = client.get(f"/api/data?duration=0&max_points={max_points}", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert gzip.decompress(response.get_data()) == plain.get_data()
+
+
+def test_unchanged_poll_is_cached_and_not_modified(main, client):
+    store_readings(main, 20)
+    first = client.get("/api/data?duration=0")
+    etag = first.headers["ETag"]
+    hits = main.DATA_CACHE.stats()["hits"]
+    assert client.get("/api/data?duration=0").get_data() == first.get_data()
+    assert main.DATA_CACHE.stats()["hits"] == hits + 1
+
+    response = client.get("/api/data?duration=0", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    # A new sample changes the answer
+    store_readings(main, 1)
+    response = client.get("/api/data?duration=0", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.get_json()) == 21
+
+
+def test_trailing_window_etag_moves_with_the_clock(main, client, monkeypatch):
+    store_readings(main, 20)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    # 10 minutes at 600 points: the window moves in one-second steps
+    url = "/api/data?duration=10&max_points=600"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    monkeypatch.setattr(time, "time", lambda: now + 1.0)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_data_waits_for_logs(main, client):
+    main.STORE.ready.clear()
+    try:
+        response = client.get("/api/data")
+    finally:
+        main.STORE.ready.set()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+
+from binlog import DTYPES, HEADER, MAGIC, BinaryLog, conform, encode, to_rows
+from conftest import T0, measurement, open_store
+
+
+def test_window_is_a_slice_of_the_log(tmp_path):
+    log = BinaryLog(str(tmp_path / "sensor_data.bin"))
+    log.create()
+    log.append_bytes(b"".join(encode(measurement(T0 + i, do=float(i))) for i in range(10)))
+    assert len(log) == 10
+    records = log.window(T0 + 4.5)
+    assert records["time"].tolist() == [T0 + i for i in range(5, 10)]
+    assert records["do"].tolist() == [5.0, 6.0, 7.0, 8.0, 9.0]
+    assert len(log.window(T0 + 2, T0 + 4)) == 2
+    assert len(log.window(T0 + 100)) == 0
+
+
+def test_records_are_remapped_as_the_log_grows(tmp_path):
+    log = BinaryLog(str(tmp_path / "sensor_data.bin"))
+    log.create()
+    assert len(log.records()) == 0
+    log.append_bytes(encode(measurement(T0)))
+    assert len(log.records()) == 1
+    log.append_bytes(encode(measurement(T0 + 1)))
+    assert log.records()["time"].tolist() == [T0, T0 + 1]
+
+
+def test_missing_values_round_trip_as_none(tmp_path):
+    log = BinaryLog(str(tmp_path / "sensor_data.bin"))
+    log.create()
+    log.append_bytes(encode(measurement(T0, do=None)))
+    row = to_rows(log.records())[0]
+    assert row["do"] is None
+    assert row["latitude"] is None
+    assert row["temperature"] == 10.0
+
+
+def test_partial_record_is_dropped(tmp_path):
+    log = BinaryLog(str(tmp_path / "sensor_data.bin"))
+    log.create()
+    log.append_bytes(encode(measurement(T0)))
+    size = os.path.getsize(log.path)
+    with open(log.path, "ab") as f:
+        f.write(b"\0" * 7)
+    assert log.validate()
+    assert os.path.getsize(log.path) == size
+    assert len(log.records()) == 1
+
+
+def test_other_files_are_not_logs(tmp_path):
+    path = tmp_path / "sensor_data.bin"
+    path.write_bytes(b"not a log" + b"\0" * HEADER.size)
+    assert not BinaryLog(str(path)).validate()
+
+
+def test_csv_import_sorts_rows(tmp_path):
+    csv_path = tmp_path / "sensor_data.csv"
+    lines = ["timestamp,temperature,do"]
+    for t in (2, 0, 1):
+        lines.append(f"{measurement(T0 + t)['timestamp']},10.0,{t}.5")
+    lines.append("not a time,1,2")
+    csv_path.write_text("\n".join(lines) + "\n")
+    log = BinaryLog(str(tmp_path / "sensor_data.bin"))
+    assert log.import_csv(str(csv_path)) == 3
+    records = log.records()
+    assert records["time"].tolist() == [T0, T0 + 1, T0 + 2]
+    assert records["do"].tolist() == [0.5, 1.5, 2.5]
+    assert np.isnan(records["q"]).all()
+
+
+def test_export_csv_round_trips(tmp_path, store):
+    for t in range(3):
+        store.append(measurement(T0 + t, do=float(t)))
+    text = "".join(store.export_csv())
+    csv_path = tmp_path / "exported.csv"
+    csv_path.write_text(text)
+    log = BinaryLog(str(tmp_path / "imported.bin"))
+    assert log.import_csv(str(csv_path)) == 3
+    assert to_rows(log.records()) == store.query()
+
+
+def test_v1_log_becomes_segment_when_writer_appends(tmp_path):
+    path = tmp_path / "sensor_data.bin"
+    v1 = np.zeros(2, dtype=DTYPES[1])
+    v1["time"] = [T0, T0 + 1]
+    v1["do"] = [7.5, 8.5]
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 1, DTYPES[1].itemsize))
+        f.write(v1.tobytes())
+
+    log = BinaryLog(path)
+    assert log.validate()
+    converted = conform(log.records())
+    assert np.isnan(converted["gps_age"]).all()
+    # Readings from before sensor_id was logged came from the only sensor
+    assert converted["sensor_id"].tolist() == [0.0, 0.0]
+
+    # Opening the logs leaves the old file as it is
+    store = open_store(tmp_path)
+    assert store.outdated()
+    assert store.window()["do"].tolist() == [7.5, 8.5]
+    store.rotate(str(tmp_path / "sensor_data_backup_1.bin"))
+    store.append_many([measurement(T0 + 100, sensor_id=2)])
+    assert not store.outdated()
+    assert store.window()["sensor_id"].tolist() == [0.0, 0.0, 2.0]
+    store.close()
+
+
+def test_same_size_replacement_is_remapped(tmp_path):
+    path = str(tmp_path / "sensor_data.bin")
+    log = BinaryLog(path)
+    log.create()
+    log.append_bytes(encode(measurement(T0, do=1.0)))
+    assert log.records()["do"].tolist() == [1.0]
+    log.close()
+
+    other = BinaryLog(path + ".new")
+    other.create()
+    other.append_bytes(encode(measurement(T0, do=2.0)))
+    other.close()
+    os.replace(other.path, path)
+    assert log.records()["do"].tolist() == [2.0]
@@ -0,0 +1,47 @@
+from cache import ResponseCache
+from conftest import T0, measurement
+
+
+def test_get_put_and_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    assert cache.get("a") is None
+    cache.put("a", {"identity": b"1"})
+    cache.put("b", {"identity": b"2"})
+    assert cache.get("a") == {"identity": b"1"}
+    cache.put("c", {"identity": b"3"})
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=5.0)
+    cache.put("a", {"identity": b"1"})
+    now[0] += 4.0
+    assert cache.get("a") is not None
+    now[0] += 2.0
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_oversized_bodies_are_not_cached():
+    cache = ResponseCache(max_body_bytes=10)
+    assert not cache.put("a", {"identity": b"x" * 11})
+    assert cache.get("a") is None
+
+
+def test_store_version_changes_with_data(store):
+    version = store.version
+    store.append_many([measurement(T0)])
+    assert store.version > version
+    version = store.version
+    store.query(None, 100)
+    assert store.version == version
+    store.clear()
+    assert store.version > version
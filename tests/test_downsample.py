@@ -0,0 +1,159 @@
+import numpy as np
+
+from binlog import DTYPE
+from conftest import T0, measurement
+from downsample import BUCKET_DTYPE, OVERSAMPLE, Rollups, RollupTier, aggregate, lttb_indices, rebucket
+
+
+def records_at(times):
+    records = np.zeros(len(times), dtype=DTYPE)
+    records["time"] = times
+    records["do"] = np.arange(len(times), dtype=np.float32)
+    records["temperature"] = 10.0
+    return records
+
+
+def test_lttb_keeps_ends_and_peaks():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[500] = 10.0
+    y[700] = -10.0
+    selected = lttb_indices(x, y, 50)
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert np.all(np.diff(selected) > 0)
+    assert 500 in selected and 700 in selected
+    assert lttb_indices(x[:10], y[:10], 50).tolist() == list(range(10))
+
+
+def test_aggregate_groups_by_resolution():
+    buckets = aggregate(records_at(T0 + np.array([0.0, 1.0, 59.0, 60.0])), 60)
+    assert buckets["start"].tolist() == [T0, T0 + 60]
+    assert buckets["n"].tolist() == [3, 1]
+    assert buckets["do_min"].tolist() == [0, 3]
+    assert buckets["do_max"].tolist() == [2, 3]
+
+
+def test_rebucket_keeps_totals():
+    buckets = aggregate(records_at(T0 + np.arange(0, 1000, 1.0)), 10)
+    merged = rebucket(buckets, 7)
+    assert len(merged) <= 7
+    assert merged["n"].sum() == 1000
+    assert merged["do_min"].min() == 0
+    assert merged["do_max"].max() == 999
+
+
+def test_tier_window_includes_bucket_holding_since():
+    tier = RollupTier(10)
+    tier.add(records_at(T0 + np.arange(0, 100, 1.0)))
+    assert len(tier) == 10
+    # since = T0 + 25 falls inside the bucket starting at T0 + 20
+    assert tier.window(T0 + 25)["start"][0] == T0 + 20
+    assert tier.count(T0 + 25) == 8
+    assert tier.count(T0 + 25, T0 + 45) == 3
+    assert len(tier.window(T0 + 1000)) == 1
+    assert tier.count(T0 - 1000, T0 - 500) == 0
+
+
+def test_tier_continues_last_bucket():
+    tier = RollupTier(10)
+    tier.add(records_at(T0 + np.array([0.0, 1.0])))
+    tier.add(records_at(T0 + np.array([2.0, 15.0])))
+    assert tier.window()["n"].tolist() == [3, 1]
+
+
+def test_tier_merges_late_buckets_in_order():
+    tier = RollupTier(10)
+    tier.add(records_at(T0 + np.array([0.0, 30.0, 50.0])))
+    # One bucket already held, one falling between held buckets
+    tier.add(records_at(T0 + np.array([5.0, 12.0])))
+    buckets = tier.window()
+    assert buckets["start"].tolist() == [T0, T0 + 10, T0 + 30, T0 + 50]
+    assert buckets["n"].tolist() == [2, 1, 1, 1]
+    assert tier.rows() == 5
+
+
+def test_late_buckets_match_building_in_order():
+    times = T0 + np.arange(0, 600, 1.0)
+    shuffled = np.concatenate([times[300:], times[:300]])
+    in_order, late = Rollups(), Rollups()
+    in_order.add(records_at(times))
+    late.add(records_at(shuffled[:300]))
+    late.add(records_at(shuffled[300:]))
+    for a, b in zip(in_order.tiers, late.tiers):
+        np.testing.assert_array_equal(a.window()["start"], b.window()["start"])
+        np.testing.assert_array_equal(a.window()["n"], b.window()["n"])
+
+def test_select_falls_back_to_finest_tier_when_nothing_fits():
+    rollups = Rollups()
+    rollups.add(records_at(T0 + np.arange(0, 600, 1.0)))
+    tier = rollups.select(None, None, 1000)
+    assert tier.resolution == 10
+    assert tier.count() < 1000
+
+def test_empty_tier():
+    tier = RollupTier(10)
+    tier.add(records_at([]))
+    assert len(tier) == 0
+    assert tier.count(T0) == 0
+    assert tier.window(T0).dtype == BUCKET_DTYPE
+
+
+def test_select_prefers_finest_tier_within_budget():
+    rollups = Rollups()
+    rollups.add(records_at(T0 + np.arange(0, 6000, 1.0)))
+    # 600 ten-second buckets fit 200 points * OVERSAMPLE
+    assert rollups.select(None, None, 200).resolution == 10
+    # 100 one-minute buckets: too few for 200 points, so not the 10-minute tier either
+    assert rollups.select(None, None, 30).resolution == 60
+    assert rollups.select(None, None, 2).resolution == 600
+
+
+def test_store_query_small_window_returned_whole(store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    assert len(store.query(T0 + 4.5, 100)) == 5
+
+
+def test_store_query_reduces_raw_rows_to_max_points(store):
+    store.append_many([measurement(T0 + i, do=float(i % 7)) for i in range(300)])
+    rows = store.query(None, 100)
+    assert len(rows) == 100
+    assert rows[0]["timestamp"] == measurement(T0)["timestamp"]
+    buckets = store.query(None, 100, mode="minmax")
+    assert len(buckets) <= 100
+    assert buckets[0]["do_min"] == 0.0
+
+
+def test_store_query_uses_rollups_for_long_windows(store):
+    count = 100 * OVERSAMPLE + 100
+    store.append_many([measurement(T0 + i) for i in range(count)])
+    rows = store.query(None, 10)
+    assert len(rows) == 10
+    # Rollup rows carry the number of raw rows in the bucket
+    assert all(row["count"] == 10 for row in rows[1:-1])
+
+
+def test_store_select_short_window_reduces_raw_rows(store):
+    # 2 readings a second for 1000 s: 100 ten-second buckets would be far
+    # fewer points than asked for, so the raw rows are reduced instead
+    store.append_many([measurement(T0 + i / 2) for i in range(2000)])
+    kind, parts, scanned = store.select(None, 400)
+    assert kind == "records"
+    assert scanned == 2000
+    assert sum(len(part) for part in parts()) == 400
+
+
+def test_store_select_unreduced_window_is_pinned(store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    kind, parts, scanned = store.select(None, 0)
+    store.append_many([measurement(T0 + 10 + i) for i in range(5)])
+    assert scanned == 10
+    # Every pass over the parts (one per JSON column) reads the same rows
+    assert sum(len(part) for part in parts()) == 10
+    assert sum(len(part) for part in parts()) == 10
+
+
+def test_store_select_unreduced_empty_window(store):
+    kind, parts, scanned = store.select(None, 0)
+    assert (kind, scanned) == ("records", 0)
+    assert list(parts()) == []
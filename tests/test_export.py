@@ -0,0 +1,107 @@
+import gzip
+import json
+import os
+import threading
+
+from binlog import DTYPE
+from conftest import T0, measurement
+from downsample import BUCKET_COLUMNS
+from export import gzip_stream, json_columns, json_rows, parse_time
+from logwriter import BackupCompressor
+from segments import SegmentCatalog
+
+
+def test_gzip_stream_round_trip():
+    chunks = ["timestamp,do\n", b"1,2\n" * 1000, ""]
+    assert gzip.decompress(b"".join(gzip_stream(chunks))) == b"timestamp,do\n" + b"1,2\n" * 1000
+
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time("") is None
+    assert parse_time("1000000200.5") == 1000000200.5
+    assert parse_time(measurement(T0)["timestamp"]) == T0
+
+
+def test_compressor_replaces_backup_with_gzip(tmp_path):
+    path = tmp_path / "sensor_data_backup_20010101_000000.csv"
+    content = b"timestamp,do\n" + b"2001-09-09T01:50:00,5.0\n" * 500
+    path.write_bytes(content)
+    compressor = BackupCompressor(str(tmp_path), threading.Lock())
+    compressor._compress(str(path))
+    assert not path.exists()
+    assert gzip.decompress((tmp_path / (path.name + ".gz")).read_bytes()) == content
+    stats = compressor.stats()
+    assert stats["files_compressed"] == 1
+    assert stats["bytes_out"] < stats["bytes_in"] == len(content)
+
+
+def test_compressor_skips_deleted_backup(tmp_path):
+    compressor = BackupCompressor(str(tmp_path), threading.Lock())
+    compressor._compress(str(tmp_path / "sensor_data_backup_gone.csv"))
+    assert os.listdir(tmp_path) == []
+    assert compressor.stats()["files_compressed"] == 0
+
+
+def test_gzipped_backup_is_cataloged(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(20)])
+    csv_text = "".join(store.export_csv())
+    with gzip.open(tmp_path / "sensor_data_backup_20010101_000000.csv.gz", "wt") as f:
+        f.write(csv_text)
+    catalog = SegmentCatalog(tmp_path)
+    assert catalog.scan() == 1
+    assert catalog.rows == 20
+
+
+def test_export_spans_segments_and_window(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    store.rotate(tmp_path / "sensor_data_backup_20010101_000000.bin")
+    store.append_many([measurement(T0 + i) for i in range(10, 20)])
+    lines = "".join(store.export_csv()).splitlines()
+    assert len(lines) == 21
+    lines = gzip.decompress(b"".join(gzip_stream(store.export_csv(T0 + 4.5, T0 + 14)))).decode().splitlines()
+    assert lines[1].startswith(measurement(T0 + 5)["timestamp"])
+    assert len(lines) == 11
+
+
+def test_json_rows_match_query(tmp_path, store):
+    store.append_many([measurement(T0 + i, do=float(i)) for i in range(10)])
+    store.rotate(tmp_path / "sensor_data_backup_20010101_000000.bin")
+    store.append_many([measurement(T0 + i, do=float(i)) for i in range(10, 15)])
+    kind, parts, scanned = store.select(None, 0)
+    assert kind == "records"
+    assert scanned == 15
+    body = "".join(json_rows(kind, parts, chunk_rows=4))
+    assert json.loads(body) == store.query(None, 0)
+    kind, parts, _ = store.select(T0 + 100, 0)
+    assert json.loads("".join(json_rows(kind, parts))) == []
+
+
+def test_json_columns_records(store):
+    store.append_many([measurement(T0 + i, do=float(i)) for i in range(5)])
+    kind, parts, _ = store.select(T0 + 1.5, 100)
+    columns = json.loads("".join(json_columns(kind, parts)))
+    assert list(columns) == ["t"] + list(DTYPE.names[1:])
+    assert columns["t"] == [T0 + 2, T0 + 3, T0 + 4]
+    assert columns["do"] == [2.0, 3.0, 4.0]
+    assert columns["latitude"] == [None, None, None]
+
+
+def test_json_columns_buckets(store):
+    store.append_many([measurement(T0 + i, do=float(i)) for i in range(100)])
+    kind, parts, scanned = store.select(None, 10, "minmax")
+    assert kind == "buckets"
+    # Answered from the ten 10-second rollup buckets
+    assert scanned == 10
+    columns = json.loads("".join(json_columns(kind, parts)))
+    assert list(columns) == BUCKET_COLUMNS
+    assert sum(columns["count"]) == 100
+    assert columns["do_min"][0] == 0.0
+    assert columns["do_max"][-1] == 99.0
+
+
+def test_gzipped_json_body(store):
+    store.append_many([measurement(T0 + i) for i in range(50)])
+    kind, parts, _ = store.select(None, 0)
+    body = gzip.decompress(b"".join(gzip_stream(json_rows(kind, parts))))
+    assert len(json.loads(body)) == 50
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from binlog import DTYPE
+from conftest import T0, measurement, open_store
+from grid import SpatialGrid, aggregate_cells, cell_rows, parse_bbox, select_cells, tile_bounds, tile_xy
+from retention import RetentionManager
+
+
+def records_at(positions, sensor_id=0):
+    records = np.zeros(len(positions), dtype=DTYPE)
+    records["time"] = T0 + np.arange(len(positions))
+    records["latitude"] = [lat for lat, _ in positions]
+    records["longitude"] = [lon for _, lon in positions]
+    records["do"] = 5.0
+    records["temperature"] = np.nan
+    records["sensor_id"] = sensor_id
+    return records
+
+
+@pytest.mark.parametrize("text", ["1,2,3", "a,b,c,d", "0,10,5,5", "-190,0,10,10", "0,-91,10,10"])
+def test_parse_bbox_rejects(text):
+    with pytest.raises(ValueError):
+        parse_bbox(text)
+
+
+def test_parse_bbox():
+    assert parse_bbox("") is None
+    assert parse_bbox(None) is None
+    assert parse_bbox("170,-10,-170,10") == (170.0, -10.0, -170.0, 10.0)
+
+
+def test_tiles_are_clipped_at_the_edges():
+    x, y = tile_xy([90.0, -90.0, 0.0], [-180.0, 180.0, 0.0], 2)
+    assert x.tolist() == [0, 3, 2]
+    assert y.tolist() == [0, 3, 2]
+    south, west, north, east = tile_bounds(np.array([2]), np.array([2]), 2)
+    assert (west[0], east[0]) == (0.0, 90.0)
+    assert north[0] == pytest.approx(0.0)
+    assert south[0] == pytest.approx(-66.51326, abs=1e-4)
+
+
+def test_readings_without_fix_are_left_out():
+    cells = aggregate_cells(records_at([(0.0, 0.0), (np.nan, 10.0), (45.0, 10.0)]), 10)
+    assert len(cells) == 1
+    assert cells["n"].tolist() == [1]
+    assert cells["temperature_n"].tolist() == [0]
+
+
+def test_select_inside_bbox():
+    cells = aggregate_cells(records_at([(45.0, 10.0), (45.0, 10.0), (-45.0, 10.0), (45.0, 100.0)]), 10)
+    selected = select_cells(cells, 10, parse_bbox("5,40,15,50"))
+    assert selected["n"].tolist() == [2]
+    rows = cell_rows(selected, 10)
+    assert rows[0]["count"] == 2
+    assert rows[0]["south"] <= 45.0 <= rows[0]["north"]
+    assert rows[0]["west"] <= 10.0 <= rows[0]["east"]
+    assert rows[0]["do"] == 5.0
+    assert rows[0]["temperature"] is None
+
+
+def test_bbox_edges_are_inclusive():
+    cells = aggregate_cells(records_at([(10.0, 20.0)]), 12)
+    assert len(select_cells(cells, 12, (20.0, 10.0, 20.0, 10.0))) == 1
+
+
+def test_select_across_antimeridian():
+    cells = aggregate_cells(records_at([(0.0, 179.5), (0.0, -179.5), (0.0, 0.0001), (0.0, 90.0)]), 10)
+    selected = select_cells(cells, 10, parse_bbox("170,-10,-170,10"))
+    assert len(selected) == 2
+    rows = cell_rows(selected, 10)
+    assert sorted(round(row["lon"]) for row in rows) == [-179, 179]
+
+
+def test_select_merges_sensors_unless_one_is_asked_for():
+    cells = np.concatenate([
+        aggregate_cells(records_at([(45.0, 10.0)] * 2, sensor_id=0), 14),
+        aggregate_cells(records_at([(45.0, 10.0)] * 3, sensor_id=1), 14),
+    ])
+    assert select_cells(cells, 14)["n"].tolist() == [5]
+    assert select_cells(cells, 14, sensor=1)["n"].tolist() == [3]
+    assert len(select_cells(cells, 14, sensor=2)) == 0
+
+
+def test_grid_follows_store(tmp_path, store):
+    grid = SpatialGrid(store, zoom_levels=(10, 20))
+    store.listeners.append(grid.add)
+    store.append_many([measurement(T0 + i, latitude=45.0, longitude=10.0) for i in range(100)])
+    store.rotate(str(tmp_path / "sensor_data_backup_1.bin"))
+    store.append_many([measurement(T0 + 200 + i, latitude=46.0, longitude=10.0) for i in range(50)])
+    assert grid.select(20)["n"].sum() == 150
+    assert grid.select(10, bbox=(9.0, 45.5, 11.0, 46.5))["n"].sum() == 50
+    # A grid built later reads the logs on disk
+    reopened = open_store(tmp_path)
+    assert SpatialGrid(reopened, zoom_levels=(10, 20)).select(10)["n"].sum() == 150
+    reopened.close()
+
+
+def test_grid_keeps_compacted_data(tmp_path, store):
+    grid = SpatialGrid(store, zoom_levels=(10, 20))
+    store.listeners.append(grid.add)
+    store.append_many([measurement(T0 + i, latitude=45.0, longitude=10.0) for i in range(100)])
+    store.rotate(str(tmp_path / "sensor_data_backup_1.bin"))
+    store.append_many([measurement(T0 + 200 + i, latitude=46.0, longitude=10.0) for i in range(50)])
+    removals = store.removals
+    assert grid.select(20)["n"].sum() == 150
+
+    RetentionManager(store, {"raw_days": 1, "compact_resolution": 600, "max_total_mb": 0}).apply()
+    assert len(store.segments.archives) == 1
+    assert store.removals == removals
+    assert grid.select(20)["n"].sum() == 150
+    # A grid built after the compaction reads the archived cells
+    reopened = open_store(tmp_path)
+    assert SpatialGrid(reopened, zoom_levels=(10, 20)).select(10)["n"].sum() == 150
+    reopened.close()
+
+    store.drop_archive(store.segments.archives[0])
+    assert grid.select(20)["n"].sum() == 50
+
+
+def test_grid_is_rebuilt_when_logs_are_cleared(store):
+    grid = SpatialGrid(store, zoom_levels=(10,))
+    store.listeners.append(grid.add)
+    store.append_many([measurement(T0 + i, latitude=45.0, longitude=10.0) for i in range(10)])
+    assert grid.select(10)["n"].sum() == 10
+    store.clear()
+    assert len(grid.select(10)) == 0
@@ -0,0 +1,125 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from binlog import CSV_FIELDS
+from conftest import T0, measurement
+from logwriter import REORDER_SECONDS, LogWriter
+
+HEADERS = [column for column, _ in CSV_FIELDS]
+
+
+@pytest.fixture
+def writer(tmp_path, store):
+    writer = LogWriter(str(tmp_path / "sensor_data.csv"), HEADERS, store, max_size_mb=10)
+    yield writer
+    writer.stop()
+    writer._close()
+
+
+def read_csv(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def test_stop_writes_everything_queued(writer, store, tmp_path):
+    writer.start()
+    for t in range(250):
+        assert writer.submit(measurement(T0 + t))
+    writer.stop()
+    assert len(store.window()) == 250
+    lines = read_csv(tmp_path / "sensor_data.csv")
+    assert lines[0].split(",") == HEADERS
+    assert len(lines) == 251
+    stats = writer.stats()
+    assert stats["rows_written"] == 250
+    assert stats["unsynced_rows"] == 0
+    assert stats["batches_written"] >= 3
+
+
+def test_full_queue_drops_rows(tmp_path, store):
+    writer = LogWriter(str(tmp_path / "sensor_data.csv"), HEADERS, store, max_size_mb=10, queue_size=2)
+    assert writer.submit(measurement(T0))
+    assert writer.submit(measurement(T0 + 1))
+    assert not writer.submit(measurement(T0 + 2))
+    assert writer.stats()["rows_dropped"] == 1
+
+
+def test_rotates_when_csv_is_full(tmp_path, store):
+    writer = LogWriter(str(tmp_path / "sensor_data.csv"), HEADERS, store, max_size_mb=0)
+    writer._write_batch([measurement(T0)])
+    writer._write_batch([measurement(T0 + 1)])
+    writer._close()
+    assert writer.rotations == 1
+    assert len(glob.glob(str(tmp_path / "sensor_data_backup_*.csv"))) == 1
+    assert len(glob.glob(str(tmp_path / "sensor_data_backup_*.bin"))) == 1
+    assert store.log.window()["time"].tolist() == [T0 + 1]
+    # The rotated log stays queryable as a segment
+    assert store.window()["time"].tolist() == [T0, T0 + 1]
+    assert len(read_csv(tmp_path / "sensor_data.csv")) == 2
+
+
+def test_files_reopen_after_being_removed(writer, store, tmp_path):
+    writer._write_batch([measurement(T0)])
+
+    def remove():
+        os.remove(writer.csv_path)
+        store.clear()
+
+    writer.run_with_files_closed(remove)
+    writer._write_batch([measurement(T0 + 1)])
+    writer._sync()
+    assert read_csv(tmp_path / "sensor_data.csv")[0].split(",") == HEADERS
+    assert store.window()["time"].tolist() == [T0 + 1]
+
+
+def test_batch_is_written_in_time_order(writer, store, tmp_path):
+    writer._write_batch([measurement(T0 + t) for t in (2, 0, 3, 1)])
+    assert store.window()["time"].tolist() == [T0, T0 + 1, T0 + 2, T0 + 3]
+    assert writer.rows_late == 0
+    writer._close()
+    lines = read_csv(tmp_path / "sensor_data.csv")[1:]
+    assert lines == sorted(lines)
+
+
+def test_reorder_buffer_sorts_readings_across_batches(writer, store, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("logwriter.time.monotonic", lambda: now[0])
+    writer._hold([measurement(T0 + t) for t in (0, 2)])
+    assert writer._release() == []
+    now[0] = REORDER_SECONDS / 2
+    writer._hold([measurement(T0 + 1), measurement(T0 + 5)])
+    now[0] = REORDER_SECONDS
+    # The first batch is due; the reading sampled between them comes with it
+    writer._write_batch(writer._release())
+    assert store.window()["time"].tolist() == [T0, T0 + 1, T0 + 2]
+    assert writer.stats()["rows_pending"] == 1
+    writer._write_batch(writer._release(everything=True))
+    assert store.window()["time"].tolist() == [T0, T0 + 1, T0 + 2, T0 + 5]
+    assert writer.rows_late == 0
+
+
+def test_late_reading_is_not_logged(writer, store):
+    writer._write_batch([measurement(T0 + t) for t in range(5)])
+    writer._write_batch([measurement(T0 + 2.5, do=7.0), measurement(T0 + 6)])
+    records = store.window()
+    assert records["time"].tolist() == [T0 + t for t in (0, 1, 2, 3, 4, 6)]
+    assert 7.0 not in records["do"]
+    assert writer.rows_late == 1
+    assert store.rollups.tiers[0].rows() == 6
+
+
+def test_clock_set_back_does_not_rotate_logs(writer, store, tmp_path):
+    writer._write_batch([measurement(T0 + t) for t in range(5)])
+    writer._write_batch([measurement(T0 - 60 + t) for t in range(3)])
+    assert writer.rows_late == 3
+    assert writer.rotations == 0
+    assert len(store.segments) == 0
+    assert len(store.log) == 5
+    # Logging resumes once the clock has caught up again
+    writer._write_batch([measurement(T0 + 10)])
+    assert len(store.log) == 6
+    writer._close()
+    assert len(read_csv(tmp_path / "sensor_data.csv")) == 7
@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from mavlink import Mavlink2RestClient
+
+
+class FakeMavlink2Rest(ThreadingHTTPServer):
+    """Minimal Mavlink2Rest stand-in: serves canned GET replies and records POSTs."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.replies = {"/v1/mavlink/vehicles": (200, [1])}
+        self.posted = []
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._reply(*self.server.replies.get(self.path, (404, {"error": "not found"})))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.posted.append(json.loads(self.rfile.read(length)))
+        self._reply(200, "Ok")
+
+
+@pytest.fixture
+def server():
+    server = FakeMavlink2Rest()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+def test_probe_finds_the_working_endpoint(server):
+    client = Mavlink2RestClient(base_urls=["http://127.0.0.1:1", server.url], probe_timeout=0.5, min_backoff=0.05)
+    assert client.get_json("/v1/mavlink/vehicles") is None
+    client.start()
+    wait_for(lambda: client.active_url == server.url)
+    assert client.get_json("/v1/mavlink/vehicles") == [1]
+    assert client.stats()["endpoint_switches"] == 1
+
+
+def test_send_async_posts_named_value_floats_in_order(server):
+    client = Mavlink2RestClient(base_urls=[server.url], min_backoff=0.05)
+    client.start()
+    wait_for(lambda: client.active_url is not None)
+    assert client.send_async([("DO_T", 12.5), ("DO_O", 8.25)])
+    wait_for(lambda: len(server.posted) == 2)
+    names = ["".join(p["message"]["name"]).rstrip("\u0000") for p in server.posted]
+    assert names == ["DO_T", "DO_O"]
+    assert server.posted[1]["message"]["value"] == 8.25
+
+
+def test_unreachable_endpoint_is_dropped():
+    client = Mavlink2RestClient(base_urls=["http://127.0.0.1:1"], timeout=0.5)
+    client._active = "http://127.0.0.1:1"
+    assert client.get_json("/v1/mavlink/vehicles") is None
+    assert client.active_url is None
+    assert client.stats()["requests_failed"] == 1
+
+
+def test_missing_message_keeps_the_endpoint(server):
+    client = Mavlink2RestClient(base_urls=[server.url])
+    client._active = server.url
+    assert client.get_json("/v1/mavlink/vehicles/1/components/1/messages/GLOBAL_POSITION_INT") is None
+    assert client.active_url == server.url
+    stats = client.stats()
+    assert stats["requests_rejected"] == 1
+    assert stats["requests_failed"] == 0
+    assert client.get_json("/v1/mavlink/vehicles") == [1]
+
+
+def test_server_error_drops_the_endpoint(server):
+    server.replies["/v1/mavlink/vehicles"] = (503, {"error": "unavailable"})
+    client = Mavlink2RestClient(base_urls=[server.url])
+    client._active = server.url
+    assert client.get_json("/v1/mavlink/vehicles") is None
+    assert client.active_url is None
+    assert client.stats()["requests_failed"] == 1
@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import T0, measurement, open_store
+from retention import RetentionManager
+from test_store import follower, rollup_snapshot
+
+COMPACT = {"raw_days": 1, "compact_resolution": 600, "max_total_mb": 0}
+
+
+def rotated_store(store, tmp_path):
+    """Two rotated segments of sensor 0 and 1 readings, and a short live log."""
+    for i, start in enumerate((T0, T0 + 3600)):
+        store.append_many([measurement(start + j, sensor_id=j % 2, do=float(j % 9)) for j in range(600)])
+        store.rotate(str(tmp_path / f"sensor_data_backup_{i}.bin"))
+    store.append_many([measurement(T0 + 7200 + j) for j in range(10)])
+    return store
+
+
+def test_old_segments_are_compacted(tmp_path, store):
+    rotated_store(store, tmp_path)
+    expected = rollup_snapshot(store)
+    manager = RetentionManager(store, COMPACT)
+    assert manager.apply() > 0
+    assert manager.segments_compacted == 2
+    assert len(store.segments) == 0
+    assert [archive.rows for archive in store.segments.archives] == [600, 600]
+    assert not os.path.exists(tmp_path / "sensor_data_backup_0.bin")
+    # The rollups are untouched; rebuilt from the archives, the tiers down
+    # to the archive resolution come out alike
+    assert rollup_snapshot(store) == expected
+    os.remove(store.checkpoint_path)
+    reopened = open_store(tmp_path)
+    assert rollup_snapshot(reopened)[600.0] == expected[600.0]
+    assert reopened.sensor_rollups.keys() == {0, 1}
+    reopened.close()
+
+
+def test_recent_segments_are_kept(tmp_path, store):
+    rotated_store(store, tmp_path)
+    manager = RetentionManager(store, COMPACT, clock=lambda: T0 + 7200)
+    assert manager.apply() == 0
+    assert len(store.segments) == 2
+    assert store.segments.archives == []
+
+
+def test_segment_with_uncompressed_csv_is_left(tmp_path, store):
+    rotated_store(store, tmp_path)
+    (tmp_path / "sensor_data_backup_0.csv").write_text("")
+    RetentionManager(store, COMPACT).apply()
+    assert [segment.name for segment in store.segments.segments] == ["sensor_data_backup_0.bin"]
+    assert len(store.segments.archives) == 1
+
+
+def test_size_cap_drops_oldest_archives(tmp_path, store):
+    rotated_store(store, tmp_path)
+    manager = RetentionManager(store, {"raw_days": 0, "compact_resolution": 600, "max_total_mb": 1e-6})
+    manager.apply()
+    assert manager.segments_compacted == 2
+    assert manager.archives_deleted == 2
+    assert store.segments.archives == []
+    # Only the live log's readings are left in the rollups
+    assert store.rollups.select(None, None, 1000).window()["n"].sum() == 10
+
+
+def test_follower_sees_compaction(tmp_path, store):
+    rotated_store(store, tmp_path)
+    reader = follower(tmp_path)
+    expected = rollup_snapshot(reader)
+    RetentionManager(store, COMPACT).apply()
+    reader.refresh()
+    assert len(reader.segments) == 0
+    assert len(reader.segments.archives) == 2
+    assert rollup_snapshot(reader) == expected
+    reader.close()
+
+
+@pytest.mark.parametrize("resolution", [60, 600])
+def test_archive_resolution(tmp_path, store, resolution):
+    rotated_store(store, tmp_path)
+    RetentionManager(store, dict(COMPACT, compact_resolution=resolution)).apply()
+    archive = store.segments.archives[0]
+    assert archive.resolution == resolution
+    buckets = archive.buckets()
+    assert buckets.keys() == {"all", 0, 1}
+    assert len(buckets["all"]) == 600 // resolution
+    assert buckets["all"]["n"].sum() == 600
+    assert buckets[1]["n"].sum() == 300
+
+
+def test_count_includes_compacted_rows(tmp_path, store):
+    rotated_store(store, tmp_path)
+    RetentionManager(store, COMPACT).apply()
+    assert store.count() == 1210
+    assert store.count(T0 + 3000) == 610
+    # A window edge inside an archive counts its 600-second buckets whole
+    assert store.count(T0 + 3900) == 610
+    assert store.count(T0 + 4200) == 10
+    assert store.count(sensor=1) == 600
+
+
+def test_data_over_compacted_range_uses_rollups(tmp_path, store):
+    rotated_store(store, tmp_path)
+    RetentionManager(store, COMPACT).apply()
+    for max_points in (100, 5000):
+        assert store.select(None, max_points)[0] == "buckets"
+        # Min/max buckets keep the row counts of the buckets they merge
+        kind, parts, scanned = store.select(None, max_points, mode="minmax")
+        assert kind == "buckets"
+        assert np.concatenate(list(parts()))["n"].sum() == 1210
+    kind, parts, scanned = store.select(None, 100, mode="minmax", sensor=0)
+    assert kind == "buckets"
+    assert sum(part["n"].sum() for part in parts()) == 610
+    # A window of live readings only is still read raw
+    assert store.select(T0 + 7000, 100)[0] == "records"
+
+
+def test_stats_over_compacted_range_use_rollups(tmp_path, store):
+    rotated_store(store, tmp_path)
+    RetentionManager(store, COMPACT).apply()
+    buckets, scanned = store.stats_buckets(T0 - 1, T0 + 599)
+    assert buckets["n"].sum() == 600
+    assert buckets["do_min"].min() == 0.0
+    assert buckets["do_max"].max() == 8.0
+    buckets, scanned = store.stats_buckets(T0 - 1, None, sensor=1)
+    assert buckets["n"].sum() == 600
+    buckets, scanned = store.stats_buckets(T0 + 7000, None)
+    assert buckets["n"].sum() == 10
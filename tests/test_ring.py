@@ -0,0 +1,65 @@
+import numpy as np
+
+from binlog import DTYPE
+from conftest import T0, measurement
+from ring import RecordRing
+from store import MeasurementStore
+
+
+def records_at(times):
+    records = np.zeros(len(times), dtype=DTYPE)
+    records["time"] = times
+    records["do"] = np.arange(len(times), dtype=np.float32)
+    return records
+
+
+def test_append_wraps_and_evicts_oldest():
+    ring = RecordRing(5)
+    ring.append(records_at(T0 + np.arange(3.0)))
+    assert ring.complete
+    ring.append(records_at(T0 + np.arange(3.0, 7.0)))
+    assert len(ring) == 5
+    assert not ring.complete
+    assert ring.oldest() == T0 + 2
+    assert ring.since()["time"].tolist() == [T0 + i for i in range(2, 7)]
+    assert ring.latest(2)["time"].tolist() == [T0 + 5, T0 + 6]
+
+
+def test_since_searches_across_the_wrap():
+    ring = RecordRing(5)
+    for i in range(8):
+        ring.append(records_at([T0 + i]))
+    # Held: 3..7, stored as [5, 6, 7, 3, 4]
+    assert ring.since(T0 + 3.5)["time"].tolist() == [T0 + 4, T0 + 5, T0 + 6, T0 + 7]
+    assert ring.since(T0 + 5)["time"].tolist() == [T0 + 6, T0 + 7]
+    assert len(ring.since(T0 + 7)) == 0
+
+
+def test_batch_larger_than_capacity_keeps_tail():
+    ring = RecordRing(4)
+    ring.append(records_at(T0 + np.arange(10.0)))
+    assert ring.since()["time"].tolist() == [T0 + i for i in range(6, 10)]
+    assert not ring.complete
+
+
+def test_covers():
+    ring = RecordRing(3)
+    ring.load(records_at(T0 + np.arange(10.0)))
+    assert not ring.complete
+    assert ring.covers(T0 + 7)
+    assert not ring.covers(T0 + 6.5)
+    assert not ring.covers(None)
+    ring.clear()
+    assert ring.covers(None)
+
+
+def test_store_window_from_ring_matches_log(tmp_path):
+    store = MeasurementStore(tmp_path / "sensor_data.bin", recent_capacity=50)
+    store.load(str(tmp_path / "sensor_data.csv"))
+    for i in range(0, 120, 10):
+        store.append_many([measurement(T0 + j, do=float(j)) for j in range(i, i + 10)])
+    recent = store.window(T0 + 100)
+    assert recent.tobytes() == store.log.window(T0 + 100).tobytes()
+    # Older than the ring holds: falls back to the log
+    assert len(store.window(T0 + 10)) == 109
+    store.close()
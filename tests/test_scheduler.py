@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from scheduler import IntervalScheduler
+
+
+class FakeClock:
+    """Monotonic clock moved by the test and by the patched time.sleep()."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("scheduler.time.sleep", lambda seconds: setattr(clock, "now", clock.now + seconds))
+    return clock
+
+
+def run(schedule, clock, until):
+    """Deadlines of the ticks run until the clock reaches `until`."""
+    deadlines = []
+    while clock.now < until:
+        schedule.wait()
+        deadlines.append(schedule.deadline)
+    return deadlines
+
+
+def test_ticks_stay_on_grid(clock):
+    schedule = IntervalScheduler(1.0, clock=clock)
+    schedule.wait()
+    clock.now += 0.3  # the poll itself
+    assert schedule.wait() == 0.0
+    assert schedule.deadline == 1.0
+    assert clock.now == 1.0
+    assert schedule.stats()["ticks"] == 2
+
+
+def test_skip_resumes_on_original_grid(clock):
+    schedule = IntervalScheduler(1.0, "skip", clock=clock)
+    schedule.wait()
+    clock.now = 10.5  # the first poll overran
+    assert schedule.wait() == 0.5
+    assert schedule.deadline == 10.0
+    stats = schedule.stats()
+    assert stats["skipped"] == 9
+    assert stats["caught_up"] == 0
+    assert stats["jitter_max_ms"] == 500.0
+
+
+def test_catch_up_runs_at_most_max_missed_ticks(clock):
+    schedule = IntervalScheduler(1.0, "catch_up", max_catch_up=3, clock=clock)
+    schedule.wait()
+    clock.now = 10.5
+    # Ticks 2 to 10 were missed: 7, 8 and 9 run late, 10 is the one due
+    assert run(schedule, clock, 11.0) == [7.0, 8.0, 9.0, 10.0, 11.0]
+    stats = schedule.stats()
+    assert stats["skipped"] == 6
+    assert stats["caught_up"] == 3
+
+
+def test_catch_up_within_limit_skips_nothing(clock):
+    schedule = IntervalScheduler(1.0, "catch_up", max_catch_up=3, clock=clock)
+    schedule.wait()
+    clock.now = 2.5
+    assert run(schedule, clock, 3.0) == [1.0, 2.0, 3.0]
+    stats = schedule.stats()
+    assert stats["skipped"] == 0
+    assert stats["caught_up"] == 1
+
+
+def test_late_tick_is_not_counted_as_caught_up(clock):
+    schedule = IntervalScheduler(1.0, "catch_up", clock=clock)
+    schedule.wait()
+    clock.now = 1.4
+    assert schedule.wait() == pytest.approx(0.4)
+    stats = schedule.stats()
+    assert stats["skipped"] == 0
+    assert stats["caught_up"] == 0
+
+
+def test_catch_up_limit_applies_to_each_overrun(clock):
+    schedule = IntervalScheduler(1.0, "catch_up", max_catch_up=2, clock=clock)
+    schedule.wait()
+    clock.now = 5.5
+    run(schedule, clock, 6.0)
+    clock.now = 12.5
+    run(schedule, clock, 13.0)
+    stats = schedule.stats()
+    assert stats["caught_up"] == 4
+    assert stats["skipped"] == 2 + 3
+
+
+def test_woken_wait_counts_nothing(clock):
+    schedule = IntervalScheduler(1.0, "skip", clock=clock)
+    schedule.wait()
+    clock.now = 0.2
+    wake = threading.Event()
+    wake.set()
+    assert schedule.wait(wake) is None
+    assert schedule.deadline == 0.0
+    clock.now = 5.5
+    wake.set()
+    # Behind schedule the tick is due, so waking cannot cut it short
+    assert schedule.wait(wake) == 0.5
+    assert schedule.stats()["skipped"] == 4
+    assert schedule.stats()["ticks"] == 2
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        IntervalScheduler(1.0, "burst")
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from binlog import DTYPE, BinaryLog
+from conftest import T0, measurement
+from segments import SegmentCatalog
+from store import MeasurementStore
+
+
+def write_csv_backups(log_dir, count, rows):
+    """Rotated CSV logs from before the binary log existed, oldest first."""
+    for i in range(count):
+        records = np.zeros(rows, dtype=DTYPE)
+        records["time"] = T0 + i * rows + np.arange(rows)
+        records["do"] = 5.0
+        with open(os.path.join(str(log_dir), f"sensor_data_backup_2001010{i}_000000.csv"), "w") as f:
+            f.write("".join(BinaryLog(os.devnull).export_csv(records)))
+
+
+def test_scan_imports_rotated_csvs(tmp_path):
+    write_csv_backups(tmp_path, 3, 100)
+    catalog = SegmentCatalog(tmp_path)
+    assert catalog.scan() == 3
+    assert catalog.rows == 300
+    assert [segment.start for segment in catalog.segments] == [T0, T0 + 100, T0 + 200]
+    assert os.path.exists(catalog.catalog_path)
+    # Entries whose file did not change are reused from segments.json
+    again = SegmentCatalog(tmp_path)
+    assert again.scan() == 3
+    assert [s.to_dict() for s in again.segments] == [s.to_dict() for s in catalog.segments]
+
+
+def test_overlapping_and_count(tmp_path):
+    write_csv_backups(tmp_path, 3, 100)
+    catalog = SegmentCatalog(tmp_path)
+    catalog.scan()
+    assert len(catalog.overlapping(T0 + 150)) == 2
+    assert len(catalog.overlapping(T0 + 150, T0 + 160)) == 1
+    assert catalog.count() == 300
+    assert catalog.count(T0 + 149.5) == 150
+    assert catalog.count(T0 + 49.5, T0 + 149.5) == 100
+    assert catalog.count(T0 + 1000) == 0
+
+
+def test_store_windows_span_rotated_segments(tmp_path):
+    store = MeasurementStore(tmp_path / "sensor_data.bin")
+    store.load(str(tmp_path / "sensor_data.csv"))
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    store.rotate(tmp_path / "sensor_data_backup_20010101_000000.bin")
+    store.append_many([measurement(T0 + i) for i in range(10, 15)])
+
+    assert len(store) == 15
+    assert len(store.segments) == 1
+    assert store.window(T0 + 7.5)["time"].tolist() == [T0 + i for i in range(8, 15)]
+    assert store.count(T0 + 7.5, T0 + 11) == 4
+    assert len(store.query(None, 100)) == 15
+    store.close()
@@ -0,0 +1,42 @@
+from sensor_parser import RecordParser
+
+
+def test_parses_complete_lines():
+    parser = RecordParser()
+    records = parser.feed(b"0,1,12.5,8.25,0.98\r\n0,2,12.6,8.3,0.97\r\n")
+    assert records == [(12.5, 8.25, 0.98), (12.6, 8.3, 0.97)]
+    assert parser.records == 2
+
+
+def test_line_split_across_reads_is_completed():
+    parser = RecordParser()
+    assert parser.feed(b"0,1,12.5,8.") == []
+    assert parser.feed(b"25,0.98\r") == []
+    assert parser.feed(b"\n0,2,1") == [(12.5, 8.25, 0.98)]
+    assert parser.feed(b"3,9,1\n") == [(13.0, 9.0, 1.0)]
+
+
+def test_extra_fields_are_ignored():
+    assert RecordParser().feed(b"0,1,12.5,8.25,0.98,42,x\n") == [(12.5, 8.25, 0.98)]
+
+
+def test_non_readings_are_counted_and_skipped():
+    parser = RecordParser()
+    records = parser.feed(b"OK\r\n\r\n\n0,1,abc,8.25,0.98\n0,1,12.5,8.25,0.98\n")
+    assert records == [(12.5, 8.25, 0.98)]
+    # "OK" and the unparsable reading; empty lines are not counted
+    assert parser.rejected == 2
+
+
+def test_unterminated_garbage_is_dropped():
+    parser = RecordParser(max_line_length=16)
+    assert parser.feed(b"x" * 20) == []
+    assert parser.overflows == 1
+    assert parser.feed(b"0,1,12.5,8.25,0.98\n") == [(12.5, 8.25, 0.98)]
+
+
+def test_reset_discards_partial_line():
+    parser = RecordParser()
+    parser.feed(b"0,1,12.5,8.")
+    parser.reset()
+    assert parser.feed(b"0,1,1,2,3\n") == [(1.0, 2.0, 3.0)]
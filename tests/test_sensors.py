@@ -0,0 +1,50 @@
+import pytest
+
+from sensors import SensorManager
+
+
+@pytest.fixture
+def manager():
+    ran = []
+
+    def loop(channel):
+        ran.append(channel.id)
+        channel.stopping.wait()
+
+    manager = SensorManager(9600, loop)
+    manager.ran = ran
+    yield manager
+    for channel in list(manager):
+        manager.stop(channel.id)
+
+
+def test_each_sensor_gets_its_own_loop(manager):
+    manager.start(1, "/dev/pme-test-missing-1")
+    manager.start(0, "/dev/pme-test-missing-0")
+    assert [channel.id for channel in manager] == [0, 1]
+    assert manager.ports() == {0: "/dev/pme-test-missing-0", 1: "/dev/pme-test-missing-1"}
+    assert manager.owner("/dev/pme-test-missing-1") == 1
+    assert manager.owner("/dev/ttyUSB9") is None
+    for channel in manager:
+        assert channel.thread.name == f"sensor-{channel.id}"
+        assert channel.thread.is_alive()
+
+
+def test_sensor_ids_are_unique(manager):
+    manager.start(0, "/dev/pme-test-missing-0")
+    with pytest.raises(ValueError):
+        manager.start(0, "/dev/pme-test-missing-1")
+
+
+def test_stop_ends_the_loop(manager):
+    channel = manager.start(0, "/dev/pme-test-missing-0")
+    assert manager.stop(0)
+    assert not channel.thread.is_alive()
+    assert manager.get(0) is None
+    assert not manager.stop(0)
+
+
+def test_notify_wakes_every_loop(manager):
+    channels = [manager.start(i, f"/dev/pme-test-missing-{i}") for i in range(2)]
+    manager.notify()
+    assert all(channel.changed.is_set() for channel in channels)
@@ -0,0 +1,110 @@
+import math
+
+import numpy as np
+import pytest
+
+from conftest import T0, measurement
+from stats import RollingStats, _Moments, _Window, parse_window
+
+
+def reference(times, values):
+    """(mean, sample variance, least-squares slope) computed directly."""
+    times, values = np.asarray(times), np.asarray(values)
+    slope = np.polyfit(times - times.mean(), values, 1)[0] if len(values) > 1 else None
+    return values.mean(), values.var(ddof=1) if len(values) > 1 else None, slope
+
+
+def test_moments_remove_undoes_add():
+    rng = np.random.default_rng(1)
+    times = T0 + np.cumsum(rng.uniform(0.5, 1.5, 400))
+    values = 8.0 + np.sin(np.arange(400) / 20) + rng.normal(0, 0.1, 400)
+    moments = _Moments()
+    for t, v in zip(times[:300], values[:300]):
+        moments.add(t, v)
+    # Slide the window: drop the oldest 200, add 100 more
+    for t, v in zip(times[:200], values[:200]):
+        moments.remove(t, v)
+    for t, v in zip(times[300:], values[300:]):
+        moments.add(t, v)
+    mean, variance, slope = reference(times[200:], values[200:])
+    assert moments.n == 200
+    assert moments.mean == pytest.approx(mean, rel=1e-9)
+    assert moments.m2 / (moments.n - 1) == pytest.approx(variance, rel=1e-6)
+    assert moments.co / moments.m2_t == pytest.approx(slope, rel=1e-6)
+
+
+def test_moments_remove_last_sample_resets():
+    moments = _Moments()
+    moments.add(T0, 3.0)
+    moments.remove(T0, 3.0)
+    assert (moments.n, moments.mean, moments.m2, moments.co) == (0, 0.0, 0.0, 0.0)
+
+
+def test_window_expiry_updates_min_and_max():
+    window = _Window(10, 1)
+    for i, value in enumerate([5.0, 9.0, 1.0, 4.0, float("nan"), 3.0]):
+        window.add((T0 + i * 3, value))
+    summary = window.summary(0)
+    assert (summary["count"], summary["min"], summary["max"]) == (5, 1.0, 9.0)
+    # Keeps samples newer than T0 + 5: 1.0 (T0 + 6), 4.0, NaN, 3.0
+    window.expire(T0 + 15)
+    summary = window.summary(0)
+    assert (summary["count"], summary["min"], summary["max"]) == (3, 1.0, 4.0)
+    assert summary["mean"] == pytest.approx(8.0 / 3)
+    window.expire(T0 + 100)
+    summary = window.summary(0)
+    assert summary == {"count": 0, "mean": None, "std": None, "min": None, "max": None, "rate_per_s": None}
+
+
+def test_rolling_stats_follow_store(store):
+    now = [T0 + 100]
+    stats = RollingStats(store, windows=(10, 60), clock=lambda: now[0])
+    store.listeners.append(stats.add)
+    store.append_many([measurement(T0 + i, do=float(i)) for i in range(101)])
+    summary = stats.get(10)["do"]
+    assert summary["count"] == 10
+    assert summary["mean"] == pytest.approx(95.5)
+    assert summary["rate_per_s"] == pytest.approx(1.0)
+    now[0] += 5
+    summary = stats.get(10)["do"]
+    assert summary["count"] == 5
+    assert summary["min"] == 96.0
+    assert stats.get(60, sensor=3)["do"]["count"] == 0
+
+
+def test_rolling_stats_per_sensor(store):
+    now = [T0 + 10]
+    stats = RollingStats(store, windows=(60,), clock=lambda: now[0])
+    store.listeners.append(stats.add)
+    store.append_many([measurement(T0 + i, sensor_id=i % 2, do=float(i % 2)) for i in range(10)])
+    assert stats.get(60)["do"]["count"] == 10
+    assert stats.get(60, sensor=1)["do"]["mean"] == 1.0
+    assert stats.get(60, sensor=0)["do"]["max"] == 0.0
+
+
+def test_rolling_stats_refill_does_not_double_count(store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    stats = RollingStats(store, windows=(60,), clock=lambda: T0 + 10)
+    store.listeners.append(stats.add)
+    # The first notification triggers a refill that already holds it
+    store.append_many([measurement(T0 + 10)])
+    assert stats.get(60)["do"]["count"] == 11
+
+
+@pytest.mark.parametrize("text, seconds", [("600", 600), ("90s", 90), ("10m", 600), ("1.5h", 5400), ("2d", 172800)])
+def test_parse_window(text, seconds):
+    assert parse_window(text) == seconds
+
+
+@pytest.mark.parametrize("text", ["", "abc", "10x", "0", "-5m"])
+def test_parse_window_rejects(text):
+    with pytest.raises(ValueError):
+        parse_window(text)
+
+
+def test_std_needs_two_samples():
+    window = _Window(60, 1)
+    window.add((T0, 2.0))
+    assert window.summary(0)["std"] is None
+    window.add((T0 + 1, 4.0))
+    assert window.summary(0)["std"] == pytest.approx(math.sqrt(2))
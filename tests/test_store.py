@@ -0,0 +1,135 @@
+import glob
+import os
+
+from conftest import T0, measurement, open_store
+from store import MeasurementStore
+
+
+def follower(log_dir):
+    """A store following logs another store writes, as the web process does
+    (follow() without its thread)."""
+    store = MeasurementStore(os.path.join(str(log_dir), "sensor_data.bin"))
+    store.read_only = store.segments.read_only = True
+    store.refresh()
+    return store
+
+
+def test_follower_picks_up_appended_records(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    reader = follower(tmp_path)
+    assert len(reader.window()) == 10
+    store.append_many([measurement(T0 + 10 + i) for i in range(3)])
+    assert reader.refresh() == 3
+    assert reader.refresh() == 0
+    assert reader.window(T0 + 9.5)["time"].tolist() == [T0 + 10, T0 + 11, T0 + 12]
+    reader.close()
+
+
+def test_follower_is_notified_of_rotated_tail(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(100)])
+    reader = follower(tmp_path)
+    notified = []
+    reader.listeners.append(lambda records: notified.append(records["time"].tolist()))
+
+    store.append_many([measurement(T0 + 100 + i) for i in range(5)])
+    store.rotate(str(tmp_path / "sensor_data_backup_1.bin"))
+    store.append_many([measurement(T0 + 200 + i) for i in range(5)])
+    reader.refresh()
+    reader.refresh()
+    assert notified == [[T0 + 100 + i for i in range(5)] + [T0 + 200 + i for i in range(5)]]
+    assert len(reader) == 110
+    reader.close()
+
+
+def test_follower_does_not_replay_history(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    reader = follower(tmp_path)
+    notified = []
+    reader.listeners.append(notified.append)
+    reader.refresh()
+    assert notified == []
+    store.append_many([measurement(T0 + 10)])
+    assert reader.refresh() == 1
+    assert len(notified) == 1
+    reader.close()
+
+
+def test_follower_sees_deleted_logs(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    reader = follower(tmp_path)
+    store.clear()
+    reader.refresh()
+    assert len(reader) == 0
+    assert len(reader.window()) == 0
+    reader.close()
+
+
+def test_follower_never_writes(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    with open(tmp_path / "sensor_data_backup_20010101_000000.csv", "w") as f:
+        f.write("".join(store.export_csv()))
+    os.remove(store.segments.catalog_path)
+    reader = follower(tmp_path)
+    assert reader.segments.scan() == 0
+    assert glob.glob(str(tmp_path / "sensor_data_backup_*.bin")) == []
+    assert not os.path.exists(reader.segments.catalog_path)
+    reader.close()
+
+
+def test_queries_for_one_sensor(store):
+    store.append_many([measurement(T0 + i, sensor_id=i % 2, do=float(i)) for i in range(20)])
+    assert store.sensor_ids() == [0, 1]
+    records = store.window(T0 + 9.5, sensor=1)
+    assert records["time"].tolist() == [T0 + i for i in range(11, 20, 2)]
+    assert store.count(sensor=1) == 10
+    assert store.count(sensor=5) == 0
+    rows = store.query(None, 100, sensor=0)
+    assert [row["sensor_id"] for row in rows] == [0] * 10
+    assert [row["do"] for row in rows] == [float(i) for i in range(0, 20, 2)]
+
+
+def rollup_snapshot(store):
+    # Compared as bytes: buckets without GPS fixes hold NaN
+    return {float(resolution): buckets.tobytes() for resolution, buckets in store.rollups.snapshot().items()}
+
+
+def test_rollups_restored_from_checkpoint(tmp_path, store):
+    store.append_many([measurement(T0 + i, do=float(i % 7)) for i in range(500)])
+    assert store.save_checkpoint()
+    store.append_many([measurement(T0 + 500 + i, do=1.0) for i in range(20)])
+    expected = rollup_snapshot(store)
+    store.close()
+
+    reopened = open_store(tmp_path)
+    assert rollup_snapshot(reopened) == expected
+    reopened.close()
+
+
+def test_unreadable_checkpoint_is_rebuilt(tmp_path, store):
+    store.append_many([measurement(T0 + i, do=float(i % 7)) for i in range(500)])
+    expected = rollup_snapshot(store)
+    store.close()
+    with open(store.checkpoint_path, "wb") as f:
+        f.write(b"not a checkpoint")
+
+    reopened = open_store(tmp_path)
+    assert rollup_snapshot(reopened) == expected
+    assert reopened.count() == 500
+    reopened.close()
+
+
+def test_checkpoint_not_saved_when_log_vanished(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    os.remove(store.log.path)
+    os.remove(store.checkpoint_path)
+    assert not store.save_checkpoint()
+    assert not os.path.exists(store.checkpoint_path)
+
+
+def test_follower_does_not_save_checkpoint(tmp_path, store):
+    store.append_many([measurement(T0 + i) for i in range(10)])
+    os.remove(store.checkpoint_path)
+    reader = follower(tmp_path)
+    assert not reader.save_checkpoint()
+    assert not os.path.exists(reader.checkpoint_path)
+    reader.close()
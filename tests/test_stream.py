@@ -0,0 +1,64 @@
+from stream import Broadcaster
+
+
+def test_subscriber_receives_events_published_after_it_joined():
+    broadcaster = Broadcaster(keepalive=0.01)
+    broadcaster.publish("measurement", {"do": 1.0})
+    subscription = broadcaster.subscribe()
+    events = iter(subscription)
+    assert next(events).startswith("retry:")
+    assert broadcaster.stats()["subscribers"] == 1
+
+    broadcaster.publish("measurement", {"do": 2.0})
+    broadcaster.publish("measurement", {"do": 3.0})
+    text = next(events)
+    assert text.count("event: measurement") == 2
+    assert '"do": 2.0' in text and '"do": 1.0' not in text
+    assert next(events) == ": keepalive\n\n"
+
+    subscription.close()
+    assert broadcaster.stats()["subscribers"] == 0
+
+
+def test_last_event_id_resumes_from_buffer():
+    broadcaster = Broadcaster(keepalive=0.01)
+    for i in range(5):
+        broadcaster.publish("measurement", {"n": i})
+    subscription = broadcaster.subscribe(last_event_id=3)
+    events = iter(subscription)
+    next(events)
+    text = next(events)
+    assert text.startswith("id: 4\n")
+    assert '"n": 4' in text and '"n": 2' not in text
+    subscription.close()
+
+
+def test_slow_subscriber_gets_reset():
+    broadcaster = Broadcaster(buffer_size=3, keepalive=0.01)
+    subscription = broadcaster.subscribe()
+    events = iter(subscription)
+    next(events)
+    for i in range(10):
+        broadcaster.publish("measurement", {"n": i})
+    assert next(events) == "id: 10\nevent: reset\ndata: {}\n\n"
+    assert broadcaster.stats()["resets"] == 1
+    # After the reset the cursor is current again
+    broadcaster.publish("measurement", {"n": 10})
+    assert next(events).startswith("id: 11\n")
+    subscription.close()
+
+
+def test_subscribers_beyond_cap_are_rejected():
+    broadcaster = Broadcaster(keepalive=0.01, max_subscribers=2)
+    first = broadcaster.subscribe()
+    second = broadcaster.subscribe()
+    assert broadcaster.subscribe() is None
+    assert broadcaster.stats()["rejected"] == 1
+    # A slot is freed when the server closes the response, even unread
+    first.close()
+    third = broadcaster.subscribe()
+    assert third is not None
+    assert next(iter(third)).startswith("retry:")
+    second.close()
+    third.close()
+    assert broadcaster.stats()["subscribers"] == 0
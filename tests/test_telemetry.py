@@ -0,0 +1,118 @@
+import time
+from datetime import datetime
+
+from mavlink import Mavlink2RestClient, TelemetryCache
+
+from test_mavlink import server, wait_for  # noqa: F401 (fixture)
+
+MESSAGES = '/v1/mavlink/vehicles/{}/components/1/messages/{}'
+
+
+class FakeClient:
+    """Stands in for Mavlink2RestClient, answering get_json() from a dict."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.requested = []
+
+    def get_json(self, path, missing=None):
+        self.requested.append(path)
+        return self.replies.get(path, missing)
+
+
+def test_tag_uses_fresh_telemetry_only():
+    cache = TelemetryCache(FakeClient({}), max_age=30.0)
+    now = time.monotonic()
+    cache._snapshot = {
+        'gps': {'lat': 59.5, 'lon': 10.25, 'received': now - 1.0},
+        'vehicle_temperature': {'value': 14.5, 'received': now - 60.0},
+    }
+    measurement = cache.tag({'do': 8.0})
+    assert measurement['latitude'] == 59.5
+    assert measurement['longitude'] == 10.25
+    assert 1.0 <= measurement['gps_age'] < 2.0
+    # Too old to tag with, but its age is still recorded
+    assert measurement['vehicle_temperature'] is None
+    assert measurement['vehicle_temperature_age'] >= 60.0
+
+
+def test_tag_without_telemetry():
+    measurement = TelemetryCache(FakeClient({})).tag({})
+    assert measurement == {
+        'latitude': None, 'longitude': None, 'gps_age': None,
+        'vehicle_temperature': None, 'vehicle_temperature_age': None,
+    }
+
+
+def test_poller_publishes_converted_snapshot():
+    client = FakeClient({
+        '/v1/mavlink/vehicles': [3],
+        MESSAGES.format(3, 'GLOBAL_POSITION_INT'): {'message': {'lat': 595000000, 'lon': 102500000}},
+        MESSAGES.format(3, 'SCALED_PRESSURE2'): {'message': {'temperature': 1450}},
+    })
+    cache = TelemetryCache(client, interval=0.01)
+    cache.start()
+    wait_for(lambda: cache.polls >= 2)
+    snapshot = cache.snapshot()
+    assert cache.system_id == 3
+    assert snapshot['gps']['lat'] == 59.5
+    assert snapshot['gps']['lon'] == 10.25
+    assert snapshot['vehicle_temperature']['value'] == 14.5
+    # The vehicle list is only re-read every vehicle_refresh seconds
+    assert client.requested.count('/v1/mavlink/vehicles') == 1
+    assert cache.poll_failures == 0
+
+
+def test_telemetry_is_aged_by_last_update():
+    stale = datetime.fromtimestamp(time.time() - 7200).isoformat()
+    client = FakeClient({
+        '/v1/mavlink/vehicles': [1],
+        MESSAGES.format(1, 'GLOBAL_POSITION_INT'): {
+            'message': {'lat': 595000000, 'lon': 102500000},
+            'status': {'time': {'last_update': stale}},
+        },
+        # Without last_update, the poll time is used
+        MESSAGES.format(1, 'SCALED_PRESSURE2'): {'message': {'temperature': 1450}},
+    })
+    cache = TelemetryCache(client, interval=0.01)
+    cache.start()
+    wait_for(lambda: cache.polls >= 1)
+    measurement = cache.tag({})
+    assert measurement['latitude'] is None
+    assert 7199.0 < measurement['gps_age'] < 7210.0
+    assert measurement['vehicle_temperature'] == 14.5
+    assert measurement['vehicle_temperature_age'] < 5.0
+
+
+def test_missing_message_is_not_a_poll_failure(server):
+    server.replies[MESSAGES.format(1, 'GLOBAL_POSITION_INT')] = (200, {'message': {'lat': 595000000, 'lon': 102500000}})
+    # SCALED_PRESSURE2 was never sent: Mavlink2Rest answers 404
+    client = Mavlink2RestClient(base_urls=[server.url])
+    client._active = server.url
+    cache = TelemetryCache(client, interval=0.01)
+    cache.start()
+    wait_for(lambda: cache.polls >= 5)
+    measurement = cache.tag({})
+    assert (measurement['latitude'], measurement['longitude']) == (59.5, 10.25)
+    assert measurement['vehicle_temperature'] is None
+    assert cache.poll_failures == 0
+    assert client.active_url == server.url
+    assert client.stats()["requests_failed"] == 0
+
+    # Neither message sent yet: still not a failure, and the fix is kept
+    del server.replies[MESSAGES.format(1, 'GLOBAL_POSITION_INT')]
+    polls = cache.polls
+    wait_for(lambda: cache.polls >= polls + 3)
+    assert cache.poll_failures == 0
+    assert cache.snapshot()['gps']['lat'] == 59.5
+    assert client.active_url == server.url
+
+
+def test_failed_poll_is_counted():
+    client = FakeClient({'/v1/mavlink/vehicles': [1]})
+    client.replies[MESSAGES.format(1, 'GLOBAL_POSITION_INT')] = None
+    client.replies[MESSAGES.format(1, 'SCALED_PRESSURE2')] = None
+    cache = TelemetryCache(client, interval=0.01)
+    cache.start()
+    wait_for(lambda: cache.polls >= 2)
+    assert cache.poll_failures >= 2